@@ -0,0 +1,120 @@
+"""
+analysis_loader.py
+
+Shared loader for normalized analysis files (analysis/*.analysis.yaml).
+
+- Parses with libyaml's CSafeLoader when PyYAML was built against it,
+  falling back to the pure-Python SafeLoader otherwise.
+- Spreads parsing across a process pool for large file lists; results are
+  always returned in input order.
+- Records per-file read/parse time and flags outliers, so slow or bloated
+  analyses stand out.
+
+Imported by the scripts in this directory; not intended to be run directly.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Sequence
+
+import yaml
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Below this many files the pool start-up costs more than it saves
+MIN_PARALLEL_FILES = 32
+
+# A file is reported as slow when it takes this many times the median
+SLOW_FACTOR = 5.0
+SLOW_FLOOR_SECONDS = 0.05
+
+
+class LoadedFile(NamedTuple):
+    path: Path
+    text: str
+    data: Any
+    seconds: float
+    error: Optional[str] = None
+
+
+def safe_load(text: str) -> Any:
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def find_analysis_files(directory: Path) -> List[Path]:
+    return sorted(directory.glob("*.analysis.yaml"))
+
+
+def _load_one(path: Path, parse: bool) -> LoadedFile:
+    start = time.perf_counter()
+    try:
+        text = path.read_text(encoding="utf-8")
+        data = safe_load(text) if parse else None
+    except Exception as exc:
+        return LoadedFile(path, "", None, time.perf_counter() - start, repr(exc))
+    return LoadedFile(path, text, data, time.perf_counter() - start)
+
+
+def load_analyses(
+    paths: Sequence[Path],
+    parse: bool = True,
+    workers: Optional[int] = None,
+) -> List[LoadedFile]:
+    """
+    Read (and optionally parse) files, in input order.
+
+    Parsing runs in a process pool; plain reads use threads. Exits with an
+    error on the first file that cannot be read or parsed.
+    """
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    parse_flags = [parse] * len(paths)
+
+    if workers == 1 or len(paths) < MIN_PARALLEL_FILES:
+        results = [_load_one(p, parse) for p in paths]
+    elif parse:
+        chunksize = max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_one, paths, parse_flags, chunksize=chunksize))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_one, paths, parse_flags))
+
+    for result in results:
+        if result.error:
+            logging.error(f"Failed to load YAML file {result.path}: {result.error}")
+            sys.exit(1)
+
+    log_timings(results)
+    return results
+
+
+def log_timings(results: Sequence[LoadedFile]) -> None:
+    """Log per-file timings at debug level and warn about outliers."""
+    if not results:
+        return
+    for r in results:
+        logging.debug(
+            f"Loaded {r.path.name} in {r.seconds * 1000:.1f} ms ({len(r.text) / 1024:.1f} KB)"
+        )
+    median = statistics.median(r.seconds for r in results)
+    limit = max(median * SLOW_FACTOR, SLOW_FLOOR_SECONDS)
+    for r in sorted(results, key=lambda r: r.seconds, reverse=True):
+        if r.seconds <= limit:
+            break
+        logging.warning(
+            f"Slow analysis file {r.path.name}: {r.seconds * 1000:.1f} ms "
+            f"({len(r.text) / 1024:.1f} KB, median {median * 1000:.1f} ms)"
+        )
+    total = sum(r.seconds for r in results)
+    logging.debug(
+        f"Loaded {len(results)} files ({total:.2f} s cumulative, "
+        f"{median * 1000:.1f} ms median)"
+    )
@@ -0,0 +1,338 @@
+"""
+analysis_schema.py
+
+Deep validation of normalized analyses (analysis/*.analysis.yaml) against
+the normalization schema (schema/system-prompt.v0.yaml).
+
+compile_schema() turns the schema text into a tree of checks, once per
+process (cached by text):
+
+- a mapping requires each of its keys and reports any other key
+- `string`, `boolean`, `integer` and `number` leaves check the type
+- `[string]` is a list of strings, a list of one mapping a list of such
+  mappings
+- a leaf whose comment lists single-word alternatives
+  (`# sandboxed | local | remote | none`) accepts only those values;
+  comments such as `# e.g., ...` or `# debug flag | proxy | logs | docs`
+  document a field rather than close it
+- any other scalar (the `schema` section's name, version and description)
+  is a constant, compared with whitespace folded
+- every leaf also accepts `unknown`, which the normalization prompt asks
+  for when a field cannot be determined
+
+validate() returns every issue with a machine-readable path such as
+`layers.tools.declared_tools[2].type`. Errors break the mapping skeleton
+that structural similarity is computed from: a document or schema mapping
+that is missing or not a mapping, a list that is something else. Warnings
+are leaf drift that scoring tolerates: a missing, null or mistyped leaf, a
+value outside its enum, an unknown key.
+
+validate_files() checks many files, in a process pool for large lists.
+
+json_schema() renders the same compiled tree as the strict JSON Schema
+that structured output (llm_structured.py) constrains responses to, so
+the two cannot drift apart.
+
+Imported by the scripts in this directory; not intended to be run directly.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import (Any, Dict, FrozenSet, List, NamedTuple, Optional, Sequence,
+                    Tuple)
+
+import yaml
+from analysis_loader import MIN_PARALLEL_FILES, safe_load
+
+ERROR = "error"
+WARNING = "warning"
+
+# A leaf's value when the prompt gives no way to determine it
+UNKNOWN = "unknown"
+
+LEAF_TYPES: Dict[str, Tuple[type, ...]] = {
+    "string": (str,),
+    "boolean": (bool,),
+    "integer": (int,),
+    "number": (int, float),
+}
+
+# `key: value  # comment`, optionally as the first key of a list item
+SCHEMA_LINE = re.compile(r"^(\s*)(- )?([\w-]+):[^#]*(?:#\s*(.*?))?\s*$")
+ENUM_COMMENT = re.compile(r"[a-z][\w-]*(?:\s*\|\s*[a-z][\w-]*)+")
+
+# Path segment standing for every item of a list
+ITEM = "[]"
+
+
+class Node(NamedTuple):
+    """One compiled schema node."""
+
+    kind: str  # mapping | list | leaf | constant
+    fields: Dict[str, "Node"]
+    item: Optional["Node"]
+    types: Tuple[type, ...]
+    values: FrozenSet[Any]  # allowed values; empty: any value of the type
+
+
+class Issue(NamedTuple):
+    path: str
+    code: str  # yaml | type | missing | null | enum | constant | unknown
+    message: str
+    severity: str  # error | warning
+
+
+class FileResult(NamedTuple):
+    path: Path
+    issues: List[Issue]
+
+
+def comment_enums(schema_text: str) -> Dict[Tuple[str, ...], FrozenSet[str]]:
+    """Enum comments of the schema, by key path (ITEM for list items)."""
+    enums: Dict[Tuple[str, ...], FrozenSet[str]] = {}
+    stack: List[Tuple[int, str]] = []
+    for line in schema_text.splitlines():
+        match = SCHEMA_LINE.match(line)
+        if not match:
+            continue
+        indent = len(match.group(1))
+        if match.group(2):
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            stack.append((indent, ITEM))
+            indent += 2
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = tuple(key for _, key in stack) + (match.group(3),)
+        stack.append((indent, match.group(3)))
+        comment = (match.group(4) or "").strip()
+        if ENUM_COMMENT.fullmatch(comment):
+            enums[path] = frozenset(v.strip() for v in comment.split("|"))
+    return enums
+
+
+def compile_node(
+    spec: Any, path: Tuple[str, ...], enums: Dict[Tuple[str, ...], FrozenSet[str]]
+) -> Node:
+    if isinstance(spec, dict):
+        fields = {
+            str(k): compile_node(v, path + (str(k),), enums) for k, v in spec.items()
+        }
+        return Node("mapping", fields, None, (), frozenset())
+    if isinstance(spec, list):
+        item = compile_node(spec[0] if spec else "string", path + (ITEM,), enums)
+        return Node("list", {}, item, (), frozenset())
+    if spec in LEAF_TYPES:
+        return Node("leaf", {}, None, LEAF_TYPES[spec], enums.get(path, frozenset()))
+    if spec is None:
+        return Node("leaf", {}, None, (str,), frozenset())
+    return Node("constant", {}, None, (), frozenset([fold(spec)]))
+
+
+@lru_cache(maxsize=8)
+def compile_schema(schema_text: str) -> Node:
+    """Compiled root of the schema; raises ValueError unless it is a mapping."""
+    try:
+        spec = yaml.safe_load(schema_text)
+    except yaml.YAMLError as exc:
+        raise ValueError(f"schema is not valid YAML: {exc}") from exc
+    if not isinstance(spec, dict):
+        raise ValueError("schema must be a mapping of sections")
+    return compile_node(spec, (), comment_enums(schema_text))
+
+
+def json_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    return "string"
+
+
+def json_schema(node: Node) -> Dict[str, Any]:
+    """
+    Strict JSON Schema of a compiled node: every property required, no
+    other property allowed, every leaf open to UNKNOWN. Enums are sorted,
+    so the schema (and so a request's cache key) is the same in every
+    process.
+    """
+    if node.kind == "mapping":
+        return {
+            "type": "object",
+            "properties": {k: json_schema(v) for k, v in node.fields.items()},
+            "required": list(node.fields),
+            "additionalProperties": False,
+        }
+    if node.kind == "list":
+        assert node.item is not None
+        return {"type": "array", "items": json_schema(node.item)}
+    if node.kind == "constant":
+        (value,) = node.values
+        return {"type": json_type(value), "enum": [value]}
+    if node.types == (str,):
+        if node.values:
+            return {"type": "string", "enum": sorted(node.values | {UNKNOWN})}
+        return {"type": "string"}
+    leaf_type = next(k for k, v in LEAF_TYPES.items() if v == node.types)
+    return {"anyOf": [{"type": leaf_type}, {"type": "string", "enum": [UNKNOWN]}]}
+
+
+# -------------------------
+# Validation
+# -------------------------
+
+
+def fold(value: Any) -> Any:
+    return " ".join(value.split()) if isinstance(value, str) else value
+
+
+def type_name(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, dict):
+        return "a mapping"
+    if isinstance(value, list):
+        return "a list"
+    return f"{type(value).__name__} {value!r:.60}"
+
+
+def child_path(path: str, key: str) -> str:
+    return f"{path}.{key}" if path else key
+
+
+def check(node: Node, value: Any, path: str, issues: List[Issue]) -> None:
+    kind = node.kind
+    if kind == "mapping":
+        if not isinstance(value, dict):
+            issues.append(
+                Issue(
+                    path, "type", f"expected a mapping, got {type_name(value)}", ERROR
+                )
+            )
+            return
+        for key, child in node.fields.items():
+            if key in value:
+                check(child, value[key], child_path(path, key), issues)
+            else:
+                severity = ERROR if child.kind == "mapping" else WARNING
+                issues.append(
+                    Issue(child_path(path, key), "missing", "missing field", severity)
+                )
+        for key in value:
+            if str(key) not in node.fields:
+                issues.append(
+                    Issue(
+                        child_path(path, str(key)), "unknown", "unknown field", WARNING
+                    )
+                )
+    elif kind == "list":
+        if value is None:
+            issues.append(Issue(path, "null", "null instead of a list", WARNING))
+        elif not isinstance(value, list):
+            issues.append(
+                Issue(path, "type", f"expected a list, got {type_name(value)}", ERROR)
+            )
+        else:
+            assert node.item is not None
+            for k, item in enumerate(value):
+                check(node.item, item, f"{path}[{k}]", issues)
+    elif kind == "leaf":
+        if value == UNKNOWN:
+            return
+        if value is None:
+            issues.append(Issue(path, "null", "null value", WARNING))
+        elif not isinstance(value, node.types) or (
+            isinstance(value, bool) and bool not in node.types
+        ):
+            expected = "/".join(t.__name__ for t in node.types)
+            issues.append(
+                Issue(
+                    path,
+                    "type",
+                    f"expected {expected}, got {type_name(value)}",
+                    WARNING,
+                )
+            )
+        elif node.values and value not in node.values:
+            issues.append(
+                Issue(
+                    path,
+                    "enum",
+                    f"{value!r:.60} is not one of "
+                    f"{', '.join(sorted(node.values | {UNKNOWN}))}",
+                    WARNING,
+                )
+            )
+    elif fold(value) not in node.values:
+        issues.append(
+            Issue(
+                path,
+                "constant",
+                f"expected the schema's {next(iter(node.values))!r:.60}",
+                WARNING,
+            )
+        )
+
+
+def validate(root: Node, data: Any) -> List[Issue]:
+    """Every issue of one parsed analysis, in document order."""
+    issues: List[Issue] = []
+    check(root, data, "", issues)
+    return issues
+
+
+def validate_text(root: Node, text: str) -> List[Issue]:
+    try:
+        data = safe_load(text)
+    except yaml.YAMLError as exc:
+        return [Issue("", "yaml", f"not valid YAML: {exc}", ERROR)]
+    return validate(root, data)
+
+
+# -------------------------
+# Bulk validation
+# -------------------------
+
+_worker_root: Optional[Node] = None
+
+
+def _init_worker(schema_text: str) -> None:
+    global _worker_root
+    _worker_root = compile_schema(schema_text)
+
+
+def _validate_file(path: Path, root: Optional[Node] = None) -> FileResult:
+    root = root or _worker_root
+    assert root is not None
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError as exc:
+        return FileResult(path, [Issue("", "yaml", f"unreadable: {exc}", ERROR)])
+    return FileResult(path, validate_text(root, text))
+
+
+def validate_files(
+    paths: Sequence[Path], schema_text: str, workers: Optional[int] = None
+) -> List[FileResult]:
+    """
+    Validate files against the schema, in input order. Large lists are
+    spread over a process pool; each worker compiles the schema once.
+    Raises ValueError if the schema itself is invalid.
+    """
+    root = compile_schema(schema_text)
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < MIN_PARALLEL_FILES:
+        return [_validate_file(p, root) for p in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(schema_text,)
+    ) as pool:
+        return list(pool.map(_validate_file, paths, chunksize=chunksize))
@@ -10,14 +10,25 @@ band-report-from-csv.py
 Generate a band report from a similarities CSV by sweeping thresholds and
 recording connected components.
 
+The sweep sorts edges by score once and merges them into a union-find as
+the threshold decreases, so fine steps (e.g. --step 0.001) on large
+corpora cost little more than the default.
+
 Expected CSV columns:
   - file_a
   - file_b
   - weighted_score
 
+A binary .simmat companion written by prompt-similarity.py --matrix is also
+accepted and is memory-mapped instead of parsed. So is a dendrogram written
+by dendrogram-from-csv.py: its merges alone determine every component, so
+the sweep replays at most N − 1 merges instead of the full edge list.
+
 Usage:
   uv run --locked band-report-from-csv.py similarities.csv
   uv run --locked band-report-from-csv.py similarities.csv --step 0.01 --csv band-report.csv
+  uv run --locked band-report-from-csv.py similarities.simmat --csv-out band-report.csv
+  uv run --locked band-report-from-csv.py dendrogram.json --step 0.001
 """
 
 from __future__ import annotations
@@ -27,45 +38,45 @@ import csv
 import logging
 import sys
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Iterable, Iterator, List, Tuple
 
 import numpy as np
+from dendrogram import is_dendrogram_file, load_dendrogram
+from similarity_graph import DisjointSet
+from similarity_matrix import read_edges
 
 # -------------------------
 # Graph utilities
 # -------------------------
 
 
-def build_components(
-    files: Set[str],
-    edges: Dict[Tuple[str, str], float],
-    threshold: float,
-) -> List[Set[str]]:
-    graph: Dict[str, Set[str]] = {f: set() for f in files}
-
-    for (a, b), score in edges.items():
-        if score >= threshold:
-            graph[a].add(b)
-            graph[b].add(a)
-
-    visited: Set[str] = set()
-    components: List[Set[str]] = []
-
-    for node in graph:
-        if node in visited:
-            continue
-        stack = [node]
-        comp = set()
-        while stack:
-            cur = stack.pop()
-            if cur in visited:
-                continue
-            visited.add(cur)
-            comp.add(cur)
-            stack.extend(graph[cur] - visited)
-        components.append(comp)
-
-    return components
+def sweep_components(
+    n: int,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    scores: np.ndarray,
+    thresholds: Iterable[float],
+) -> Iterator[Tuple[float, int, List[int]]]:
+    """
+    For descending thresholds, yield (threshold, component count, sizes)
+    of the graph keeping edges with score >= threshold.
+
+    Edges are sorted by descending score once and merged into a single
+    union-find as the threshold drops, so the whole sweep costs
+    O(E log E + T·C) instead of one graph traversal per threshold.
+    """
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order].tolist()
+    sorted_rows = rows[order].tolist()
+    sorted_cols = cols[order].tolist()
+
+    dsu = DisjointSet(n)
+    k = 0
+    for t in thresholds:
+        while k < len(sorted_scores) and sorted_scores[k] >= t:
+            dsu.union(sorted_rows[k], sorted_cols[k])
+            k += 1
+        yield t, dsu.components, dsu.sizes()
 
 
 # -------------------------
@@ -77,7 +88,9 @@ def main() -> None:
     parser = argparse.ArgumentParser(
         description="Produce a band report (threshold → components) from similarities CSV"
     )
-    parser.add_argument("csv", help="similarities.csv input file")
+    parser.add_argument(
+        "csv", help="similarities.csv (or .simmat / dendrogram.json) input file"
+    )
     parser.add_argument(
         "--step",
         type=float,
@@ -107,52 +120,52 @@ def main() -> None:
     )
 
     csv_path = Path(args.csv)
-    if not csv_path.exists():
-        sys.exit(f"CSV file not found: {csv_path}")
 
+    # Upstream dry runs write nothing, so the input need not exist yet
     if args.dry_run:
         print(f"Dry run: Would process {csv_path} with step {args.step}")
         if args.csv_out:
             print(f"Dry run: Would write output to {args.csv_out}")
         return
 
-    edges: Dict[Tuple[str, str], float] = {}
-    files: Set[str] = set()
-    scores: List[float] = []
-
-    with csv_path.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        required = {"file_a", "file_b", "weighted_score"}
-        if not required.issubset(reader.fieldnames or []):
-            sys.exit(f"CSV must contain columns: {', '.join(required)}")
-
-        for row in reader:
-            a = row["file_a"]
-            b = row["file_b"]
-            s = float(row["weighted_score"])
-            files.update([a, b])
-            edges[(a, b)] = s
-            scores.append(s)
-
-    lo, hi = min(scores), max(scores)
+    if not csv_path.exists():
+        sys.exit(f"CSV file not found: {csv_path}")
+
+    if is_dendrogram_file(csv_path):
+        dendrogram = load_dendrogram(csv_path)
+        if not dendrogram.edge_count:
+            sys.exit(f"No similarity rows in {csv_path}")
+        files = dendrogram.docs
+        rows, cols, scores = dendrogram.edges()
+        lo, hi = dendrogram.score_min, dendrogram.score_max
+    else:
+        files, rows, cols, scores = read_edges(csv_path)
+        if not len(scores):
+            sys.exit(f"No similarity rows in {csv_path}")
+        lo, hi = float(scores.min()), float(scores.max())
+
     thresholds = np.arange(round(lo, 2), round(hi + args.step, 2), args.step)
 
+    # Report thresholds at two decimals, or more when the step is finer
+    decimals = max(2, -int(np.floor(np.log10(args.step))))
+
     report_rows: List[dict] = []
 
     print("\nBand report (threshold → components):\n")
-    for t in thresholds[::-1]:  # high → low
-        comps = build_components(files, edges, float(t))
-        sizes = sorted((len(c) for c in comps), reverse=True)
+    sweep = sweep_components(
+        len(files), rows, cols, scores, (float(t) for t in thresholds[::-1])
+    )  # high → low
+    for t, count, sizes in sweep:
         row = {
-            "threshold": round(float(t), 2),
-            "components": len(comps),
+            "threshold": round(t, decimals),
+            "components": count,
             "largest_component": sizes[0] if sizes else 0,
             "component_sizes": " ".join(map(str, sizes)),
         }
         report_rows.append(row)
 
         print(
-            f"t≥{row['threshold']:.2f} | "
+            f"t≥{row['threshold']:.{decimals}f} | "
             f"components={row['components']} | "
             f"largest={row['largest_component']} | "
             f"sizes=[{row['component_sizes']}]"
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["numpy"]
+# ///
+"""
+dendrogram-from-csv.py
+
+Build a single-linkage dendrogram (merge tree) from a similarities CSV and
+save it, or query a saved one.
+
+Components at any threshold, and the thresholds where they change, follow
+from the N − 1 recorded merges, so downstream stages (band report,
+clustering) can load the dendrogram instead of re-sweeping the edge list.
+The largest-gap threshold prompt-clustering-from-csv.py picks by default
+is computed over all edge scores when the dendrogram is built and stored
+with it, so clustering the dendrogram or its edges cuts at the same score.
+
+Input may be a similarities CSV, a .simmat companion, or a previously
+saved dendrogram (queries only).
+
+Usage:
+  uv run --locked dendrogram-from-csv.py similarities.simmat --output dendrogram.json
+  uv run --locked dendrogram-from-csv.py dendrogram.json --changes
+  uv run --locked dendrogram-from-csv.py dendrogram.json --at 0.65
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from dendrogram import (build_dendrogram, is_dendrogram_file, load_dendrogram,
+                        save_dendrogram)
+from similarity_matrix import read_edges
+
+# -------------------------
+# Main
+# -------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build or query a single-linkage dendrogram of prompt similarities"
+    )
+    parser.add_argument(
+        "csv", help="similarities.csv (or .simmat / dendrogram.json) input file"
+    )
+    parser.add_argument(
+        "--output",
+        help="Write the dendrogram to this path (e.g. dendrogram.json)",
+    )
+    parser.add_argument(
+        "--at",
+        type=float,
+        help="Print the clusters at this similarity threshold",
+    )
+    parser.add_argument(
+        "--changes",
+        action="store_true",
+        help="Print every threshold where the component structure changes",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print what would be done and exit",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    csv_path = Path(args.csv)
+
+    # Upstream dry runs write nothing, so the input need not exist yet
+    if args.dry_run:
+        print(f"Dry run: Would process {csv_path}")
+        if args.output:
+            print(f"Dry run: Would write dendrogram to {args.output}")
+        return
+
+    if not csv_path.exists():
+        sys.exit(f"CSV file not found: {csv_path}")
+
+    if is_dendrogram_file(csv_path):
+        dendrogram = load_dendrogram(csv_path)
+    else:
+        docs, rows, cols, scores = read_edges(csv_path)
+        dendrogram = build_dendrogram(docs, rows, cols, scores)
+    logging.info(
+        f"Dendrogram: {dendrogram.n} documents, {len(dendrogram.merges)} merges "
+        f"from {dendrogram.edge_count} edges; auto threshold "
+        f"{dendrogram.auto_threshold}"
+    )
+
+    if args.output:
+        out_path = Path(args.output)
+        save_dendrogram(dendrogram, out_path)
+        logging.info(f"Dendrogram written to {out_path}")
+
+    if args.changes:
+        print("\nChange points (threshold → components):\n")
+        for score, components, largest in dendrogram.change_points():
+            print(f"t≥{score:.4f} | components={components} | largest={largest}")
+
+    if args.at is not None:
+        print(f"\nClusters (threshold ≥ {args.at}):\n")
+        for cid, members in dendrogram.clusters_at(args.at).items():
+            print(f"Cluster {cid} ({len(members)} files):")
+            for m in sorted(members):
+                print(f"  - {m}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+dendrogram.py
+
+Single-linkage merge tree over the prompt similarity graph.
+
+Connected components of the graph "edges with score ≥ t" are exactly the
+single-linkage clusters cut at height t, so recording every union-find
+merge (in descending score order) once answers any threshold query
+without touching the edge list again:
+
+  - clusters_at(t)   → component labels at t (O(N) over ≤ N − 1 merges)
+  - change_points()  → every score where the component structure changes
+  - edges()          → the merges as a minimal edge list, which the band
+                       report sweeps instead of the full similarity graph
+
+Merges use the scipy linkage convention: leaves are 0..N−1 and merge k
+creates cluster N + k. The file is JSON:
+
+  {"format": "single-linkage-dendrogram", "version": 2,
+   "docs": [...], "score_min": ..., "score_max": ..., "edge_count": ...,
+   "auto_threshold": ..., "columns": ["a", "b", "score", "size"],
+   "merges": [[a, b, score, size], ...]}
+
+score_min / score_max span all similarity edges (not just merges) so
+threshold sweeps cover the same range as the CSV they were built from.
+For the same reason auto_threshold is the largest-gap cut over all edge
+scores, computed at build time: the merge scores alone have other gaps.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from similarity_graph import DisjointSet, auto_threshold
+
+FORMAT = "single-linkage-dendrogram"
+VERSION = 2
+
+
+class Dendrogram:
+    def __init__(
+        self,
+        docs: List[str],
+        merges: List[Tuple[int, int, float, int]],
+        score_min: float,
+        score_max: float,
+        edge_count: int,
+        auto_threshold: float,
+    ) -> None:
+        self.docs = docs
+        self.merges = merges
+        self.score_min = score_min
+        self.score_max = score_max
+        self.edge_count = edge_count
+        self.auto_threshold = auto_threshold
+
+        # Any leaf of each cluster, so merges can be replayed on leaves
+        n = len(docs)
+        self.representative = list(range(n))
+        for a, b, _, _ in merges:
+            self.representative.append(self.representative[a])
+
+    @property
+    def n(self) -> int:
+        return len(self.docs)
+
+    def edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(rows, cols, scores) of one leaf-to-leaf edge per merge."""
+        rep = self.representative
+        rows = np.array([rep[a] for a, _, _, _ in self.merges], dtype=np.int64)
+        cols = np.array([rep[b] for _, b, _, _ in self.merges], dtype=np.int64)
+        scores = np.array([s for _, _, s, _ in self.merges], dtype=np.float64)
+        return rows, cols, scores
+
+    def components_at(self, threshold: float) -> DisjointSet:
+        dsu = DisjointSet(self.n)
+        rep = self.representative
+        for a, b, score, _ in self.merges:
+            if score < threshold:
+                break
+            dsu.union(rep[a], rep[b])
+        return dsu
+
+    def clusters_at(self, threshold: float) -> Dict[int, List[str]]:
+        """Clusters at score ≥ threshold, numbered by first member in doc order."""
+        clusters: Dict[int, List[str]] = {}
+        for doc, label in zip(self.docs, self.components_at(threshold).labels()):
+            clusters.setdefault(label, []).append(doc)
+        return clusters
+
+    def change_points(self) -> List[Tuple[float, int, int]]:
+        """
+        (score, components, largest) after all merges at each distinct score,
+        from the highest score down.
+        """
+        out: List[Tuple[float, int, int]] = []
+        components = self.n
+        largest = 1 if self.n else 0
+        for k, (_, _, score, size) in enumerate(self.merges):
+            components -= 1
+            largest = max(largest, size)
+            if k + 1 == len(self.merges) or self.merges[k + 1][2] != score:
+                out.append((score, components, largest))
+        return out
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "format": FORMAT,
+            "version": VERSION,
+            "docs": self.docs,
+            "score_min": self.score_min,
+            "score_max": self.score_max,
+            "edge_count": self.edge_count,
+            "auto_threshold": self.auto_threshold,
+            "columns": ["a", "b", "score", "size"],
+            "merges": [list(m) for m in self.merges],
+        }
+
+
+def build_dendrogram(
+    docs: List[str], rows: np.ndarray, cols: np.ndarray, scores: np.ndarray
+) -> Dendrogram:
+    """Record every single-linkage merge, highest score first."""
+    n = len(docs)
+    order = np.argsort(-scores, kind="stable")
+    dsu = DisjointSet(n)
+    cluster_of_root = list(range(n))
+    merges: List[Tuple[int, int, float, int]] = []
+
+    for a, b, score in zip(
+        rows[order].tolist(), cols[order].tolist(), scores[order].tolist()
+    ):
+        ca, cb = cluster_of_root[dsu.find(a)], cluster_of_root[dsu.find(b)]
+        root = dsu.union(a, b)
+        if root < 0:
+            continue
+        merges.append((ca, cb, score, dsu.size[root]))
+        cluster_of_root[root] = n + len(merges) - 1
+        if len(merges) == n - 1:
+            break
+
+    return Dendrogram(
+        docs,
+        merges,
+        float(scores.min()) if len(scores) else 0.0,
+        float(scores.max()) if len(scores) else 0.0,
+        int(len(scores)),
+        auto_threshold(scores.tolist()),
+    )
+
+
+def is_dendrogram_file(path: Path) -> bool:
+    with path.open("rb") as f:
+        head = f.read(64)
+    return head.startswith(b'{"format": "' + FORMAT.encode("utf-8"))
+
+
+def save_dendrogram(dendrogram: Dendrogram, path: Path) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(dendrogram.to_json()), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def load_dendrogram(path: Path) -> Dendrogram:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("format") != FORMAT or data.get("version") != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} dendrogram file")
+    return Dendrogram(
+        data["docs"],
+        [(int(a), int(b), float(s), int(z)) for a, b, s, z in data["merges"]],
+        data["score_min"],
+        data["score_max"],
+        data["edge_count"],
+        data["auto_threshold"],
+    )
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["numpy", "PyYAML", "scikit-learn", "scipy"]
+# ///
+"""
+family-representatives-from-csv.py
+
+Build persisted family representatives (centroids in schema-path,
+forbidden-action and TF-IDF space, see family_centroids.py) from
+prompt-families.csv and the normalized analyses it was derived from.
+
+prompt-family-assign.py scores new analyses against these representatives
+only, so a new capture can be placed in a family without rerunning
+similarity, band report, clustering and family analysis.
+
+Expected CSV columns:
+  - family_id
+  - family_label
+  - threshold_used
+  - members (";"-separated analysis file names)
+
+Usage:
+  uv run --locked family-representatives-from-csv.py prompt-families.csv \
+    analysis/*.analysis.yaml --output family-representatives.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+from analysis_loader import load_analyses
+from family_centroids import build_representatives
+from similarity_cache import FeatureStore, file_digest, write_json_atomic
+from similarity_core import document_features
+
+
+def read_families(path: Path) -> List[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        required = {"family_id", "family_label", "threshold_used", "members"}
+        if not required.issubset(reader.fieldnames or []):
+            sys.exit(f"CSV must contain columns: {', '.join(sorted(required))}")
+        return [
+            {
+                "family_id": row["family_id"],
+                "family_label": row["family_label"],
+                "threshold": float(row["threshold_used"]),
+                "members": [m.strip() for m in row["members"].split(";") if m.strip()],
+            }
+            for row in reader
+        ]
+
+
+def load_features(
+    paths: List[Path], store: FeatureStore | None
+) -> List[Dict[str, Any]]:
+    """Per-document features, reusing the similarity feature cache if given."""
+    digests = [file_digest(p) for p in paths] if store else [""] * len(paths)
+    features = [store.get(d) if store else None for d in digests]
+    missing = [k for k, f in enumerate(features) if f is None]
+    if missing:
+        loaded = load_analyses([paths[k] for k in missing])
+        for k, result in zip(missing, loaded):
+            features[k] = document_features(result.data)
+            if store:
+                store.put(digests[k], features[k])
+    return features
+
+
+# -------------------------
+# Main
+# -------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build prompt-family representatives for online assignment"
+    )
+    parser.add_argument("families", help="prompt-families.csv input file")
+    parser.add_argument(
+        "files", nargs="+", type=Path, help="Normalized analysis YAML files"
+    )
+    parser.add_argument(
+        "--output",
+        default="family-representatives.json",
+        help="Output path (default: family-representatives.json)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        help="Similarity feature cache directory to reuse (see prompt-similarity.py)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print what would be done and exit",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    families_path = Path(args.families)
+    if not families_path.exists():
+        sys.exit(f"CSV file not found: {families_path}")
+
+    if args.dry_run:
+        print(
+            f"Dry run: Would build representatives for {families_path} "
+            f"from {len(args.files)} analysis files"
+        )
+        print(f"Dry run: Would write output to {args.output}")
+        return
+
+    families = read_families(families_path)
+    names = [p.name for p in args.files]
+    known = set(names)
+    for family in families:
+        missing = [m for m in family["members"] if m not in known]
+        for m in missing:
+            logging.warning(f"Family {family['family_id']}: no analysis file for {m}")
+        family["members"] = [m for m in family["members"] if m in known]
+    families = [f for f in families if f["members"]]
+
+    store = FeatureStore(args.cache) if args.cache else None
+    features = load_features(args.files, store)
+    representatives = build_representatives(families, names, features)
+
+    out_path = Path(args.output)
+    write_json_atomic(out_path, representatives)
+    logging.info(
+        f"Representatives for {len(families)} families "
+        f"({len(representatives['vocabulary'])} terms) written to {out_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
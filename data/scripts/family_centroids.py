@@ -0,0 +1,201 @@
+"""
+family_centroids.py
+
+Persisted prompt-family representatives for online assignment.
+
+Each family (a row of prompt-families.csv) is summarized by centroids in
+the same three spaces prompt-similarity.py scores:
+
+  paths       frequency of each schema path among members (0..1)
+  forbidden   frequency of each forbidden action among members (0..1)
+  tokens      mean of the members' L2-normalized TF-IDF vectors
+
+A new analysis is scored against a centroid with the weighted formula
+used for pairs: generalized Jaccard (Σ min / Σ max) for paths and
+forbidden actions, cosine for tokens. For a one-member family this equals
+the pairwise weighted_score. The TF-IDF vocabulary and IDF weights of the
+corpus the families were built from are stored alongside, so new
+documents are vectorized identically.
+
+A family's pairwise threshold_used is on a different scale from centroid
+scores once it has several members: averaging members pulls the centroid
+towards each of them. Such a family accepts a document scoring at least
+its least central member's centroid score (min_member_score) less
+CENTROID_MARGIN; a one-member family keeps its pairwise threshold.
+
+File format (JSON): {"version", "vocabulary", "idf", "families": [...]}.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+from similarity_core import WEIGHTS, fit_idf, tfidf_matrix
+from sklearn.preprocessing import normalize
+
+REPRESENTATIVES_VERSION = 1
+
+NOVEL = "novel"
+
+# Slack below the least central member's score to the family centroid
+CENTROID_MARGIN = 0.05
+
+
+class FamilyScore(NamedTuple):
+    family_id: str
+    family_label: str
+    threshold: float  # the family's cutoff on the centroid scale
+    struct_similarity: float
+    token_similarity: float
+    forbidden_similarity: float
+    weighted_score: float
+
+
+def frequencies(sets: Sequence[Iterable[str]]) -> Dict[str, float]:
+    counts: Dict[str, int] = {}
+    for items in sets:
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+    return {item: count / len(sets) for item, count in sorted(counts.items())}
+
+
+def generalized_jaccard(items: Iterable[str], weights: Dict[str, float]) -> float:
+    """
+    Σ min / Σ max between a set's indicator vector and a frequency vector.
+    Matches jaccard(): two empty inputs score 1.0, one empty input 0.0.
+    """
+    items = set(items)
+    if not items and not weights:
+        return 1.0
+    if not items or not weights:
+        return 0.0
+    shared = sum(weights.get(item, 0.0) for item in items)
+    return shared / (len(items) + sum(weights.values()) - shared)
+
+
+def build_representatives(
+    families: List[Dict[str, Any]],
+    names: List[str],
+    features: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Summarize each family from its members' similarity features.
+
+    families: prompt-families.csv rows with members split into a list.
+    names / features: every analysis in the corpus (IDF is fit over all).
+    """
+    vocabulary, idf = fit_idf([f["terms"] for f in features])
+    vectors = tfidf_matrix([f["terms"] for f in features], vocabulary, idf)
+    position = {name: k for k, name in enumerate(names)}
+
+    out: List[Dict[str, Any]] = []
+    for family in families:
+        rows = [position[m] for m in family["members"]]
+        centroid = sparse.csr_matrix(vectors[rows].mean(axis=0))
+        record = {
+            "family_id": family["family_id"],
+            "family_label": family["family_label"],
+            "threshold": family["threshold"],
+            "members": family["members"],
+            "paths": frequencies([features[r]["paths"] for r in rows]),
+            "forbidden": frequencies([features[r]["forbidden"] for r in rows]),
+            "token_indices": centroid.indices.tolist(),
+            "token_weights": centroid.data.tolist(),
+        }
+        out.append(record)
+
+    representatives = Representatives(
+        {
+            "version": REPRESENTATIVES_VERSION,
+            "vocabulary": sorted(vocabulary, key=vocabulary.__getitem__),
+            "idf": idf.tolist(),
+            "families": out,
+        }
+    )
+    # Record how far members themselves sit from their centroid
+    for k, family in enumerate(out):
+        family["min_member_score"] = round(
+            min(
+                representatives.score(features[position[m]])[k].weighted_score
+                for m in family["members"]
+            ),
+            4,
+        )
+    return representatives.data
+
+
+class Representatives:
+    def __init__(self, data: Dict[str, Any]) -> None:
+        if data.get("version") != REPRESENTATIVES_VERSION:
+            raise ValueError(
+                f"Expected family representatives version {REPRESENTATIVES_VERSION}"
+            )
+        self.data = data
+        self.families: List[Dict[str, Any]] = data["families"]
+        self.vocabulary = {term: col for col, term in enumerate(data["vocabulary"])}
+        self.idf = np.asarray(data["idf"], dtype=np.float64)
+
+        indptr = [0]
+        indices: List[int] = []
+        weights: List[float] = []
+        for family in self.families:
+            indices.extend(family["token_indices"])
+            weights.extend(family["token_weights"])
+            indptr.append(len(indices))
+        self.centroids = normalize(
+            sparse.csr_matrix(
+                (weights, indices, indptr),
+                shape=(len(self.families), len(self.vocabulary)),
+            ),
+            norm="l2",
+        )
+
+    def cutoff(self, family: Dict[str, Any]) -> float:
+        """Centroid score a document needs to join the family."""
+        if len(family["members"]) == 1 or "min_member_score" not in family:
+            return family["threshold"]
+        return round(family["min_member_score"] - CENTROID_MARGIN, 4)
+
+    def score(self, features: Dict[str, Any]) -> List[FamilyScore]:
+        """Weighted similarity of one document to every family, in file order."""
+        vector = tfidf_matrix([features["terms"]], self.vocabulary, self.idf)
+        token = (self.centroids @ vector.T).toarray().ravel()
+        scores: List[FamilyScore] = []
+        for family, token_sim in zip(self.families, token.tolist()):
+            struct_sim = generalized_jaccard(features["paths"], family["paths"])
+            forbid_sim = generalized_jaccard(features["forbidden"], family["forbidden"])
+            weighted = (
+                WEIGHTS["structure"] * struct_sim
+                + WEIGHTS["forbidden"] * forbid_sim
+                + WEIGHTS["token"] * token_sim
+            )
+            scores.append(
+                FamilyScore(
+                    family["family_id"],
+                    family["family_label"],
+                    self.cutoff(family),
+                    round(struct_sim, 4),
+                    round(token_sim, 4),
+                    round(forbid_sim, 4),
+                    round(weighted, 4),
+                )
+            )
+        return scores
+
+    def assign(
+        self, features: Dict[str, Any], threshold: Optional[float] = None
+    ) -> tuple[str, Optional[FamilyScore]]:
+        """
+        Return (family_id, best score), or (NOVEL, best score) when the best
+        family scores below its cutoff (or the override threshold).
+        """
+        scores = self.score(features)
+        if not scores:
+            return NOVEL, None
+        best = max(scores, key=lambda s: s.weighted_score)
+        cutoff = best.threshold if threshold is None else threshold
+        if best.weighted_score >= cutoff:
+            return best.family_id, best
+        return NOVEL, best
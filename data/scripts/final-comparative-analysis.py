@@ -2,13 +2,31 @@
 #
 # /// script
 # requires-python = ">=3.12"
-# dependencies = ["openai"]
+# dependencies = ["openai", "PyYAML"]
 # ///
 """
 final-comparative-analysis.py
 
 Generate the final comparative analysis report from a curated evidence bundle.
 
+When the whole bundle fits in --token-budget (estimated locally, see
+token_budget.py) it is sent as one request. Otherwise (or with
+--mode map-reduce) the report is built hierarchically:
+
+- map: the analyses are grouped per assistant or per prompt family
+  (--group-by), each group with the similarity rows between its own files,
+  and every group (split further if it alone exceeds the budget) is
+  condensed into evidence notes with --map-prompt, --concurrency calls at
+  a time
+- merge: while the notes are too large for the final request, consecutive
+  notes are merged the same way, level by level
+- reduce: the final prompt gets the notes in place of the analyses, with
+  the other artifacts; the similarities CSV is cut to its highest
+  weighted_score rows if it does not fit beside them
+
+Every call goes through the response cache, which is keyed by the request
+content, so notes for unchanged groups are not regenerated on a rerun.
+
 Usage:
   uv run --locked scripts/final-comparative-analysis.py \
     --prompt prompts/final-comparative-analysis.prompt.md \
@@ -21,96 +39,83 @@ Usage:
     --goal goal.md \
     --model gpt-5.2 \
     --output final-report.md
+
+  ... --mode map-reduce --map-prompt prompts/final-comparative-map.prompt.md \
+    --group-by family --token-budget 60000
 """
 
 import argparse
+import asyncio
+import csv
+import io
 import logging
 import sys
+from collections import defaultdict
 from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Sequence, Set, Tuple
 
-import openai
+from analysis_loader import LoadedFile, find_analysis_files, load_analyses
+from llm_runtime import (ModelRuntime, add_model_arguments, fenced, read_text,
+                         setup_logging)
+from openai.types.chat import ChatCompletionMessageParam
+from token_budget import estimate_messages, estimate_tokens, pack
 
+DEFAULT_TOKEN_BUDGET = 100_000
+DEFAULT_CONCURRENCY = 8
+
+# Share of the budget kept for similarity rows when the notes must shrink
+SIMILARITY_SHARE = 0.1
 
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
 
+class Evidence(NamedTuple):
+    goal: str
+    methodology: str
+    similarities: str
+    bands: str
+    families: str
+    family_report: str
 
-def read_analysis_dir(path: Path) -> str:
+
+class MapUnit(NamedTuple):
+    label: str
+    files: List[LoadedFile]
+
+
+def read_analysis_dir(path: Path) -> List[LoadedFile]:
     if not path.exists() or not path.is_dir():
         sys.exit(f"Analysis directory not found: {path}")
 
-    files = sorted(path.glob("*.analysis.yaml"))
+    files = find_analysis_files(path)
     if not files:
         sys.exit(f"No .analysis.yaml files found in {path}")
 
-    blocks = []
-    for f in files:
-        blocks.append(f"### {f.name}\n\n```yaml\n{read_text(f)}\n```")
-    return "\n\n".join(blocks)
+    return load_analyses(files, parse=False)
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description="Generate final comparative analysis report for system prompt governance"
-    )
-    parser.add_argument(
-        "--prompt", required=True, help="Final analysis prompt (Markdown)"
-    )
-    parser.add_argument(
-        "--analysis-dir", required=True, help="Directory with *.analysis.yaml files"
-    )
-    parser.add_argument("--similarities", required=True, help="similarities.csv")
-    parser.add_argument("--bands", required=True, help="band-report.csv")
-    parser.add_argument("--families", required=True, help="prompt-families.csv")
-    parser.add_argument(
-        "--family-report", required=True, help="prompt-families-report.md"
-    )
-    parser.add_argument("--methodology", required=True, help="methodology.md")
-    parser.add_argument("--goal", required=True, help="goal.md")
-    parser.add_argument(
-        "--model",
-        default="gpt-5.2",
-        help="Model name (default: gpt-5.2)",
-    )
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
-    )
-    parser.add_argument(
-        "--output",
-        help="Output report file (prints to stdout if omitted)",
-    )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print request payload and exit without calling the API",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
-    args = parser.parse_args()
+def analysis_block(files: List[LoadedFile]) -> str:
+    return "\n\n".join(f"### {f.path.name}\n\n```yaml\n{f.text}\n```" for f in files)
 
-    logging.basicConfig(
-        level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
 
-    prompt_text = read_text(Path(args.prompt))
-    analysis_block = read_analysis_dir(Path(args.analysis_dir))
-    similarities_csv = read_text(Path(args.similarities))
-    bands_csv = read_text(Path(args.bands))
-    families_csv = read_text(Path(args.families))
-    family_report = read_text(Path(args.family_report))
-    methodology_md = read_text(Path(args.methodology))
-    goal_md = read_text(Path(args.goal))
-
-    messages = [
+def completion_request(
+    args: argparse.Namespace, messages: List[ChatCompletionMessageParam]
+) -> Dict[str, Any]:
+    return {
+        "model": args.model,
+        "messages": messages,
+        "temperature": 0.1,
+        "seed": args.seed,
+    }
+
+
+def final_messages(
+    prompt_text: str,
+    evidence: Evidence,
+    analyses_title: str,
+    analyses: str,
+    similarities_title: str,
+    similarities: str,
+) -> List[ChatCompletionMessageParam]:
+    return [
         {
             "role": "system",
             "content": prompt_text,
@@ -119,26 +124,26 @@ def main() -> None:
             "role": "user",
             "content": f"""## Research Goal
 
-{goal_md}""",
+{evidence.goal}""",
         },
         {
             "role": "user",
             "content": f"""## Methodology
 
-{methodology_md}""",
+{evidence.methodology}""",
         },
         {
             "role": "user",
-            "content": f"""## Normalized System Prompt Analyses
+            "content": f"""## {analyses_title}
 
-{analysis_block}""",
+{analyses}""",
         },
         {
             "role": "user",
-            "content": f"""## Similarities
+            "content": f"""## {similarities_title}
 
 ```csv
-{similarities_csv}
+{similarities}
 ```""",
         },
         {
@@ -146,7 +151,7 @@ def main() -> None:
             "content": f"""## Band Report
 
 ```csv
-{bands_csv}
+{evidence.bands}
 ```""",
         },
         {
@@ -154,43 +159,543 @@ def main() -> None:
             "content": f"""## Prompt Families
 
 ```csv
-{families_csv}
+{evidence.families}
 ```""",
         },
         {
             "role": "user",
             "content": f"""## Prompt Family Interpretation
 
-{family_report}""",
+{evidence.family_report}""",
         },
     ]
 
-    if args.dry_run:
-        print("Dry run — request payload:")
-        print(f"Model: {args.model}")
-        if args.seed is not None:
-            print(f"Seed: {args.seed}")
-        for m in messages:
-            print(f"\n[{m['role']}]\n{m['content']}")
-        return
 
-    client = openai.OpenAI()
+def single_messages(
+    prompt_text: str, evidence: Evidence, files: List[LoadedFile]
+) -> List[ChatCompletionMessageParam]:
+    return final_messages(
+        prompt_text,
+        evidence,
+        "Normalized System Prompt Analyses",
+        analysis_block(files),
+        "Similarities",
+        evidence.similarities,
+    )
+
+
+# -------------------------
+# Similarity rows
+# -------------------------
+
+
+def parse_csv(text: str) -> List[List[str]]:
+    return [row for row in csv.reader(io.StringIO(text)) if row]
+
+
+def format_csv(rows: List[List[str]]) -> str:
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerows(rows)
+    return out.getvalue()
+
+
+def similarities_between(similarities_csv: str, names: Set[str]) -> str:
+    """The similarity rows whose two files are both in `names`."""
+    header, *rows = parse_csv(similarities_csv)
+    return format_csv([header] + [r for r in rows if r[0] in names and r[1] in names])
+
+
+def top_similarities(similarities_csv: str, budget: int) -> Tuple[str, int]:
+    """
+    The similarity rows with the highest weighted_score that fit in `budget`
+    tokens, in their original order, and the number of rows dropped.
+    """
+    if estimate_tokens(similarities_csv) <= budget:
+        return similarities_csv, 0
+    header, *rows = parse_csv(similarities_csv)
+    score = header.index("weighted_score") if "weighted_score" in header else -1
 
-    logging.info(f"Calling model {args.model} for final comparative analysis...")
+    def weight(k: int) -> float:
+        try:
+            return float(rows[k][score])
+        except (ValueError, IndexError):
+            return 0.0
+
+    used = estimate_tokens(format_csv([header]))
+    kept: Set[int] = set()
+    for k in sorted(range(len(rows)), key=weight, reverse=True):
+        cost = estimate_tokens(format_csv([rows[k]]))
+        if used + cost > budget:
+            break
+        kept.add(k)
+        used += cost
+    return (
+        format_csv([header] + [r for k, r in enumerate(rows) if k in kept]),
+        len(rows) - len(kept),
+    )
+
+
+# -------------------------
+# Map-reduce
+# -------------------------
+
+
+def group_analyses(
+    files: List[LoadedFile], group_by: str, families_csv: str
+) -> Dict[str, List[LoadedFile]]:
+    groups: Dict[str, List[LoadedFile]] = defaultdict(list)
+    if group_by == "assistant":
+        # assistant.mode.analysis.yaml
+        for f in files:
+            groups[f.path.name.split(".")[0]].append(f)
+        return dict(groups)
+
+    by_name = {f.path.name: f for f in files}
+    assigned: Set[str] = set()
+    for row in csv.DictReader(io.StringIO(families_csv)):
+        members = [m for m in (row.get("members") or "").split(";") if m in by_name]
+        label = f"{row['family_id']} {row.get('family_label', '')}".strip()
+        groups[label].extend(by_name[m] for m in members)
+        assigned.update(members)
+    unassigned = [f for f in files if f.path.name not in assigned]
+    if unassigned:
+        groups["unassigned"] = unassigned
+    return {label: members for label, members in groups.items() if members}
+
+
+def map_messages(
+    map_prompt: str, goal: str, title: str, body: str
+) -> List[ChatCompletionMessageParam]:
+    # Prompt and goal first: every map and merge request shares that prefix
+    return [
+        {
+            "role": "system",
+            "content": map_prompt,
+        },
+        {
+            "role": "user",
+            "content": f"""## Research Goal
+
+{goal}""",
+        },
+        {
+            "role": "user",
+            "content": f"""## {title}
+
+{body}""",
+        },
+    ]
+
+
+def map_body(files: List[LoadedFile], similarities_csv: str) -> str:
+    names = {f.path.name for f in files}
+    return (
+        analysis_block(files)
+        + "\n\n"
+        + fenced("Similarities", similarities_between(similarities_csv, names), "csv")
+    )
+
+
+def notes_title(args: argparse.Namespace) -> str:
+    return f"Evidence Notes per {args.group_by.title()}"
+
+
+def reduce_budget(
+    args: argparse.Namespace, prompt_text: str, evidence: Evidence
+) -> Tuple[int, int]:
+    """
+    Estimated tokens of the final request without notes and similarity rows,
+    and the share of the budget left for the notes. Exits if there is none.
+    """
+    fixed = estimate_messages(
+        final_messages(prompt_text, evidence, notes_title(args), "", "", "")
+    )
+    notes_budget = (
+        args.token_budget
+        - fixed
+        - min(
+            estimate_tokens(evidence.similarities),
+            int(args.token_budget * SIMILARITY_SHARE),
+        )
+    )
+    if notes_budget <= 0:
+        sys.exit(
+            f"The final request without notes is ~{fixed} tokens, which leaves "
+            f"no room in --token-budget {args.token_budget}"
+        )
+    return fixed, notes_budget
+
+
+def plan_map(
+    args: argparse.Namespace,
+    map_prompt: str,
+    evidence: Evidence,
+    groups: Dict[str, List[LoadedFile]],
+) -> List[MapUnit]:
+    """
+    One map unit per group, or several consecutive runs of its files when
+    the group does not fit in the token budget. Exits if a single analysis
+    does not.
+    """
+    overhead = estimate_messages(map_messages(map_prompt, evidence.goal, "Group", ""))
+    units: List[MapUnit] = []
+    for label, files in groups.items():
+        body = map_body(files, evidence.similarities)
+        if overhead + estimate_tokens(body) <= args.token_budget:
+            units.append(MapUnit(label, files))
+            continue
+        # The group's similarity rows bound those of any run of its files
+        rows = estimate_tokens(
+            similarities_between(evidence.similarities, {f.path.name for f in files})
+        )
+        try:
+            runs = pack(
+                files,
+                lambda f: estimate_tokens(analysis_block([f])),
+                args.token_budget - overhead - rows,
+            )
+        except ValueError as exc:
+            sys.exit(f"Group {label}: {exc}; raise --token-budget")
+        for k, run in enumerate(runs, start=1):
+            units.append(MapUnit(f"{label} (part {k}/{len(runs)})", run))
+    return units
+
+
+async def write_notes(
+    runtime: ModelRuntime,
+    semaphore: asyncio.Semaphore,
+    args: argparse.Namespace,
+    map_prompt: str,
+    goal: str,
+    label: str,
+    title: str,
+    body: str,
+    inputs: Sequence[Path] = (),
+) -> str:
+    """One map or merge call; returns the notes under a '### label' heading."""
+    request = completion_request(args, map_messages(map_prompt, goal, title, body))
+    async with semaphore:
+        logging.debug(f"Writing evidence notes for {label}")
+        response = await runtime.acomplete(request, inputs=inputs)
+    content = response.choices[0].message.content
+    if not content:
+        raise ValueError(f"{label}: model returned empty notes")
+    return f"### {label}\n\n{content.strip()}"
+
+
+async def merge_to_fit(
+    runtime: ModelRuntime,
+    semaphore: asyncio.Semaphore,
+    args: argparse.Namespace,
+    map_prompt: str,
+    goal: str,
+    notes: List[str],
+    budget: int,
+) -> List[str]:
+    """
+    Merge consecutive notes, level by level, until they total at most
+    `budget` tokens. Raises ValueError when a level makes no progress.
+    """
+    title = "Partial Evidence Notes"
+    run_budget = args.token_budget - estimate_messages(
+        map_messages(map_prompt, goal, title, "")
+    )
+    level = 0
+    total = sum(estimate_tokens(n) for n in notes)
+    while total > budget:
+        if len(notes) == 1:
+            raise ValueError(
+                f"the notes (~{total} tokens) do not fit in the ~{budget} tokens "
+                f"the final request leaves for them; raise --token-budget"
+            )
+        runs = pack(notes, estimate_tokens, run_budget)
+        if len(runs) == len(notes):
+            raise ValueError(
+                f"evidence notes (~{total} tokens) cannot be merged within "
+                f"--token-budget"
+            )
+        level += 1
+        logging.info(
+            f"Merging {len(notes)} notes (~{total} tokens) into {len(runs)} "
+            f"(level {level})"
+        )
+        notes = list(
+            await asyncio.gather(
+                *(
+                    (
+                        write_notes(
+                            runtime,
+                            semaphore,
+                            args,
+                            map_prompt,
+                            goal,
+                            f"Merged notes {level}.{k}",
+                            title,
+                            "\n\n".join(run),
+                        )
+                        if len(run) > 1
+                        # A note alone in its run passes through unchanged
+                        else asyncio.sleep(0, run[0])
+                    )
+                    for k, run in enumerate(runs, start=1)
+                )
+            )
+        )
+        merged = sum(estimate_tokens(n) for n in notes)
+        if merged >= total:
+            raise ValueError(f"merging did not shrink the notes (~{merged} tokens)")
+        total = merged
+    return notes
+
+
+async def map_reduce(
+    args: argparse.Namespace,
+    prompt_text: str,
+    map_prompt: str,
+    evidence: Evidence,
+    units: List[MapUnit],
+    inputs: List[Path],
+) -> str:
+    runtime = ModelRuntime(args)
+    semaphore = asyncio.Semaphore(args.concurrency)
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0.1,
-            seed=args.seed,
+        logging.info(
+            f"Map: {len(units)} groups by {args.group_by} with model {args.model}"
+        )
+        notes = list(
+            await asyncio.gather(
+                *(
+                    write_notes(
+                        runtime,
+                        semaphore,
+                        args,
+                        map_prompt,
+                        evidence.goal,
+                        unit.label,
+                        f"Group: {unit.label}",
+                        map_body(unit.files, evidence.similarities),
+                        [f.path for f in unit.files],
+                    )
+                    for unit in units
+                )
+            )
         )
-    except Exception:
-        logging.exception("API call failed")
-        sys.exit(1)
+
+        fixed, notes_budget = reduce_budget(args, prompt_text, evidence)
+        notes = await merge_to_fit(
+            runtime, semaphore, args, map_prompt, evidence.goal, notes, notes_budget
+        )
+        notes_text = "\n\n".join(notes)
+
+        similarities, dropped = top_similarities(
+            evidence.similarities,
+            args.token_budget - fixed - estimate_tokens(notes_text),
+        )
+        similarities_title = "Similarities"
+        if dropped:
+            similarities_title += f" (highest weighted_score rows; {dropped} omitted)"
+            logging.info(f"Reduce: {dropped} similarity rows omitted to fit the budget")
+
+        messages = final_messages(
+            prompt_text,
+            evidence,
+            notes_title(args),
+            "The normalized analyses were condensed into the notes below.\n\n"
+            + notes_text,
+            similarities_title,
+            similarities,
+        )
+        logging.info(
+            f"Reduce: final synthesis over {len(notes)} notes "
+            f"(~{estimate_messages(messages)} tokens)"
+        )
+        response = await runtime.acomplete(
+            completion_request(args, messages), inputs=inputs
+        )
+    finally:
+        await runtime.aclose()
 
     output = response.choices[0].message.content
     if not output:
-        sys.exit("Model returned empty output")
+        raise ValueError("Model returned empty output")
+    return output
+
+
+def print_map_plan(
+    args: argparse.Namespace,
+    prompt_text: str,
+    map_prompt: str,
+    evidence: Evidence,
+    units: List[MapUnit],
+) -> None:
+    print(
+        f"Dry run: map-reduce over {len(units)} groups by {args.group_by}, "
+        f"token budget {args.token_budget}"
+    )
+    print(f"Model: {args.model}")
+    fixed, notes_budget = reduce_budget(args, prompt_text, evidence)
+    print(
+        f"  reduce: ~{fixed} tokens of fixed evidence, "
+        f"~{notes_budget} tokens for the notes"
+    )
+    for unit in units:
+        messages = map_messages(
+            map_prompt,
+            evidence.goal,
+            f"Group: {unit.label}",
+            map_body(unit.files, evidence.similarities),
+        )
+        print(
+            f"  {unit.label}: {len(unit.files)} analyses, "
+            f"~{estimate_messages(messages)} tokens"
+        )
+
+
+# -------------------------
+# Main
+# -------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate final comparative analysis report for system prompt governance"
+    )
+    parser.add_argument(
+        "--prompt", required=True, help="Final analysis prompt (Markdown)"
+    )
+    parser.add_argument(
+        "--analysis-dir", required=True, help="Directory with *.analysis.yaml files"
+    )
+    parser.add_argument("--similarities", required=True, help="similarities.csv")
+    parser.add_argument("--bands", required=True, help="band-report.csv")
+    parser.add_argument("--families", required=True, help="prompt-families.csv")
+    parser.add_argument(
+        "--family-report", required=True, help="prompt-families-report.md"
+    )
+    parser.add_argument("--methodology", required=True, help="methodology.md")
+    parser.add_argument("--goal", required=True, help="goal.md")
+    add_model_arguments(parser, "gpt-5.2")
+    parser.add_argument(
+        "--output",
+        help="Output report file (prints to stdout if omitted)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["auto", "single", "map-reduce"],
+        default="auto",
+        help="auto: one request if it fits in --token-budget, else map-reduce "
+        "(default: auto)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help=f"Maximum estimated prompt tokens per request (default: {DEFAULT_TOKEN_BUDGET})",
+    )
+    parser.add_argument(
+        "--map-prompt",
+        help="Evidence-notes prompt for the map and merge calls (Markdown); "
+        "required for map-reduce",
+    )
+    parser.add_argument(
+        "--group-by",
+        choices=["assistant", "family"],
+        default="assistant",
+        help="Map-reduce: group analyses per assistant or per prompt family "
+        "(default: assistant)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Map-reduce: maximum concurrent model calls (default: {DEFAULT_CONCURRENCY})",
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    setup_logging(args.verbose)
+
+    prompt_text = read_text(Path(args.prompt))
+    files = read_analysis_dir(Path(args.analysis_dir))
+    evidence = Evidence(
+        goal=read_text(Path(args.goal)),
+        methodology=read_text(Path(args.methodology)),
+        similarities=read_text(Path(args.similarities)),
+        bands=read_text(Path(args.bands)),
+        families=read_text(Path(args.families)),
+        family_report=read_text(Path(args.family_report)),
+    )
+    inputs = [f.path for f in files] + [
+        Path(p)
+        for p in (
+            args.goal,
+            args.methodology,
+            args.similarities,
+            args.bands,
+            args.families,
+            args.family_report,
+        )
+    ]
+
+    messages = single_messages(prompt_text, evidence, files)
+    estimate = estimate_messages(messages)
+    mode = args.mode
+    if mode == "auto":
+        mode = "single" if estimate <= args.token_budget else "map-reduce"
+        logging.info(
+            f"Evidence bundle is ~{estimate} tokens "
+            f"(budget {args.token_budget}): {mode} mode"
+        )
+
+    if mode == "single":
+        if args.dry_run:
+            print("Dry run — request payload:")
+            print(f"Model: {args.model}")
+            if args.seed is not None:
+                print(f"Seed: {args.seed}")
+            for m in messages:
+                print(f"\n[{m['role']}]\n{m['content']}")
+            return
+
+        runtime = ModelRuntime(args)
+
+        logging.info(f"Calling model {args.model} for final comparative analysis...")
+        try:
+            response = runtime.complete(
+                completion_request(args, messages), inputs=inputs
+            )
+        except Exception:
+            logging.exception("API call failed")
+            sys.exit(1)
+        finally:
+            runtime.close()
+
+        output = response.choices[0].message.content
+        if not output:
+            sys.exit("Model returned empty output")
+    else:
+        if not args.map_prompt:
+            sys.exit(
+                f"Evidence bundle (~{estimate} tokens) needs map-reduce: "
+                "pass --map-prompt"
+            )
+        map_prompt = read_text(Path(args.map_prompt))
+        groups = group_analyses(files, args.group_by, evidence.families)
+        units = plan_map(args, map_prompt, evidence, groups)
+        reduce_budget(args, prompt_text, evidence)
+        if args.dry_run:
+            print_map_plan(args, prompt_text, map_prompt, evidence, units)
+            return
+        try:
+            output = asyncio.run(
+                map_reduce(args, prompt_text, map_prompt, evidence, units, inputs)
+            )
+        except ValueError as exc:
+            sys.exit(f"Map-reduce failed: {exc}")
+        except Exception:
+            logging.exception("API call failed")
+            sys.exit(1)
 
     if args.output:
         out = Path(args.output)
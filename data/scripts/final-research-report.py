@@ -31,15 +31,8 @@ import sys
 from pathlib import Path
 from typing import List
 
-import openai
-
-
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
+from llm_runtime import (ModelRuntime, add_model_arguments, read_text,
+                         setup_logging)
 
 
 def main() -> None:
@@ -62,37 +55,16 @@ def main() -> None:
         required=True,
         help="Research goal document (goal.md)",
     )
-    parser.add_argument(
-        "--model",
-        default="gpt-5.2",
-        help="Model name (default: gpt-5.2)",
-    )
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
-    )
+    add_model_arguments(parser, "gpt-5.2")
     parser.add_argument(
         "--output",
         default="final-research-report.md",
         help="Output path (default: final-research-report.md)",
     )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print the request payload and exit without calling the API",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
 
     args = parser.parse_args()
 
-    logging.basicConfig(
-        level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
+    setup_logging(args.verbose)
 
     prompt_text = read_text(Path(args.prompt))
     goal_text = read_text(Path(args.goal))
@@ -135,19 +107,24 @@ def main() -> None:
             print(f"[{msg['role']}]\n{msg['content']}\n")
         return
 
-    client = openai.OpenAI()
+    runtime = ModelRuntime(args)
 
     logging.info("Calling model to generate final research report...")
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0.1,
-            seed=args.seed,
+        response = runtime.complete(
+            {
+                "model": args.model,
+                "messages": messages,
+                "temperature": 0.1,
+                "seed": args.seed,
+            },
+            inputs=sorted(assistant_paths) + [Path(args.goal)],
         )
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
 
     output = response.choices[0].message.content
     if not output:
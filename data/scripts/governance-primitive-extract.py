@@ -10,12 +10,29 @@ governance-primitive-extract.py
 Extract verbatim prompt governance primitives from a system prompt payload
 using a strict extraction prompt.
 
+Several payloads (--payloads) are written to <output-dir>/<payload>.json;
+with --batch they are submitted as one offline batch job (see llm_batch.py).
+--stream aborts and retries a response whose root is not a JSON object as
+soon as that is visible (see llm_stream.py).
+
+By default the response is constrained to a JSON Schema derived from the
+prompt's canonical JSON template (--structured-output, llm_structured.py).
+A response that cannot be parsed gets up to --repair-retries targeted
+retries, batch results included.
+
 Usage:
   uv run --locked governance-primitive-extract.py \
     --prompt prompts/governance-primitive-extraction.prompt.md \
     --payload payload/vscode-copilot.agent.json \
     --model gpt-5.2 \
     --output governance/vscode-copilot.agent.json
+
+  uv run --locked governance-primitive-extract.py \
+    --prompt prompts/governance-primitive-extraction.prompt.md \
+    --payloads 'payload/*.json' \
+    --output-dir governance \
+    --batch .batch/governance \
+    --model gpt-5.2
 """
 
 import argparse
@@ -23,87 +40,30 @@ import hashlib
 import json
 import logging
 import platform
-import re
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-import openai
-from openai.types.chat import ChatCompletionMessageParam
+from llm_batch import (BatchRequest, add_batch_arguments, expand_inputs,
+                       is_up_to_date, run_batch_job)
+from llm_runtime import (ModelRuntime, add_model_arguments, fenced, read_text,
+                         setup_logging)
+from llm_stream import JsonObjectGuard, StreamAbort, add_stream_arguments
+from llm_structured import (add_structured_arguments, repaired,
+                            response_format, response_json, template_schema)
+from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
 
 
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
-
-
-def clean_output(text: str) -> str:
+def build_messages(
+    extraction_prompt: str, payload_path: Path, payload_json: str
+) -> Tuple[List[ChatCompletionMessageParam], str]:
     """
-    Remove markdown code fences if the model accidentally emits them.
-    Only the first fenced block is extracted.
+    The messages and the capture timestamp in them, which varies with the
+    payload's mtime and so is masked out of the cache key. Raises
+    ValueError if the payload is not valid JSON.
     """
-    pattern = r"```(?:json)?\s*\n(.*?)\n\s*```"
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        logging.debug("Removed markdown code block markers from output")
-        return match.group(1).strip()
-    return text.strip()
-
-
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description="Prompt governance primitive extraction runner"
-    )
-    parser.add_argument("--prompt", required=True, help="Extraction prompt (Markdown)")
-    parser.add_argument("--payload", required=True, help="System prompt payload (JSON)")
-    parser.add_argument("--model", required=True, help="Model name (e.g. gpt-5.2)")
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
-    )
-    parser.add_argument(
-        "--output",
-        required=True,
-        help="Output JSON file path",
-    )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print the request that would be sent and exit",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
-    args = parser.parse_args()
-
-    # Logging
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logging.basicConfig(
-        level=log_level,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
-
-    prompt_path = Path(args.prompt)
-    payload_path = Path(args.payload)
-    output_path = Path(args.output)
-
-    extraction_prompt = read_text(prompt_path)
-    payload_json = read_text(payload_path)
-
-    logging.debug(f"Read prompt from {prompt_path}")
-    logging.debug(f"Read payload from {payload_path}")
-
-    # Validate payload JSON early
-    try:
-        payload = json.loads(payload_json)
-    except json.JSONDecodeError:
-        logging.exception("Invalid JSON in payload")
-        sys.exit(1)
+    payload = json.loads(payload_json)
 
     # Capture metadata (deterministic + audit-friendly)
     stat = payload_path.stat()
@@ -131,31 +91,278 @@ def main() -> None:
         },
     }
 
-    messages: list[ChatCompletionMessageParam] = [
+    # Invariant prompt first, so requests share a cacheable prefix; the
+    # payload before its per-capture metadata (hash and timestamp)
+    messages: List[ChatCompletionMessageParam] = [
         {
             "role": "system",
             "content": extraction_prompt,
         },
         {
             "role": "user",
-            "content": f"""## Capture Metadata
-
-```json
-{json.dumps(capture_metadata, indent=2)}
-```
-""",
+            "content": fenced(
+                f"Prompt Payload ({payload_path.name})",
+                json.dumps(payload, indent=2),
+                "json",
+            )
+            + "\n"
+            + fenced(
+                "Capture Metadata", json.dumps(capture_metadata, indent=2), "json"
+            ),
         },
-        {
-            "role": "user",
-            "content": f"""## Prompt Payload ({payload_path.name})
+    ]
+    return messages, captured_at
 
-```json
-{json.dumps(payload, indent=2)}
-```
 
-""",
-        },
-    ]
+def completion_request(
+    args: argparse.Namespace,
+    messages: List[ChatCompletionMessageParam],
+    output_format: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    request: Dict[str, Any] = {
+        "model": args.model,
+        "messages": messages,
+        "temperature": 0,
+        "seed": args.seed,
+    }
+    if output_format:
+        request["response_format"] = output_format
+    return request
+
+
+def extraction_format(
+    args: argparse.Namespace, extraction_prompt: str
+) -> Optional[Dict[str, Any]]:
+    """The structured-output format of the prompt's template, or None if off."""
+    if not args.structured_output:
+        return None
+    try:
+        schema = template_schema(extraction_prompt)
+    except ValueError:
+        logging.exception("Cannot derive an output schema from the extraction prompt")
+        sys.exit(1)
+    return response_format("governance_extraction", schema)
+
+
+def call_model(
+    runtime: ModelRuntime,
+    args: argparse.Namespace,
+    request: Dict[str, Any],
+    payload_path: Path,
+    output_path: Path,
+    captured_at: str,
+) -> ChatCompletion:
+    if args.stream:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        return runtime.stream(
+            request,
+            JsonObjectGuard,
+            output_path.with_name(f".{output_path.name}.partial"),
+            masked=[captured_at],
+            retries=args.stream_retries,
+            inputs=[payload_path],
+        )
+    return runtime.complete(request, masked=[captured_at], inputs=[payload_path])
+
+
+def write_primitives(output_path: Path, primitives: Dict[str, Any]) -> None:
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(
+        json.dumps(primitives, indent=2, ensure_ascii=False),
+        encoding="utf-8",
+    )
+    output_path.with_name(f".{output_path.name}.partial").unlink(missing_ok=True)
+
+
+def parse_primitives(
+    runtime: ModelRuntime,
+    args: argparse.Namespace,
+    request: Dict[str, Any],
+    response: ChatCompletion,
+    payload_path: Path,
+    output_path: Path,
+    captured_at: str,
+) -> Dict[str, Any]:
+    """
+    The model output as a JSON object, after up to --repair-retries targeted
+    retries. Raises ValueError on empty or invalid output.
+    """
+    return repaired(
+        lambda r: call_model(runtime, args, r, payload_path, output_path, captured_at),
+        request,
+        response,
+        response_json,
+        args.repair_retries,
+        str(payload_path),
+    )
+
+
+# -------------------------
+# Several payloads
+# -------------------------
+
+
+def extract_many(
+    args: argparse.Namespace,
+    extraction_prompt: str,
+    output_format: Optional[Dict[str, Any]],
+) -> None:
+    if args.output:
+        sys.exit("--output is for a single --payload; use --output-dir")
+
+    output_dir = Path(args.output_dir)
+    payload_paths = expand_inputs(args.payloads)
+    jobs = [(p, output_dir / p.name) for p in payload_paths]
+    if not args.force:
+        jobs = [(p, out) for p, out in jobs if not is_up_to_date(p, out)]
+    skipped = len(payload_paths) - len(jobs)
+
+    if args.dry_run and not args.batch:
+        print(f"Dry run: Would extract {len(jobs)} payloads ({skipped} up to date)")
+        for payload_path, output_path in jobs:
+            print(f"  {payload_path} -> {output_path}")
+        return
+    if not jobs:
+        logging.info(f"All {len(payload_paths)} extractions are up to date")
+        return
+
+    requests: List[BatchRequest] = []
+    outputs: Dict[str, Tuple[Path, Path, str]] = {}
+    by_id: Dict[str, BatchRequest] = {}
+    failed = 0
+    for payload_path, output_path in jobs:
+        try:
+            messages, captured_at = build_messages(
+                extraction_prompt,
+                payload_path,
+                payload_path.read_text(encoding="utf-8"),
+            )
+        except (OSError, ValueError):
+            logging.exception(f"{payload_path}: unreadable or invalid JSON payload")
+            failed += 1
+            continue
+        item = BatchRequest(
+            payload_path.name,
+            completion_request(args, messages, output_format),
+            masked=[captured_at],
+            inputs=[payload_path],
+        )
+        requests.append(item)
+        by_id[item.custom_id] = item
+        outputs[payload_path.name] = (payload_path, output_path, captured_at)
+
+    def finish(custom_id: str, response: ChatCompletion) -> bool:
+        payload_path, output_path, _ = outputs[custom_id]
+        try:
+            primitives = parse_primitives(
+                runtime, args, by_id[custom_id].request, response, *outputs[custom_id]
+            )
+        except ValueError as exc:
+            logging.error(f"{payload_path}: {exc}")
+            return False
+        except Exception:
+            logging.exception(f"{payload_path}: API call failed")
+            return False
+        try:
+            write_primitives(output_path, primitives)
+        except Exception:
+            logging.exception(f"Failed to write output to {output_path}")
+            return False
+        logging.info(f"Governance primitives saved to {output_path}")
+        return True
+
+    runtime = ModelRuntime(args)
+    logging.info(
+        f"Extracting {len(requests)} payloads with model {args.model}"
+        + (" as a batch job" if args.batch else "")
+        + f" ({skipped} up to date)"
+    )
+    try:
+        if args.batch:
+            failed += run_batch_job(args, runtime, requests, finish)
+        else:
+            for item in requests:
+                try:
+                    response = call_model(
+                        runtime, args, item.request, *outputs[item.custom_id]
+                    )
+                except Exception:
+                    logging.exception(f"{item.custom_id}: API call failed")
+                    failed += 1
+                    continue
+                failed += not finish(item.custom_id, response)
+    finally:
+        runtime.close()
+    if failed:
+        sys.exit(f"{failed} payloads not extracted")
+
+
+# -------------------------
+# Main
+# -------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Prompt governance primitive extraction runner"
+    )
+    parser.add_argument("--prompt", required=True, help="Extraction prompt (Markdown)")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--payload", help="System prompt payload (JSON)")
+    inputs.add_argument(
+        "--payloads",
+        nargs="+",
+        help="Several payloads or glob patterns (JSON), written to --output-dir",
+    )
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--output",
+        help="Output JSON file path (required with --payload)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="governance",
+        help="Output directory for --payloads (default: governance)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --payloads, also re-extract payloads whose output is up to date",
+    )
+    add_batch_arguments(parser)
+    add_stream_arguments(parser)
+    add_structured_arguments(parser)
+    args = parser.parse_args()
+    if args.stream and args.batch:
+        parser.error("--stream cannot be combined with --batch")
+
+    setup_logging(args.verbose)
+
+    prompt_path = Path(args.prompt)
+    extraction_prompt = read_text(prompt_path)
+    logging.debug(f"Read prompt from {prompt_path}")
+    output_format = extraction_format(args, extraction_prompt)
+
+    if args.payloads:
+        extract_many(args, extraction_prompt, output_format)
+        return
+    if not args.output:
+        sys.exit("--output is required with --payload")
+
+    payload_path = Path(args.payload)
+    output_path = Path(args.output)
+
+    payload_json = read_text(payload_path)
+    logging.debug(f"Read payload from {payload_path}")
+
+    # Validate payload JSON early
+    try:
+        messages, captured_at = build_messages(
+            extraction_prompt, payload_path, payload_json
+        )
+    except json.JSONDecodeError:
+        logging.exception("Invalid JSON in payload")
+        sys.exit(1)
 
     if args.dry_run:
         print("Dry run mode enabled. The following request would be sent:\n")
@@ -165,40 +372,30 @@ def main() -> None:
         print(json.dumps(messages, indent=2, ensure_ascii=False))
         return
 
-    client = openai.OpenAI()
+    runtime = ModelRuntime(args)
 
     logging.info(f"Calling model {args.model}...")
+    request = completion_request(args, messages, output_format)
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0,
-            seed=args.seed,
+        response = call_model(
+            runtime, args, request, payload_path, output_path, captured_at
         )
+        primitives = parse_primitives(
+            runtime, args, request, response, payload_path, output_path, captured_at
+        )
+    except StreamAbort:
+        sys.exit(f"Streamed output rejected on all {args.stream_retries + 1} attempts")
+    except ValueError:
+        logging.exception("Invalid model output")
+        sys.exit(1)
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
 
-    content = response.choices[0].message.content
-    if not content:
-        sys.exit("Model returned empty output")
-
-    content = clean_output(content)
-
-    # Validate output JSON strictly
-    try:
-        parsed = json.loads(content)
-    except json.JSONDecodeError:
-        logging.exception("Model output is not valid JSON")
-        sys.exit(1)
-
-    # Write output
     try:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(
-            json.dumps(parsed, indent=2, ensure_ascii=False),
-            encoding="utf-8",
-        )
+        write_primitives(output_path, primitives)
         print(f"Governance primitives saved to {output_path}")
     except Exception:
         logging.exception("Failed to write output")
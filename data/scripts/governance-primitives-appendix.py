@@ -32,15 +32,8 @@ import logging
 import sys
 from pathlib import Path
 
-import openai
-
-
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
+from llm_runtime import (ModelRuntime, add_model_arguments, read_text,
+                         setup_logging)
 
 
 def read_json(path: Path) -> dict:
@@ -70,39 +63,16 @@ def main() -> None:
         required=True,
         help="Prompt Governance Primitives Registry (JSON)",
     )
-    parser.add_argument(
-        "--model",
-        default="gpt-5.2",
-        help="Model name (default: gpt-5.2)",
-    )
-    parser.add_argument(
-        "--seed",
-        type=int,
-        help="Seed for deterministic inference (optional)",
-    )
+    add_model_arguments(parser, "gpt-5.2")
     parser.add_argument(
         "--output",
         default="appendix-governance-primitives.md",
         help="Output path (default: appendix-governance-primitives.md)",
     )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print the request payload and exit without calling the API",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
 
     args = parser.parse_args()
 
-    logging.basicConfig(
-        level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
+    setup_logging(args.verbose)
 
     prompt_text = read_text(Path(args.prompt))
     report_text = read_text(Path(args.report))
@@ -141,19 +111,24 @@ def main() -> None:
             print(f"[{msg['role']}]\n{msg['content']}\n")
         return
 
-    client = openai.OpenAI()
+    runtime = ModelRuntime(args)
 
     logging.info("Calling model to generate governance primitives appendix...")
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0.1,
-            seed=args.seed,
+        response = runtime.complete(
+            {
+                "model": args.model,
+                "messages": messages,
+                "temperature": 0.1,
+                "seed": args.seed,
+            },
+            inputs=[Path(args.report), Path(args.registry)],
         )
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
 
     output = response.choices[0].message.content
     if not output:
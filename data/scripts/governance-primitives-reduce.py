@@ -10,15 +10,54 @@ governance-primitives-reduce.py
 Second-order reducer that derives Prompt Governance Primitives
 from verbatim governance extraction artifacts.
 
+By default every artifact goes into one request. With --leaf-size N the
+registry is built by tree reduction instead:
+
+- the artifacts, sorted by file name, are cut into leaves of N
+- each leaf is reduced to a partial registry, --concurrency calls at a time
+- partial registries are merged pairwise (--merge-prompt), up a balanced
+  binary tree, into the final registry
+
+Partials are renumbered PGP-001... in a canonical order (abstract before
+concrete, then by name) before they are merged, and so is the final
+registry, so IDs do not depend on the order a model happened to list the
+primitives in. Leaf requests carry no timestamp and merge requests contain
+only their two inputs, so with --llm-cache a changed artifact recomputes
+only its own leaf and the merges above it; every other branch is served
+from the response cache.
+
+With --update the registry at --output is extended instead of rebuilt.
+Artifacts whose file#hash the registry was not derived from (the
+registry's "sources" map, written with every registry) are sent with a
+compact digest of the current primitives (IDs, names, classification and
+descriptions, no verbatim clauses) and --update-prompt; the model returns
+new instances for existing primitives and new primitives, which are
+applied locally. Existing PGP IDs never change and new primitives get the
+next free numbers. Instances from a changed or removed artifact are taken
+out first, and a primitive left without any evidence is dropped (its ID is
+not reused). Without a registry at --output the artifacts are reduced in
+full.
+
+By default every call is constrained to a JSON Schema derived from the
+prompts' canonical JSON templates (--structured-output, llm_structured.py):
+leaf, merge and full reductions to the reducer prompt's registry, updates
+to the update prompt's merges and additions. A response that cannot be
+parsed or applied gets up to --repair-retries targeted retries.
+
 Usage:
   uv run --locked governance-primitives-reduce.py \
     --prompt prompts/governance-primitives-reducer.prompt.md \
     --inputs governance/*.json \
     --model gpt-5.2 \
     --output primitives.registry.json
+
+  ... --leaf-size 4 --merge-prompt prompts/governance-primitives-merge.prompt.md
+
+  ... --update --update-prompt prompts/governance-primitives-update.prompt.md
 """
 
 import argparse
+import asyncio
 import hashlib
 import json
 import logging
@@ -27,29 +66,30 @@ import re
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any
 
-import openai
+from llm_runtime import (ModelRuntime, add_model_arguments, clean_output,
+                         read_text, setup_logging)
+from llm_structured import (acomplete_repaired, add_structured_arguments,
+                            complete_repaired, response_format, response_text,
+                            template_schema)
 from openai.types.chat import ChatCompletionMessageParam
+from token_budget import estimate_messages
 
+DEFAULT_CONCURRENCY = 8
 
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
-
+PRIMITIVE_ID = re.compile(r"\bPGP-\d+\b")
 
-def clean_output(text: str) -> str:
-    """
-    Remove markdown fences if the model emits them accidentally.
-    """
-    pattern = r"```(?:json)?\s*\n(.*?)\n\s*```"
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        logging.debug("Stripped markdown code fences from output")
-        return match.group(1).strip()
-    return text.strip()
+# What the update request sees of each existing primitive
+DIGEST_FIELDS = (
+    "primitive_id",
+    "name",
+    "level",
+    "governance_axis",
+    "risk_class",
+    "mitigation_target",
+    "description",
+)
 
 
 def load_artifacts(paths: list[Path]) -> list[dict]:
@@ -72,78 +112,152 @@ def load_artifacts(paths: list[Path]) -> list[dict]:
     return artifacts
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Prompt governance primitives reducer")
-    parser.add_argument(
-        "--prompt",
-        required=True,
-        help="Second-order reducer prompt (Markdown)",
-    )
-    parser.add_argument(
-        "--inputs",
-        required=True,
-        nargs="+",
-        help="Governance extraction JSON files (glob supported by shell)",
-    )
-    parser.add_argument(
-        "--model",
-        required=True,
-        help="Model name (e.g. gpt-5.2)",
-    )
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
-    )
-    parser.add_argument(
-        "--output",
-        required=True,
-        help="Output primitives registry JSON file",
-    )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print request payload and exit without calling API",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
-    args = parser.parse_args()
+def artifact_paths(args: argparse.Namespace, artifacts: list[dict]) -> list[Path]:
+    """The --inputs files the artifacts were loaded from (for telemetry)."""
+    files = {a["file"] for a in artifacts}
+    return [Path(p) for p in args.inputs if Path(p).name in files]
 
-    # Logging
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logging.basicConfig(
-        level=log_level,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
 
-    prompt_path = Path(args.prompt)
-    input_paths = [Path(p) for p in args.inputs]
-    output_path = Path(args.output)
+def combined_hash(artifacts: list[dict]) -> str:
+    return hashlib.sha256(
+        "".join(a["hash"] for a in artifacts).encode("utf-8")
+    ).hexdigest()
 
-    reducer_prompt = read_text(prompt_path)
-    artifacts = load_artifacts(input_paths)
 
-    logging.info(f"Loaded {len(artifacts)} governance artifacts")
+def completion_request(
+    args: argparse.Namespace,
+    messages: list[ChatCompletionMessageParam],
+    output_format: dict[str, Any] | None,
+) -> dict[str, Any]:
+    request: dict[str, Any] = {
+        "model": args.model,
+        "messages": messages,
+        "temperature": 0,
+        "seed": args.seed,
+    }
+    if output_format:
+        request["response_format"] = output_format
+    return request
+
+
+def output_format(
+    args: argparse.Namespace, name: str, prompt: str, related: tuple[str, ...] = ()
+) -> dict[str, Any] | None:
+    """The structured-output format of a prompt's template, or None if off."""
+    if not args.structured_output:
+        return None
+    try:
+        return response_format(name, template_schema(prompt, related))
+    except ValueError:
+        logging.exception(f"Cannot derive an output schema for {name}")
+        sys.exit(1)
+
+
+def parse_registry(content: str | None) -> dict:
+    """Raises ValueError unless content is a JSON registry."""
+    if not content:
+        raise ValueError("Model returned empty output")
+    try:
+        registry = json.loads(clean_output(content, "json"))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Model output is not valid JSON: {exc}") from exc
+    if not isinstance(registry, dict) or not isinstance(
+        registry.get("primitives"), list
+    ):
+        raise ValueError("Model output is not a registry with a primitives list")
+    return registry
+
+
+def renumber(registry: dict) -> dict:
+    """
+    Number primitives PGP-001... in canonical order (abstract first, then by
+    name), rewriting references to the old IDs in their text fields.
+    """
+    primitives = sorted(
+        (p for p in registry["primitives"] if isinstance(p, dict)),
+        key=lambda p: (p.get("level") != "abstract", str(p.get("name", "")).casefold()),
+    )
+    ids: dict[str, str] = {}
+    for k, primitive in enumerate(primitives, start=1):
+        new_id = f"PGP-{k:03d}"
+        ids.setdefault(str(primitive.get("primitive_id")), new_id)
+        primitive["primitive_id"] = new_id
+    for primitive in primitives:
+        for field in ("description", "applicability_conditions", "notes"):
+            if isinstance(primitive.get(field), str):
+                primitive[field] = PRIMITIVE_ID.sub(
+                    lambda m: ids.get(m.group(0), m.group(0)), primitive[field]
+                )
+    return {**registry, "primitives": primitives}
+
+
+def write_registry(output_path: Path, registry: dict, artifacts: list[dict]) -> None:
+    """Write the registry with the file -> hash map of the artifacts it covers."""
+    registry = {**registry, "sources": {a["file"]: a["hash"] for a in artifacts}}
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(
+            json.dumps(registry, indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        print(f"Primitive registry written to {output_path}")
+    except Exception:
+        logging.exception("Failed to write output")
+        sys.exit(1)
 
-    # Capture metadata
-    combined_hash = hashlib.sha256(
-        "".join(a["hash"] for a in artifacts).encode("utf-8")
-    ).hexdigest()
 
-    capture_metadata = {
-        "generated_at": datetime.now(tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+def reduction_messages(
+    reducer_prompt: str, artifacts: list[dict]
+) -> list[ChatCompletionMessageParam]:
+    # No wall-clock time, which would change the request (and so its cache
+    # key) on every run; generated_at is stamped into the written registry
+    metadata = {
         "artifact_count": len(artifacts),
-        "combined_hash": combined_hash,
+        "combined_hash": combined_hash(artifacts),
         "environment": {
             "os": platform.system(),
             "arch": platform.machine(),
             "runtime": f"Python {platform.python_version()}",
         },
     }
+    return [
+        {
+            "role": "system",
+            "content": reducer_prompt,
+        },
+        {
+            "role": "user",
+            "content": f"""## Reduction Metadata
+
+{json.dumps(metadata, indent=2)}
 
-    messages: list[ChatCompletionMessageParam] = [
+""",
+        },
+        {
+            "role": "user",
+            "content": f"""## Governance Artifacts
+
+{json.dumps(artifacts, indent=2, ensure_ascii=False)}
+
+""",
+        },
+    ]
+
+
+# -------------------------
+# Tree reduction
+# -------------------------
+
+
+def leaf_messages(
+    reducer_prompt: str, artifacts: list[dict]
+) -> list[ChatCompletionMessageParam]:
+    # No generation timestamp: an unchanged leaf must hit the response cache
+    metadata = {
+        "artifact_count": len(artifacts),
+        "combined_hash": combined_hash(artifacts),
+    }
+    return [
         {
             "role": "system",
             "content": reducer_prompt,
@@ -152,7 +266,10 @@ def main() -> None:
             "role": "user",
             "content": f"""## Reduction Metadata
 
-{json.dumps(capture_metadata, indent=2)}
+{json.dumps(metadata, indent=2)}
+
+These artifacts are one batch of a larger corpus. Derive the registry for
+this batch; it will be merged with the registries of the other batches.
 
 """,
         },
@@ -166,52 +283,509 @@ def main() -> None:
         },
     ]
 
+
+def merge_messages(
+    merge_prompt: str, left: dict, right: dict
+) -> list[ChatCompletionMessageParam]:
+    return [
+        {
+            "role": "system",
+            "content": merge_prompt,
+        },
+        {
+            "role": "user",
+            "content": f"""## Partial Registry A
+
+{json.dumps(left, indent=2, ensure_ascii=False)}
+
+""",
+        },
+        {
+            "role": "user",
+            "content": f"""## Partial Registry B
+
+{json.dumps(right, indent=2, ensure_ascii=False)}
+
+""",
+        },
+    ]
+
+
+def leaf_label(leaves: list[list[dict]]) -> str:
+    return f"{leaves[0][0]['file']} .. {leaves[-1][-1]['file']}"
+
+
+async def reduce_registry(
+    runtime: ModelRuntime,
+    semaphore: asyncio.Semaphore,
+    args: argparse.Namespace,
+    messages: list[ChatCompletionMessageParam],
+    registry_format: dict[str, Any] | None,
+    label: str,
+    inputs: list[Path] | None = None,
+) -> dict:
+    """One leaf or merge call; returns the renumbered partial registry."""
+
+    async def call(request: dict[str, Any]) -> Any:
+        return await runtime.acomplete(request, inputs=inputs or [])
+
+    async with semaphore:
+        logging.info(f"Reducing {label}")
+        try:
+            return await acomplete_repaired(
+                call,
+                completion_request(args, messages, registry_format),
+                lambda r: renumber(parse_registry(response_text(r))),
+                args.repair_retries,
+                label,
+            )
+        except ValueError as exc:
+            raise ValueError(f"{label}: {exc}") from exc
+
+
+async def reduce_tree(
+    runtime: ModelRuntime,
+    semaphore: asyncio.Semaphore,
+    args: argparse.Namespace,
+    reducer_prompt: str,
+    merge_prompt: str,
+    registry_format: dict[str, Any] | None,
+    leaves: list[list[dict]],
+) -> dict:
+    """Reduce both halves concurrently, then merge them."""
+    if len(leaves) == 1:
+        return await reduce_registry(
+            runtime,
+            semaphore,
+            args,
+            leaf_messages(reducer_prompt, leaves[0]),
+            registry_format,
+            f"leaf {leaf_label(leaves)}",
+            artifact_paths(args, leaves[0]),
+        )
+    mid = (len(leaves) + 1) // 2
+    left, right = await asyncio.gather(
+        reduce_tree(
+            runtime,
+            semaphore,
+            args,
+            reducer_prompt,
+            merge_prompt,
+            registry_format,
+            leaves[:mid],
+        ),
+        reduce_tree(
+            runtime,
+            semaphore,
+            args,
+            reducer_prompt,
+            merge_prompt,
+            registry_format,
+            leaves[mid:],
+        ),
+    )
+    return await reduce_registry(
+        runtime,
+        semaphore,
+        args,
+        merge_messages(merge_prompt, left, right),
+        registry_format,
+        f"merge {leaf_label(leaves)}",
+    )
+
+
+async def tree_reduce(
+    args: argparse.Namespace,
+    reducer_prompt: str,
+    merge_prompt: str,
+    registry_format: dict[str, Any] | None,
+    leaves: list[list[dict]],
+) -> dict:
+    runtime = ModelRuntime(args)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        return await reduce_tree(
+            runtime,
+            semaphore,
+            args,
+            reducer_prompt,
+            merge_prompt,
+            registry_format,
+            leaves,
+        )
+    finally:
+        await runtime.aclose()
+
+
+def reduce_as_tree(
+    args: argparse.Namespace, reducer_prompt: str, artifacts: list[dict]
+) -> None:
+    if not args.merge_prompt:
+        sys.exit("--leaf-size requires --merge-prompt")
+    merge_prompt = read_text(Path(args.merge_prompt))
+
+    artifacts = sorted(artifacts, key=lambda a: a["file"])
+    leaves = [
+        artifacts[k : k + args.leaf_size]
+        for k in range(0, len(artifacts), args.leaf_size)
+    ]
+
     if args.dry_run:
-        print("Dry run mode enabled. Request payload:\n")
+        print(
+            f"Dry run: tree reduction of {len(artifacts)} artifacts in "
+            f"{len(leaves)} leaves of up to {args.leaf_size}, "
+            f"{len(leaves) - 1} pairwise merges"
+        )
         print(f"Model: {args.model}")
-        if args.seed is not None:
-            print(f"Seed: {args.seed}")
-        print(json.dumps(messages, indent=2, ensure_ascii=False))
+        for leaf in leaves:
+            tokens = estimate_messages(leaf_messages(reducer_prompt, leaf))
+            print(
+                f"  leaf {leaf_label([leaf])}: {len(leaf)} artifacts, ~{tokens} tokens"
+            )
         return
 
-    client = openai.OpenAI()
-
-    logging.info(f"Calling model {args.model}...")
+    if not args.llm_cache:
+        logging.warning("No --llm-cache: partial registries will not be reused")
+    # Partial and merged registries have the reducer prompt's shape
+    registry_format = output_format(args, "primitives_registry", reducer_prompt)
+    logging.info(
+        f"Tree reduction of {len(artifacts)} artifacts in {len(leaves)} leaves "
+        f"with model {args.model}"
+    )
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0,
-            seed=args.seed,
+        registry = asyncio.run(
+            tree_reduce(args, reducer_prompt, merge_prompt, registry_format, leaves)
         )
+    except ValueError as exc:
+        sys.exit(f"Tree reduction failed: {exc}")
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
 
-    content = response.choices[0].message.content
+    registry = renumber(registry)
+    registry["registry_version"] = registry.get("registry_version") or "v0"
+    registry["generated_at"] = datetime.now(tz=timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+    write_registry(Path(args.output), registry, artifacts)
+
+
+# -------------------------
+# Incremental update
+# -------------------------
+
+
+def artifact_file(instance: Any) -> str:
+    ref = instance.get("artifact_ref") if isinstance(instance, dict) else None
+    return str(ref or "").partition("#")[0]
+
+
+def known_sources(registry: dict) -> dict[str, str]:
+    """
+    The artifact file -> hash map the registry was derived from. Registries
+    written before "sources" was recorded fall back to their artifact_refs
+    (which miss artifacts that produced no instance).
+    """
+    sources = registry.get("sources")
+    if isinstance(sources, dict):
+        return {str(k): str(v) for k, v in sources.items()}
+    derived: dict[str, str] = {}
+    for primitive in registry["primitives"]:
+        for instance in primitive.get("concrete_instances") or []:
+            file, _, digest = str(instance.get("artifact_ref", "")).partition("#")
+            if file and digest:
+                derived[file] = digest
+    return derived
+
+
+def drop_sources(registry: dict, files: set[str]) -> list[str]:
+    """
+    Remove the instances that cite `files`, dropping primitives left without
+    any. Returns the IDs of the dropped primitives.
+    """
+    kept, dropped = [], []
+    for primitive in registry["primitives"]:
+        instances = primitive.get("concrete_instances") or []
+        remaining = [i for i in instances if artifact_file(i) not in files]
+        if instances and not remaining:
+            dropped.append(str(primitive.get("primitive_id")))
+            continue
+        kept.append({**primitive, "concrete_instances": remaining})
+    registry["primitives"] = kept
+    return dropped
+
+
+def update_messages(
+    update_prompt: str, registry: dict, artifacts: list[dict]
+) -> list[ChatCompletionMessageParam]:
+    digest = [{k: p.get(k) for k in DIGEST_FIELDS} for p in registry["primitives"]]
+    return [
+        {
+            "role": "system",
+            "content": update_prompt,
+        },
+        {
+            "role": "user",
+            "content": f"""## Current Primitives
+
+{json.dumps(digest, indent=2, ensure_ascii=False)}
+
+""",
+        },
+        {
+            "role": "user",
+            "content": f"""## New or Changed Governance Artifacts
+
+{json.dumps(artifacts, indent=2, ensure_ascii=False)}
+
+""",
+        },
+    ]
+
+
+def apply_update(registry: dict, content: str | None) -> tuple[int, int]:
+    """
+    Apply the model's merges and additions to the registry. Raises
+    ValueError (leaving the registry untouched) if the update is malformed
+    or merges into an unknown primitive. Returns (merged, added) counts.
+    """
     if not content:
-        sys.exit("Model returned empty output")
+        raise ValueError("Model returned empty output")
+    try:
+        update = json.loads(clean_output(content, "json"))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Model output is not valid JSON: {exc}") from exc
+    if not isinstance(update, dict):
+        raise ValueError("Model output is not a JSON object")
+    merges = update.get("merges") or []
+    additions = update.get("additions") or []
+    if not isinstance(merges, list) or not isinstance(additions, list):
+        raise ValueError("merges and additions must be lists")
+
+    by_id = {p.get("primitive_id"): p for p in registry["primitives"]}
+    for merge in merges:
+        if not isinstance(merge, dict) or merge.get("primitive_id") not in by_id:
+            raise ValueError(f"merge into unknown primitive: {merge!r:.80}")
+        if not isinstance(merge.get("concrete_instances") or [], list):
+            raise ValueError(f"{merge['primitive_id']}: instances must be a list")
+    if not all(isinstance(a, dict) for a in additions):
+        raise ValueError("additions must be objects")
+
+    for merge in merges:
+        primitive = by_id[merge["primitive_id"]]
+        primitive.setdefault("concrete_instances", []).extend(
+            merge.get("concrete_instances") or []
+        )
+        if merge.get("level") == "abstract":
+            primitive["level"] = "abstract"
+
+    numbers = [
+        int(match.group(1))
+        for p in registry["primitives"]
+        if (match := re.fullmatch(r"PGP-(\d+)", str(p.get("primitive_id"))))
+    ]
+    next_number = max(numbers, default=0) + 1
+    for k, addition in enumerate(additions):
+        fields = {key: v for key, v in addition.items() if key != "primitive_id"}
+        registry["primitives"].append(
+            {"primitive_id": f"PGP-{next_number + k:03d}", **fields}
+        )
+    return len(merges), len(additions)
 
-    content = clean_output(content)
 
-    # Validate JSON strictly
+def update_registry(
+    args: argparse.Namespace, output_path: Path, artifacts: list[dict]
+) -> None:
+    if not args.update_prompt:
+        sys.exit("--update requires --update-prompt")
     try:
-        registry = json.loads(content)
+        registry = json.loads(read_text(output_path))
     except json.JSONDecodeError:
-        logging.exception("Model output is not valid JSON")
+        logging.exception(f"Invalid JSON in {output_path}")
         sys.exit(1)
+    if not isinstance(registry, dict) or not isinstance(
+        registry.get("primitives"), list
+    ):
+        sys.exit(f"{output_path} is not a primitives registry")
+
+    sources = known_sources(registry)
+    current = {a["file"] for a in artifacts}
+    changed = [a for a in artifacts if sources.get(a["file"]) != a["hash"]]
+    removed = sorted(set(sources) - current)
+    stale = {a["file"] for a in changed if a["file"] in sources} | set(removed)
+    dropped = drop_sources(registry, stale)
+    logging.info(
+        f"Registry {output_path}: {len(registry['primitives'])} primitives; "
+        f"{len(changed)} new or changed artifacts, {len(removed)} removed"
+        + (f"; dropped {', '.join(dropped)} (no evidence left)" if dropped else "")
+    )
+
+    if changed:
+        update_prompt = read_text(Path(args.update_prompt))
+        messages = update_messages(update_prompt, registry, changed)
+        if args.dry_run:
+            print("Dry run mode enabled. Update request payload:\n")
+            print(f"Model: {args.model}")
+            if args.seed is not None:
+                print(f"Seed: {args.seed}")
+            print(json.dumps(messages, indent=2, ensure_ascii=False))
+            return
+
+        logging.info(
+            f"Calling model {args.model} for {len(changed)} artifacts "
+            f"(~{estimate_messages(messages)} tokens)..."
+        )
+        # The update template's empty instance lists take the registry's shape
+        update_format = output_format(
+            args,
+            "primitives_update",
+            update_prompt,
+            (read_text(Path(args.prompt)),),
+        )
+        inputs = artifact_paths(args, changed)
+        runtime = ModelRuntime(args)
+        try:
+            # apply_update() validates before it mutates, so a rejected
+            # update leaves the registry as it was for the repair
+            merged, added = complete_repaired(
+                lambda r: runtime.complete(r, inputs=inputs),
+                completion_request(args, messages, update_format),
+                lambda r: apply_update(registry, response_text(r)),
+                args.repair_retries,
+                "Update",
+            )
+        except ValueError:
+            logging.exception("Invalid update from model")
+            sys.exit(1)
+        except Exception:
+            logging.exception("API call failed")
+            sys.exit(1)
+        finally:
+            runtime.close()
+        logging.info(f"Added instances to {merged} primitives, {added} new primitives")
+    elif args.dry_run:
+        print("Dry run: no new or changed artifacts; registry would only be rewritten")
+        return
+
+    registry["generated_at"] = datetime.now(tz=timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+    write_registry(output_path, registry, artifacts)
 
-    # Write output
+
+# -------------------------
+# Main
+# -------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prompt governance primitives reducer")
+    parser.add_argument(
+        "--prompt",
+        required=True,
+        help="Second-order reducer prompt (Markdown)",
+    )
+    parser.add_argument(
+        "--inputs",
+        required=True,
+        nargs="+",
+        help="Governance extraction JSON files (glob supported by shell)",
+    )
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="Output primitives registry JSON file",
+    )
+    parser.add_argument(
+        "--leaf-size",
+        type=int,
+        help="Tree reduction: artifacts per leaf request (default: one request); "
+        "applies to full reductions, not --update",
+    )
+    parser.add_argument(
+        "--merge-prompt",
+        help="Tree reduction: partial registry merge prompt (Markdown)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Tree reduction: maximum concurrent model calls (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Extend the registry at --output with new or changed artifacts only",
+    )
+    parser.add_argument(
+        "--update-prompt",
+        help="Incremental update prompt (Markdown), required with --update",
+    )
+    add_structured_arguments(parser)
+    args = parser.parse_args()
+    if args.leaf_size is not None and args.leaf_size < 1:
+        parser.error("--leaf-size must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    setup_logging(args.verbose)
+
+    prompt_path = Path(args.prompt)
+    input_paths = [Path(p) for p in args.inputs]
+    output_path = Path(args.output)
+
+    reducer_prompt = read_text(prompt_path)
+    artifacts = load_artifacts(input_paths)
+
+    logging.info(f"Loaded {len(artifacts)} governance artifacts")
+
+    if args.update:
+        if output_path.exists():
+            update_registry(args, output_path, artifacts)
+            return
+        logging.info(f"No registry at {output_path} yet; reducing all artifacts")
+
+    if args.leaf_size:
+        reduce_as_tree(args, reducer_prompt, artifacts)
+        return
+
+    messages = reduction_messages(reducer_prompt, artifacts)
+
+    if args.dry_run:
+        print("Dry run mode enabled. Request payload:\n")
+        print(f"Model: {args.model}")
+        if args.seed is not None:
+            print(f"Seed: {args.seed}")
+        print(json.dumps(messages, indent=2, ensure_ascii=False))
+        return
+
+    logging.info(f"Calling model {args.model}...")
+    request = completion_request(
+        args, messages, output_format(args, "primitives_registry", reducer_prompt)
+    )
+    runtime = ModelRuntime(args)
     try:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(
-            json.dumps(registry, indent=2, ensure_ascii=False),
-            encoding="utf-8",
+        registry = complete_repaired(
+            lambda r: runtime.complete(r, inputs=input_paths),
+            request,
+            lambda r: parse_registry(response_text(r)),
+            args.repair_retries,
+            "Registry",
         )
-        print(f"Primitive registry written to {output_path}")
+    except ValueError:
+        logging.exception("Invalid model output")
+        sys.exit(1)
     except Exception:
-        logging.exception("Failed to write output")
+        logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
+
+    registry["generated_at"] = datetime.now(tz=timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+    write_registry(output_path, registry, artifacts)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["numpy"]
+# ///
+"""
+graph-benchmark.py
+
+Micro-benchmark: connected components on a random similarity graph with
+the old dict-of-set DFS (filename keys, a new set allocated per visit)
+versus the CSR SimilarityGraph in similarity_graph.py.
+
+Reports build/components wall time and peak traced memory for each, and
+checks that both find the same components.
+
+Usage:
+  uv run --locked graph-benchmark.py
+  uv run --locked graph-benchmark.py --nodes 200000 --edges 1000000 --threshold 0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Set, Tuple, TypeVar
+
+import numpy as np
+from similarity_graph import SimilarityGraph
+
+T = TypeVar("T")
+
+
+def random_edges(
+    nodes: int, edges: int, seed: int
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, nodes, size=edges, dtype=np.int32)
+    cols = rng.integers(0, nodes, size=edges, dtype=np.int32)
+    rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+    scores = np.round(rng.random(edges), 4)
+    docs = [f"assistant-{k}.mode.analysis.yaml" for k in range(nodes)]
+    return docs, rows, cols, scores
+
+
+def dict_of_set_components(
+    docs: List[str],
+    rows: np.ndarray,
+    cols: np.ndarray,
+    scores: np.ndarray,
+    threshold: float,
+) -> List[Set[str]]:
+    """The adjacency and DFS the clustering script used before CSR."""
+    graph: Dict[str, Set[str]] = {d: set() for d in docs}
+    for a, b, s in zip(rows.tolist(), cols.tolist(), scores.tolist()):
+        if s >= threshold:
+            graph[docs[a]].add(docs[b])
+            graph[docs[b]].add(docs[a])
+
+    visited: Set[str] = set()
+    clusters: List[Set[str]] = []
+    for node in graph:
+        if node in visited:
+            continue
+        stack = [node]
+        cluster = set()
+        while stack:
+            cur = stack.pop()
+            if cur in visited:
+                continue
+            visited.add(cur)
+            cluster.add(cur)
+            stack.extend(graph[cur] - visited)
+        clusters.append(cluster)
+    return clusters
+
+
+def csr_components(
+    docs: List[str],
+    rows: np.ndarray,
+    cols: np.ndarray,
+    scores: np.ndarray,
+    threshold: float,
+) -> List[np.ndarray]:
+    return SimilarityGraph.from_edges(docs, rows, cols, scores, threshold).components()
+
+
+def measure(fn: Callable[[], T]) -> Tuple[T, float, int]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+# -------------------------
+# Main
+# -------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark dict-of-set DFS against the CSR similarity graph"
+    )
+    parser.add_argument(
+        "--nodes", type=int, default=100_000, help="Node count (default: 100000)"
+    )
+    parser.add_argument(
+        "--edges", type=int, default=1_000_000, help="Edge count (default: 1000000)"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.0,
+        help="Keep edges with score >= threshold (default: 0.0)",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    docs, rows, cols, scores = random_edges(args.nodes, args.edges, args.seed)
+    logging.info(
+        f"Random graph: {args.nodes} nodes, {args.edges} edges, "
+        f"threshold {args.threshold}"
+    )
+
+    legacy, legacy_seconds, legacy_peak = measure(
+        lambda: dict_of_set_components(docs, rows, cols, scores, args.threshold)
+    )
+    csr, csr_seconds, csr_peak = measure(
+        lambda: csr_components(docs, rows, cols, scores, args.threshold)
+    )
+
+    legacy_sets = sorted(sorted(c) for c in legacy)
+    csr_sets = sorted(sorted(docs[k] for k in c.tolist()) for c in csr)
+    if legacy_sets != csr_sets:
+        logging.error("Component mismatch between dict-of-set and CSR graphs")
+        sys.exit(1)
+
+    print(f"\n{'':<14}{'time (s)':>10}{'peak (MiB)':>12}")
+    print(f"{'dict-of-set':<14}{legacy_seconds:>10.2f}{legacy_peak / 2**20:>12.1f}")
+    print(f"{'csr':<14}{csr_seconds:>10.2f}{csr_peak / 2**20:>12.1f}")
+    print(
+        f"\n{len(csr)} components; CSR is {legacy_seconds / csr_seconds:.1f}x faster "
+        f"and uses {legacy_peak / csr_peak:.1f}x less peak memory"
+    )
+
+
+if __name__ == "__main__":
+    main()
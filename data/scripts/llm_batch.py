@@ -0,0 +1,365 @@
+"""
+llm_batch.py
+
+Offline batch-job mode for the per-payload model scripts
+(system-prompt-analysis.py, governance-primitive-extract.py).
+
+Instead of one chat completion per payload, every request is written to a
+JSONL file in the OpenAI batch format, uploaded, submitted as one batch job
+(/v1/chat/completions, 24h completion window) and polled; results are then
+fanned back out to the script's normal per-payload outputs. Batch jobs
+trade latency for throughput and cost on full-archive reruns.
+
+All job state lives in the --batch directory, so an interrupted run (or a
+--batch-no-wait submission) resumes by rerunning the same command:
+
+  <dir>/job.json        {"version", "endpoint", "batch_id", "input_file_id",
+                         "status", "submitted", "history"}
+  <dir>/requests.jsonl  {"custom_id", "method", "url", "body"} per request
+  <dir>/output-<batch>.jsonl / errors-<batch>.jsonl   downloaded results
+
+- custom_id identifies a payload (its file name). "submitted" maps the
+  running batch's custom_ids to the response cache key of the request sent:
+  a rerun waits for those instead of resubmitting them, while a payload or
+  prompt that changed since is submitted again. Callers pass only requests
+  whose output is missing or stale, so finished work is never resent.
+- Requests already in the response cache are served from it and skipped;
+  batch results are added to the cache.
+- When a batch ends (completed, expired, failed, cancelled) with requests
+  still outstanding, the next run submits a new batch for just those.
+
+--base-url / OPENAI_BASE_URL may point at a local mock of the files and
+batches endpoints.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from llm_cache import request_key
+from llm_runtime import ModelRuntime
+from openai.types import Batch
+from openai.types.chat import ChatCompletion
+
+JOB_VERSION = 1
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+DEFAULT_POLL_INTERVAL = 60.0
+
+TERMINAL_STATUSES = {"completed", "expired", "failed", "cancelled"}
+
+
+class BatchRequest(NamedTuple):
+    custom_id: str
+    request: Dict[str, Any]
+    masked: Sequence[str] = ()
+    inputs: Sequence[Path] = ()
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        help="Submit all requests as one offline batch job, with resumable "
+        "job state in this directory",
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f"Seconds between batch status checks (default: {DEFAULT_POLL_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--batch-no-wait",
+        action="store_true",
+        help="Submit the batch and exit; rerun the same command to collect results",
+    )
+
+
+def expand_inputs(patterns: List[str]) -> List[Path]:
+    """Expand glob patterns (for when the shell did not), keeping order."""
+    paths: List[Path] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                sys.exit(f"No files match {pattern}")
+            paths.extend(Path(m) for m in matches)
+        else:
+            paths.append(Path(pattern))
+    return list(dict.fromkeys(paths))
+
+
+def is_up_to_date(input_path: Path, output_path: Path) -> bool:
+    """Whether output_path is at least as new as input_path, as make decides."""
+    return (
+        output_path.exists()
+        and output_path.stat().st_mtime >= input_path.stat().st_mtime
+    )
+
+
+def write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+class BatchJob:
+    def __init__(self, root: Path, requests: List[BatchRequest]) -> None:
+        self.root = root
+        self.state_path = root / "job.json"
+        self.requests = {r.custom_id: r for r in requests}
+        if len(self.requests) != len(requests):
+            raise ValueError("Batch custom_ids must be unique")
+        self.keys = {r.custom_id: request_key(r.request, r.masked) for r in requests}
+        self.finished: set[str] = set()
+
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            if self.state.get("version") != JOB_VERSION:
+                raise ValueError(f"{self.state_path}: unsupported job state version")
+        else:
+            self.state = {
+                "version": JOB_VERSION,
+                "endpoint": ENDPOINT,
+                "batch_id": None,
+                "input_file_id": None,
+                "status": None,
+                "submitted": {},
+                "history": [],
+            }
+
+    def save(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.state_path, self.state)
+
+    def in_flight(self, custom_id: str) -> bool:
+        return bool(self.state["batch_id"]) and (
+            self.state["submitted"].get(custom_id) == self.keys[custom_id]
+        )
+
+    @property
+    def outstanding(self) -> List[str]:
+        """Requests without a written output, including those in flight."""
+        return [cid for cid in self.requests if cid not in self.finished]
+
+    @property
+    def pending(self) -> List[str]:
+        """Outstanding requests not part of the running batch."""
+        return [cid for cid in self.outstanding if not self.in_flight(cid)]
+
+    def mark_done(self, custom_id: str) -> None:
+        self.finished.add(custom_id)
+
+    def write_requests(self, custom_ids: List[str]) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / "requests.jsonl"
+        with path.open("w", encoding="utf-8") as f:
+            for cid in custom_ids:
+                line = {
+                    "custom_id": cid,
+                    "method": "POST",
+                    "url": ENDPOINT,
+                    "body": self.requests[cid].request,
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return path
+
+    def submit(self, runtime: ModelRuntime, custom_ids: List[str]) -> None:
+        path = self.write_requests(custom_ids)
+        uploaded = runtime.call(
+            runtime.client.files.create,
+            file=(path.name, path.read_bytes()),
+            purpose="batch",
+        )
+        batch = runtime.call(
+            runtime.client.batches.create,
+            input_file_id=uploaded.id,
+            endpoint=ENDPOINT,
+            completion_window=COMPLETION_WINDOW,
+        )
+        self.state.update(
+            batch_id=batch.id,
+            input_file_id=uploaded.id,
+            status=batch.status,
+            submitted={cid: self.keys[cid] for cid in custom_ids},
+        )
+        self.state["history"].append(
+            {"batch_id": batch.id, "requests": len(custom_ids), "status": batch.status}
+        )
+        self.save()
+        logging.info(f"Submitted batch {batch.id} with {len(custom_ids)} requests")
+
+    def poll(self, runtime: ModelRuntime, interval: float, wait: bool) -> Batch:
+        """Refresh the batch status, waiting for a terminal one if `wait`."""
+        while True:
+            batch = runtime.call(
+                runtime.client.batches.retrieve, self.state["batch_id"]
+            )
+            if batch.status != self.state["status"]:
+                self.state["status"] = batch.status
+                self.state["history"][-1]["status"] = batch.status
+                self.save()
+            counts = batch.request_counts
+            progress = (
+                f" ({counts.completed}/{counts.total} completed, {counts.failed} failed)"
+                if counts
+                else ""
+            )
+            logging.info(f"Batch {batch.id}: {batch.status}{progress}")
+            if batch.status in TERMINAL_STATUSES or not wait:
+                return batch
+            time.sleep(interval)
+
+    def download(
+        self, runtime: ModelRuntime, file_id: Optional[str], name: str
+    ) -> List[Dict[str, Any]]:
+        """Fetch a result file once (kept on disk for resumed runs) and parse it."""
+        if not file_id:
+            return []
+        path = self.root / f"{name}-{self.state['batch_id']}.jsonl"
+        if not path.exists():
+            content = runtime.call(runtime.client.files.content, file_id)
+            tmp = path.with_name(f".{path.name}.tmp")
+            tmp.write_bytes(content.read())
+            tmp.replace(path)
+        lines = path.read_text(encoding="utf-8").splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def record(
+        self,
+        runtime: ModelRuntime,
+        custom_id: Optional[str],
+        outcome: str,
+        latency: Optional[float],
+        response: Optional[ChatCompletion] = None,
+    ) -> None:
+        item = self.requests.get(custom_id or "")
+        if item is None:
+            return
+        runtime.record_call(
+            item.request,
+            item.masked,
+            self.keys[item.custom_id],
+            "batch",
+            outcome,
+            latency,
+            item.inputs,
+            response,
+        )
+
+    def collect(
+        self,
+        runtime: ModelRuntime,
+        batch: Batch,
+        finish: Callable[[str, ChatCompletion], bool],
+    ) -> None:
+        # Batch results have no per-request latency; use the batch's own
+        latency = (
+            float(batch.completed_at - batch.created_at)
+            if batch.completed_at and batch.created_at
+            else None
+        )
+        for line in self.download(runtime, batch.error_file_id, "errors"):
+            error = line.get("error") or line.get("response", {}).get("body")
+            logging.error(f"{line.get('custom_id')}: batch request failed: {error}")
+            self.record(runtime, line.get("custom_id"), "error", latency)
+        for line in self.download(runtime, batch.output_file_id, "output"):
+            cid = line.get("custom_id")
+            # Skip results for requests that are finished or changed since
+            if cid not in self.requests or not self.in_flight(cid):
+                continue
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                logging.error(
+                    f"{cid}: batch request failed: "
+                    f"{line.get('error') or response.get('body')}"
+                )
+                self.record(runtime, cid, "error", latency)
+                continue
+            completion = runtime.usage.record(
+                ChatCompletion.model_validate(response["body"])
+            )
+            self.record(runtime, cid, "ok", latency, completion)
+            if finish(cid, completion):
+                if runtime.cache:
+                    runtime.cache.store(
+                        self.keys[cid], self.requests[cid].request, completion
+                    )
+                self.mark_done(cid)
+        # The batch is finished; outstanding requests go into a new one next run
+        self.state.update(batch_id=None, input_file_id=None, status=None, submitted={})
+        self.save()
+
+
+def run_batch_job(
+    args: argparse.Namespace,
+    runtime: ModelRuntime,
+    requests: List[BatchRequest],
+    finish: Callable[[str, ChatCompletion], bool],
+) -> int:
+    """
+    Serve `requests` through a resumable batch job in args.batch, calling
+    finish(custom_id, response) for each result (it writes the output and
+    returns False if the response is unusable). Returns the number of
+    requests left outstanding by a finished batch (0 when a --batch-no-wait
+    batch is still running).
+    """
+    try:
+        job = BatchJob(args.batch, requests)
+    except (ValueError, json.JSONDecodeError) as exc:
+        sys.exit(str(exc))
+
+    # Serve what we can from the response cache first
+    if runtime.cache:
+        for cid in job.pending:
+            item = job.requests[cid]
+            _, cached = runtime.lookup(item.request, item.masked, "batch", item.inputs)
+            if cached is not None and finish(cid, cached):
+                job.mark_done(cid)
+
+    outstanding = job.outstanding
+    pending = job.pending
+    logging.info(
+        f"Batch job {args.batch}: {len(requests)} requests, "
+        f"{len(requests) - len(outstanding)} from the response cache, "
+        f"{len(outstanding) - len(pending)} in flight, {len(pending)} to submit"
+    )
+    if not outstanding:
+        job.save()
+        return 0
+
+    if args.dry_run:
+        if pending:
+            path = job.write_requests(pending)
+            print(f"Dry run: Would submit {len(pending)} requests from {path}")
+        if job.state["batch_id"]:
+            print(f"Dry run: Would poll batch {job.state['batch_id']}")
+        return 0
+
+    if job.state["batch_id"]:
+        logging.info(f"Resuming batch {job.state['batch_id']}")
+    else:
+        job.submit(runtime, pending)
+
+    batch = job.poll(runtime, args.batch_poll_interval, wait=not args.batch_no_wait)
+    if batch.status not in TERMINAL_STATUSES:
+        logging.info("Batch running; rerun the same command to collect results")
+        return 0
+
+    job.collect(runtime, batch, finish)
+    remaining = len(job.outstanding)
+    if remaining:
+        logging.warning(
+            f"{remaining} requests outstanding after batch {batch.id} ({batch.status}); "
+            "rerun to submit them"
+        )
+    return remaining
@@ -0,0 +1,258 @@
+"""
+llm_cache.py
+
+Content-addressed on-disk cache of chat-completion responses, shared by
+the model-calling scripts.
+
+A response is stored under the SHA-256 of the canonical JSON of its request
+parameters (model, messages, seed, temperature and any other keyword sent),
+so an identical request is served from disk instead of the API no matter
+which script or Makefile run issues it:
+
+  <root>/<key[:2]>/<key>.json   {"key", "created", "model", "response"}
+
+- Eviction: entries older than --llm-cache-max-age-days are dropped, then
+  least-recently-used entries until the cache fits --llm-cache-max-mb.
+  Hits refresh an entry's mtime, which is the LRU clock.
+- --llm-cache-read-only serves hits but never writes, refreshes or evicts
+  (for CI, where the cache is a fixture); misses still call the API.
+- Hit/miss/write/eviction counts are logged at the end of each run.
+
+The client is only used on a miss, so fully cached runs need no API key.
+Point OPENAI_BASE_URL at a local stub server to exercise misses offline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from openai.types.chat import ChatCompletion
+
+CACHE_VERSION = 1
+
+# Replaces masked values (see request_key) before hashing
+MASK = "<masked>"
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--llm-cache",
+        type=Path,
+        help="Directory of cached model responses (disabled if omitted)",
+    )
+    parser.add_argument(
+        "--llm-cache-read-only",
+        action="store_true",
+        help="Serve cached responses but never write or evict (e.g. in CI)",
+    )
+    parser.add_argument(
+        "--llm-cache-max-mb",
+        type=float,
+        help="Evict least-recently-used responses beyond this size",
+    )
+    parser.add_argument(
+        "--llm-cache-max-age-days",
+        type=float,
+        help="Evict responses older than this many days",
+    )
+
+
+def request_key(request: Dict[str, Any], masked: Sequence[str] = ()) -> str:
+    """
+    SHA-256 of the canonical JSON of a request. Strings in `masked` (values
+    that vary without changing the answer, such as a file mtime stamped
+    into a message) are replaced in message contents before hashing.
+    """
+    canonical = dict(request)
+    if masked:
+        messages = []
+        for message in request.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, str):
+                for value in masked:
+                    content = content.replace(value, MASK)
+                message = {**message, "content": content}
+            messages.append(message)
+        canonical["messages"] = messages
+    encoded = json.dumps(
+        {"version": CACHE_VERSION, "request": canonical},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        root: Path,
+        read_only: bool = False,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+    ) -> None:
+        self.root = root
+        self.read_only = read_only
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evicted = 0
+        if not read_only:
+            root.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> Optional["ResponseCache"]:
+        if not args.llm_cache:
+            return None
+        return cls(
+            args.llm_cache,
+            read_only=args.llm_cache_read_only,
+            max_bytes=(
+                int(args.llm_cache_max_mb * 2**20) if args.llm_cache_max_mb else None
+            ),
+            max_age_seconds=(
+                args.llm_cache_max_age_days * 86400
+                if args.llm_cache_max_age_days
+                else None
+            ),
+        )
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _expired(self, created: float) -> bool:
+        return (
+            self.max_age_seconds is not None
+            and time.time() - created > self.max_age_seconds
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring corrupt response cache entry {path}")
+            self.misses += 1
+            return None
+        if entry.get("version") != CACHE_VERSION or self._expired(entry["created"]):
+            self.misses += 1
+            return None
+        if not self.read_only:
+            os.utime(path)
+        self.hits += 1
+        return entry["response"]
+
+    def put(self, key: str, model: str, response: Dict[str, Any]) -> None:
+        if self.read_only:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "version": CACHE_VERSION,
+                    "key": key,
+                    "created": time.time(),
+                    "model": model,
+                    "response": response,
+                },
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+        tmp.replace(path)
+        self.writes += 1
+
+    def lookup(
+        self, request: Dict[str, Any], masked: Sequence[str] = ()
+    ) -> tuple[str, Optional[ChatCompletion]]:
+        """Return (key, cached response or None) for a request."""
+        key = request_key(request, masked)
+        cached = self.get(key)
+        if cached is None:
+            logging.debug(f"Response cache miss {key[:12]}")
+            return key, None
+        logging.debug(f"Response cache hit {key[:12]}")
+        return key, ChatCompletion.model_validate(cached)
+
+    def store(
+        self, key: str, request: Dict[str, Any], response: ChatCompletion
+    ) -> None:
+        self.put(key, request["model"], response.model_dump(mode="json"))
+
+    def evict(self) -> None:
+        """
+        Drop entries written more than max_age ago, then least-recently-used
+        entries (by mtime) until the cache fits max_bytes.
+        """
+        if self.read_only or (self.max_bytes is None and self.max_age_seconds is None):
+            return
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            expired = False
+            if self.max_age_seconds is not None:
+                try:
+                    entry = json.loads(path.read_text(encoding="utf-8"))
+                    expired = self._expired(entry["created"])
+                except (OSError, ValueError, KeyError):
+                    expired = True
+            if expired or (self.max_bytes is not None and total > self.max_bytes):
+                path.unlink(missing_ok=True)
+                total -= size
+                self.evicted += 1
+
+    def close(self) -> None:
+        """Apply eviction limits and log statistics at the end of a run."""
+        self.evict()
+        self.log_stats()
+
+    def log_stats(self) -> None:
+        logging.info(
+            f"Response cache {self.root}: {self.hits} hits, {self.misses} misses, "
+            f"{self.writes} writes, {self.evicted} evicted"
+            + (" (read-only)" if self.read_only else "")
+        )
+
+
+def cached_completion(
+    cache: Optional[ResponseCache],
+    request: Dict[str, Any],
+    create: Callable[..., ChatCompletion],
+    masked: Sequence[str] = (),
+) -> ChatCompletion:
+    """
+    Return the cached response for `request`, or call create(**request)
+    (e.g. ModelRuntime.create) and cache the result.
+    """
+    key = ""
+    if cache:
+        key, cached = cache.lookup(request, masked)
+        if cached is not None:
+            return cached
+
+    response = create(**request)
+    if cache:
+        cache.store(key, request, response)
+    return response
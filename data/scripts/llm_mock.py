@@ -0,0 +1,997 @@
+"""
+llm_mock.py
+
+A local OpenAI-compatible stand-in for the model API, so the LLM stages
+can be run, timed and stressed offline (scripts/mock-model-server.py runs
+it standalone, scripts/pipeline-benchmark.py drives the Makefile against
+it).
+
+Endpoints (under any prefix, e.g. http://127.0.0.1:8765/v1):
+
+- POST /chat/completions, plain or streamed (SSE, usage in the last chunk)
+- POST /files, GET /files/{id}/content
+- POST /batches, GET /batches/{id}: a batch completes --batch-delay
+  seconds after it is created
+- GET /mock/stats: per-stage request, fault and token counts, peak
+  concurrency
+
+Responses:
+
+- --replay DIR serves the responses of an earlier live run from its
+  response cache (llm_cache.py) by request key. Keys masked by the script
+  (capture timestamps) are matched by masking ISO-8601 timestamps in the
+  request; a miss is synthesized.
+- Otherwise a response is synthesized for the request's stage: the prompt
+  file (--prompts) whose text is the system message. Normalization gets a
+  YAML analysis with every section of the schema in the request (enum
+  fields take one of their values), extraction a JSON artifact of the
+  prompt's template with clauses quoted from the payload, the registry
+  stages a registry (or update) derived from the artifacts in the
+  request, family extraction the families CSV, and every other stage
+  Markdown. Content is seeded by the request, so a repeated request gets
+  the same answer. A request with a JSON response_format (structured
+  output) gets the same record as bare JSON, without a code fence; an
+  analysis is converted from YAML.
+
+Timing and faults:
+
+- --latency DIST is the time to first token; DIST is const:S,
+  uniform:LO:HI or lognormal:MEDIAN:SIGMA (seconds). --token-rate adds
+  generation time per completion token (0: none); streams are paced.
+- --error-rate P answers that share of requests with a fault drawn from
+  --faults (weights of 429, 5xx codes, "reset" to drop the connection and
+  "malformed" for a 200 whose content has the wrong shape). 429s carry
+  Retry-After: --retry-after.
+- --max-inflight N answers 429 to requests beyond N in flight, like a
+  provider's concurrency limit.
+
+Imported by the scripts in this directory; not intended to be run directly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import email.parser
+import email.policy
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import yaml
+from analysis_schema import ITEM, comment_enums
+from llm_cache import ResponseCache, request_key
+from token_budget import estimate_messages, estimate_tokens
+
+DEFAULT_PROMPTS = Path(__file__).resolve().parent.parent / "prompts"
+DEFAULT_FAULTS = "429=3,500=1,503=1,reset=1"
+
+ISO_TIMESTAMP = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ")
+FENCED_SECTION = re.compile(
+    r"^## (.+?)\n\n```\w*\n(.*?)\n```$", re.MULTILINE | re.DOTALL
+)
+FENCED_REPLY = re.compile(r"\A```(\w*)\n(.*)\n```\s*\Z", re.DOTALL)
+JSON_SECTION = re.compile(r"^## (.+?)\n\n([\[{].*?^[\]}])$", re.MULTILINE | re.DOTALL)
+WORD = re.compile(r"[A-Za-z][a-z]{3,}")
+ANALYSIS_FILE = re.compile(r"[\w.-]+\.analysis\.yaml")
+
+FALLBACK_WORDS = "agent tool user policy scope sandbox approval output".split()
+
+# Allowed registry classification values (governance-primitives-reducer)
+RISK_CLASSES = [
+    "workspace_integrity",
+    "epistemic_error",
+    "overreach",
+    "malicious_use",
+    "instruction_leakage",
+    "autonomy_drift",
+]
+MITIGATION_TARGETS = ["user", "model", "tooling", "process", "environment"]
+
+FAMILIES_HEADER = [
+    "family_id",
+    "band_range",
+    "threshold_used",
+    "family_label",
+    "confidence",
+    "family_size",
+    "avg_weighted_similarity",
+    "members",
+]
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--prompts",
+        type=Path,
+        default=DEFAULT_PROMPTS,
+        help="Prompt directory used to tell the stages apart (default: prompts/)",
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        help="Response cache directory of a live run to replay (misses are synthesized)",
+    )
+    parser.add_argument(
+        "--latency",
+        default="const:0.05",
+        help="Time-to-first-token distribution: const:S, uniform:LO:HI or "
+        "lognormal:MEDIAN:SIGMA (default: const:0.05)",
+    )
+    parser.add_argument(
+        "--token-rate",
+        type=float,
+        default=0.0,
+        help="Completion tokens generated per second (default: 0, instant)",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with a fault (default: 0)",
+    )
+    parser.add_argument(
+        "--faults",
+        default=DEFAULT_FAULTS,
+        help=f"Fault weights: HTTP status codes, reset, malformed (default: {DEFAULT_FAULTS})",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1.0,
+        help="Retry-After seconds sent with a 429 (default: 1)",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=0,
+        help="Answer 429 beyond this many concurrent requests (default: 0, no limit)",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=2.0,
+        help="Seconds until a batch job completes (default: 2)",
+    )
+    parser.add_argument(
+        "--mock-seed",
+        type=int,
+        default=0,
+        help="Seed of the fault and latency draws (default: 0)",
+    )
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """Raises ValueError on an unknown or malformed distribution spec."""
+    name, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(":")] if params else []
+    except ValueError as exc:
+        raise ValueError(f"invalid distribution {spec!r}") from exc
+    if name == "const" and len(values) == 1:
+        return lambda rng: values[0]
+    if name == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(
+        f"invalid distribution {spec!r} (const:S, uniform:LO:HI, lognormal:MEDIAN:SIGMA)"
+    )
+
+
+def parse_faults(spec: str) -> Dict[str, float]:
+    """Raises ValueError on an unknown fault or a bad weight."""
+    faults: Dict[str, float] = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        fault, _, weight = item.partition("=")
+        if not (fault.isdigit() or fault in {"reset", "malformed"}):
+            raise ValueError(f"unknown fault {fault!r}")
+        try:
+            faults[fault] = float(weight or 1)
+        except ValueError as exc:
+            raise ValueError(f"invalid weight in {item!r}") from exc
+    return faults
+
+
+# -------------------------
+# Request contents
+# -------------------------
+
+
+def request_sections(messages: List[Dict[str, Any]]) -> Dict[str, str]:
+    """'## Title' sections of the user messages: fenced bodies and bare JSON."""
+    sections: Dict[str, str] = {}
+    for message in messages:
+        content = message.get("content")
+        if message.get("role") != "user" or not isinstance(content, str):
+            continue
+        for pattern in (FENCED_SECTION, JSON_SECTION):
+            for match in pattern.finditer(content):
+                sections.setdefault(match.group(1).strip(), match.group(2))
+    return sections
+
+
+def section(sections: Dict[str, str], prefix: str) -> Optional[str]:
+    return next((v for k, v in sections.items() if k.startswith(prefix)), None)
+
+
+def section_json(sections: Dict[str, str], prefix: str) -> Any:
+    body = section(sections, prefix)
+    if body is None:
+        return None
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError:
+        return None
+
+
+def strings_in(node: Any) -> List[str]:
+    if isinstance(node, str):
+        return [node]
+    if isinstance(node, dict):
+        node = list(node.values())
+    if isinstance(node, list):
+        return [s for item in node for s in strings_in(item)]
+    return []
+
+
+class Material:
+    """Words and quotable lines of a request, for seeded synthesis."""
+
+    def __init__(self, messages: List[Dict[str, Any]], rng: random.Random) -> None:
+        self.rng = rng
+        self.sections = request_sections(messages)
+        payload = section_json(self.sections, "Invocation Payload")
+        if payload is None:
+            payload = section_json(self.sections, "Prompt Payload")
+        text = "\n".join(strings_in(payload)) if payload is not None else ""
+        if not text:
+            text = "\n".join(
+                m["content"]
+                for m in messages
+                if m.get("role") == "user" and isinstance(m.get("content"), str)
+            )
+        self.words = list(dict.fromkeys(w.lower() for w in WORD.findall(text)))[:2000]
+        self.words = self.words or FALLBACK_WORDS
+        self.lines = [
+            (n, line.strip())
+            for n, line in enumerate(text.splitlines(), start=1)
+            if 30 <= len(line.strip()) <= 200
+        ]
+
+    def phrase(self, low: int = 3, high: int = 8) -> str:
+        return " ".join(self.rng.choices(self.words, k=self.rng.randint(low, high)))
+
+    def clauses(self, most: int = 2) -> List[Dict[str, str]]:
+        picked = self.rng.sample(
+            self.lines, min(len(self.lines), self.rng.randint(0, most))
+        )
+        return [{"quote": line, "location": f"line_{n}"} for n, line in sorted(picked)]
+
+
+# -------------------------
+# Per-stage synthesis
+# -------------------------
+
+
+def fill_schema(
+    node: Any,
+    material: Material,
+    enums: Dict[Tuple[str, ...], FrozenSet[str]],
+    path: Tuple[str, ...] = (),
+) -> Any:
+    if isinstance(node, dict):
+        return {
+            k: fill_schema(v, material, enums, path + (str(k),))
+            for k, v in node.items()
+        }
+    if isinstance(node, list):
+        if not node:
+            return []
+        return [
+            fill_schema(node[0], material, enums, path + (ITEM,))
+            for _ in range(material.rng.randint(1, 3))
+        ]
+    if node == "string" and path in enums:
+        return material.rng.choice(sorted(enums[path]))
+    if node == "string":
+        return material.phrase()
+    if node == "boolean":
+        return material.rng.random() < 0.5
+    if node == "integer":
+        return material.rng.randint(1, 5)
+    return node
+
+
+def synthesize_analysis(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    schema_text = section(material.sections, "Normalization Schema") or "{}"
+    schema = yaml.safe_load(schema_text)
+    if not isinstance(schema, dict):
+        schema = {}
+    enums = comment_enums(schema_text)
+    analysis = {
+        k: v if k == "schema" else fill_schema(v, material, enums, (k,))
+        for k, v in schema.items()
+    }
+    capture = section_json(material.sections, "Capture Metadata")
+    if isinstance(analysis.get("metadata"), dict) and isinstance(capture, dict):
+        analysis["metadata"]["capture"] = capture
+    return "```yaml\n" + yaml.safe_dump(analysis, sort_keys=False) + "```\n"
+
+
+# Artifact template fields filled from the request's capture metadata
+CAPTURE_FIELDS = {
+    "assistant": "assistant_name",
+    "mode": "mode_name",
+    "source.file": "source_file",
+    "source.hash": "source_hash",
+    "source.extracted_at": "timestamp",
+}
+
+
+def fill_artifact(
+    node: Any, path: str, capture: Dict[str, Any], material: Material
+) -> Any:
+    if isinstance(node, dict):
+        return {
+            k: fill_artifact(v, f"{path}.{k}" if path else k, capture, material)
+            for k, v in node.items()
+        }
+    if isinstance(node, list):
+        if path.endswith("verbatim_clauses"):
+            return material.clauses()
+        return [fill_artifact(v, path, capture, material) for v in node]
+    if isinstance(node, bool):
+        return material.rng.random() < 0.3
+    if isinstance(node, str) and path in CAPTURE_FIELDS:
+        return str(capture.get(CAPTURE_FIELDS[path], ""))
+    return node
+
+
+def synthesize_artifact(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    template: Any = {}
+    match = re.search(r"```json\n(.*?)\n```", system, re.DOTALL)
+    if match:
+        try:
+            template = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            template = {}
+    if not isinstance(template, dict) or not template:
+        template = {"assistant": "", "mode": "", "source": {"file": "", "hash": ""}}
+    capture = section_json(material.sections, "Capture Metadata") or {}
+    artifact = fill_artifact(template, "", capture, material)
+    return "```json\n" + json.dumps(artifact, indent=2) + "\n```\n"
+
+
+def clause_groups(artifact: Dict[str, Any]) -> List[Tuple[str, str, List[Any]]]:
+    """(axis, primitive name, clauses) for every non-empty verbatim_clauses."""
+    groups = []
+
+    def walk(node: Any, path: List[str]) -> None:
+        if not isinstance(node, dict):
+            return
+        clauses = node.get("verbatim_clauses")
+        if isinstance(clauses, list) and clauses and path:
+            groups.append((path[0], " / ".join(path), clauses))
+        for key, value in node.items():
+            walk(value, path + [key])
+
+    for axis, value in artifact.items():
+        if axis not in {"assistant", "mode", "source"}:
+            walk(value, [axis])
+    return groups
+
+
+def artifact_instance(artifact: Dict[str, Any], clauses: List[Any]) -> Dict[str, Any]:
+    source = artifact.get("source") or {}
+    return {
+        "assistant": artifact.get("assistant", ""),
+        "mode": artifact.get("mode", ""),
+        "artifact_ref": f"{source.get('file', '')}#{source.get('hash', '')}",
+        "verbatim_clause_refs": clauses[:3],
+    }
+
+
+def primitive(
+    name: str, axis: str, instances: List[Dict[str, Any]], rng: random.Random
+) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "level": "abstract" if len(instances) > 1 else "concrete",
+        "governance_axis": [axis],
+        "description": f"Clauses governing {name.replace(' / ', ' ')}.",
+        "risk_class": rng.sample(RISK_CLASSES, 2),
+        "mitigation_target": rng.sample(MITIGATION_TARGETS, 1),
+        "applicability_conditions": "",
+        "concrete_instances": instances,
+        "notes": "",
+    }
+
+
+def registry_from(primitives: List[Dict[str, Any]]) -> str:
+    for k, p in enumerate(primitives, start=1):
+        p["primitive_id"] = f"PGP-{k:03d}"
+    registry = {"registry_version": "v0", "generated_at": "", "primitives": primitives}
+    return json.dumps(registry, indent=2, ensure_ascii=False)
+
+
+def group_artifacts(artifacts: Any, rng: random.Random) -> Dict[str, Dict[str, Any]]:
+    by_name: Dict[str, Dict[str, Any]] = {}
+    for artifact in artifacts if isinstance(artifacts, list) else []:
+        if not isinstance(artifact, dict):
+            continue
+        for axis, name, clauses in clause_groups(artifact):
+            if name not in by_name:
+                by_name[name] = primitive(name, axis, [], rng)
+            by_name[name]["concrete_instances"].append(
+                artifact_instance(artifact, clauses)
+            )
+    for p in by_name.values():
+        p["level"] = "abstract" if len(p["concrete_instances"]) > 1 else "concrete"
+    return by_name
+
+
+def synthesize_registry(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    artifacts = section_json(material.sections, "Governance Artifacts")
+    return registry_from(list(group_artifacts(artifacts, material.rng).values()))
+
+
+def synthesize_merge(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for side in ("Partial Registry A", "Partial Registry B"):
+        registry = section_json(material.sections, side) or {}
+        for p in registry.get("primitives") or []:
+            if p.get("name") in merged:
+                target = merged[p["name"]]
+                target["concrete_instances"] += p.get("concrete_instances") or []
+                target["level"] = "abstract"
+            else:
+                merged[p.get("name")] = dict(p)
+    return registry_from(list(merged.values()))
+
+
+def synthesize_update(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    current = section_json(material.sections, "Current Primitives") or []
+    ids = {p.get("name"): p.get("primitive_id") for p in current if isinstance(p, dict)}
+    artifacts = section_json(material.sections, "New or Changed Governance Artifacts")
+    merges, additions = [], []
+    for name, p in group_artifacts(artifacts, material.rng).items():
+        if name in ids:
+            merges.append(
+                {
+                    "primitive_id": ids[name],
+                    "level": p["level"],
+                    "concrete_instances": p["concrete_instances"],
+                }
+            )
+        else:
+            additions.append(p)
+    return json.dumps({"merges": merges, "additions": additions}, indent=2)
+
+
+def synthesize_families(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    documents = sorted(
+        set(ANALYSIS_FILE.findall("\n".join(str(m.get("content")) for m in messages)))
+    )
+    groups: Dict[str, List[str]] = defaultdict(list)
+    for document in documents:
+        groups[document.split(".")[0]].append(document)
+    rows = [",".join(FAMILIES_HEADER)]
+    for k, (assistant, members) in enumerate(sorted(groups.items()), start=1):
+        score = round(material.rng.uniform(0.6, 0.9), 3)
+        rows.append(
+            f"F{k},{score - 0.02:.2f}–{score + 0.02:.2f},{score:.2f},{assistant}-family,"
+            f"medium,{len(members)},{score},{';'.join(members)}"
+        )
+    return "```csv\n" + "\n".join(rows) + "\n```\n"
+
+
+def synthesize_markdown(
+    system: str, messages: List[Dict[str, Any]], material: Material
+) -> str:
+    title = next(
+        (line[2:].strip() for line in system.splitlines() if line.startswith("# ")),
+        "Report",
+    )
+    parts = [f"# {title}"]
+    for k in range(1, material.rng.randint(4, 7)):
+        parts.append(f"## {material.phrase(2, 4).capitalize()}")
+        for _ in range(material.rng.randint(1, 3)):
+            parts.append(material.phrase(30, 60).capitalize() + ".")
+    return "\n\n".join(parts) + "\n"
+
+
+def as_json(content: str) -> str:
+    """A synthesized fenced record as the bare JSON of a structured output."""
+    match = FENCED_REPLY.match(content)
+    if not match:
+        return content
+    language, body = match.groups()
+    if language == "yaml":
+        return json.dumps(
+            yaml.safe_load(body), indent=2, ensure_ascii=False, default=str
+        )
+    return body
+
+
+Synthesizer = Callable[[str, List[Dict[str, Any]], Material], str]
+
+# Stage (prompt file stem) -> synthesizer; other stages get Markdown
+SYNTHESIZERS: Dict[str, Synthesizer] = {
+    "normalize-system-prompt": synthesize_analysis,
+    "governance-primitive-extraction.prompt": synthesize_artifact,
+    "governance-primitives-reducer.prompt": synthesize_registry,
+    "governance-primitives-merge.prompt": synthesize_merge,
+    "governance-primitives-update.prompt": synthesize_update,
+    "analyze-prompt-families": synthesize_families,
+}
+
+JSON_FORMATS = {"json_schema", "json_object"}
+
+MALFORMED = "Here is the analysis you asked for.\n\n- item: 1\n- item: 2\n"
+
+
+# -------------------------
+# Server
+# -------------------------
+
+
+class MockState:
+    """Configuration, counters and the files/batches store of one server."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.latency = parse_distribution(args.latency)
+        self.token_rate = args.token_rate
+        self.error_rate = args.error_rate
+        self.faults = parse_faults(args.faults)
+        self.retry_after = args.retry_after
+        self.max_inflight = args.max_inflight
+        self.batch_delay = args.batch_delay
+        self.replay = (
+            ResponseCache(args.replay, read_only=True) if args.replay else None
+        )
+        self.stages = {
+            path.read_text(encoding="utf-8").strip(): path.stem
+            for path in sorted(Path(args.prompts).glob("*.md"))
+        }
+        self.rng = random.Random(args.mock_seed)
+        self.lock = threading.Lock()
+        self.batch_lock = threading.Lock()
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.counter = 0
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    def next_id(self, prefix: str) -> str:
+        with self.lock:
+            self.counter += 1
+            return f"{prefix}-mock-{self.counter}"
+
+    def count(self, stage: str, **counts: int) -> None:
+        with self.lock:
+            for name, value in counts.items():
+                self.stats[stage][name] += value
+
+    def draw(self) -> Tuple[Optional[str], float]:
+        """(fault or None, time to first token) for the next request."""
+        with self.lock:
+            ttft = max(0.0, self.latency(self.rng))
+            if self.faults and self.rng.random() < self.error_rate:
+                names = list(self.faults)
+                fault = self.rng.choices(names, [self.faults[n] for n in names])[0]
+                return fault, ttft
+            return None, ttft
+
+    def stage_of(self, messages: List[Dict[str, Any]]) -> str:
+        system = next(
+            (m.get("content") for m in messages if m.get("role") == "system"), None
+        )
+        if not isinstance(system, str):
+            return "unknown"
+        return self.stages.get(system.strip(), "unknown")
+
+    def replayed(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.replay is None:
+            return None
+        text = json.dumps(request.get("messages", []))
+        for masked in ((), tuple(sorted(set(ISO_TIMESTAMP.findall(text))))):
+            entry = self.replay.get(request_key(request, masked))
+            if entry is not None:
+                return entry
+        return None
+
+    def completion(self, request: Dict[str, Any], stage: str) -> Tuple[str, str]:
+        """(content, source) for a request: replayed or synthesized."""
+        entry = self.replayed(request)
+        if entry is not None:
+            content = entry["choices"][0]["message"].get("content") or ""
+            return content, "replayed"
+        messages = request.get("messages", [])
+        system = next(
+            (m.get("content") for m in messages if m.get("role") == "system"), ""
+        )
+        seed = int(request_key(request)[:16], 16)
+        material = Material(messages, random.Random(seed))
+        synthesize = SYNTHESIZERS.get(stage, synthesize_markdown)
+        content = synthesize(str(system), messages, material)
+        if (request.get("response_format") or {}).get("type") in JSON_FORMATS:
+            content = as_json(content)
+        return content, "synthesized"
+
+    def reset(self) -> None:
+        """Zero the counters (between benchmark runs)."""
+        with self.lock:
+            self.stats.clear()
+            self.peak_inflight = self.inflight
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "peak_inflight": self.peak_inflight,
+                "batches": len(self.batches),
+                "stages": {k: dict(v) for k, v in sorted(self.stats.items())},
+            }
+
+
+def completion_body(
+    request: Dict[str, Any], content: str, completion_id: str
+) -> Dict[str, Any]:
+    prompt_tokens = estimate_messages(
+        [m for m in request.get("messages", []) if isinstance(m.get("content"), str)]
+    )
+    completion_tokens = estimate_tokens(content)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "mock"),
+        "system_fingerprint": "mock",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        },
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockServer"
+
+    # Chunks of this many characters per streamed event
+    STREAM_CHUNK = 16
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(
+        self, status: int, body: Any, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: int, message: str, **headers: str) -> None:
+        self.send_json(
+            status,
+            {"error": {"message": message, "type": "mock_error", "code": status}},
+            headers,
+        )
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_GET(self) -> None:
+        state = self.server.state
+        if self.path.endswith("/mock/stats"):
+            return self.send_json(200, state.snapshot())
+        if match := re.search(r"/files/([^/]+)/content$", self.path):
+            data = state.files.get(match.group(1))
+            if data is None:
+                return self.send_error_json(404, "No such file")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if match := re.search(r"/batches/([^/]+)$", self.path):
+            if match.group(1) not in state.batches:
+                return self.send_error_json(404, "No such batch")
+            return self.send_json(200, self.batch_status(match.group(1)))
+        self.send_error_json(404, f"Unknown path {self.path}")
+
+    def do_POST(self) -> None:
+        body = self.read_body()
+        if self.path.endswith("/chat/completions"):
+            return self.chat_completion(json.loads(body))
+        if self.path.endswith("/files"):
+            return self.upload_file(body)
+        if self.path.endswith("/batches"):
+            return self.create_batch(json.loads(body))
+        self.send_error_json(404, f"Unknown path {self.path}")
+
+    # Chat completions
+
+    def chat_completion(self, request: Dict[str, Any]) -> None:
+        state = self.server.state
+        stream = bool(request.get("stream"))
+        request = {
+            k: v for k, v in request.items() if k not in ("stream", "stream_options")
+        }
+        stage = state.stage_of(request.get("messages", []))
+        with state.lock:
+            state.inflight += 1
+            state.peak_inflight = max(state.peak_inflight, state.inflight)
+            over_limit = 0 < state.max_inflight < state.inflight
+        try:
+            state.count(stage, requests=1)
+            if over_limit:
+                state.count(stage, throttled=1)
+                return self.send_error_json(
+                    429,
+                    "Too many concurrent requests",
+                    **{"Retry-After": f"{state.retry_after:g}"},
+                )
+            fault, ttft = state.draw()
+            if fault and fault != "malformed":
+                state.count(stage, faults=1)
+                return self.send_fault(fault)
+            content, source = state.completion(request, stage)
+            if fault == "malformed":
+                state.count(stage, faults=1)
+                content = MALFORMED
+            state.count(stage, **{source: 1})
+            body = completion_body(request, content, state.next_id("chatcmpl"))
+            usage = body["usage"]
+            state.count(
+                stage,
+                prompt_tokens=usage["prompt_tokens"],
+                completion_tokens=usage["completion_tokens"],
+            )
+            generation = (
+                usage["completion_tokens"] / state.token_rate
+                if state.token_rate
+                else 0.0
+            )
+            time.sleep(ttft)
+            if stream:
+                self.send_stream(body, generation)
+            else:
+                time.sleep(generation)
+                self.send_json(200, body)
+        except (BrokenPipeError, ConnectionResetError):
+            state.count(stage, disconnects=1)
+            self.close_connection = True
+        finally:
+            with state.lock:
+                state.inflight -= 1
+
+    def send_fault(self, fault: str) -> None:
+        if fault == "reset":
+            # No response at all: the client sees a dropped connection
+            self.close_connection = True
+            return
+        status = int(fault)
+        headers = (
+            {"Retry-After": f"{self.server.state.retry_after:g}"}
+            if status == 429
+            else {}
+        )
+        self.send_error_json(status, f"Injected fault {status}", **headers)
+
+    def send_event(self, data: str) -> None:
+        event = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+        self.wfile.flush()
+
+    def send_stream(self, body: Dict[str, Any], generation: float) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        content = body["choices"][0]["message"]["content"]
+        pieces = [
+            content[i : i + self.STREAM_CHUNK]
+            for i in range(0, len(content), self.STREAM_CHUNK)
+        ] or [""]
+        chunk = {k: body[k] for k in ("id", "created", "model", "system_fingerprint")}
+        chunk["object"] = "chat.completion.chunk"
+        for k, piece in enumerate(pieces):
+            delta = {"content": piece, **({"role": "assistant"} if k == 0 else {})}
+            choice = {"index": 0, "delta": delta, "finish_reason": None}
+            self.send_event(json.dumps({**chunk, "choices": [choice]}))
+            if generation:
+                time.sleep(generation / len(pieces))
+        finish = {"index": 0, "delta": {}, "finish_reason": "stop"}
+        self.send_event(json.dumps({**chunk, "choices": [finish]}))
+        self.send_event(json.dumps({**chunk, "choices": [], "usage": body["usage"]}))
+        self.send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # Files and batches
+
+    def upload_file(self, body: bytes) -> None:
+        state = self.server.state
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode() + body
+        )
+        data, filename = None, "upload"
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                data = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+        if data is None:
+            return self.send_error_json(400, "Multipart upload without a file part")
+        file_id = state.next_id("file")
+        state.files[file_id] = data
+        self.send_json(
+            200,
+            {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(data),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": "batch",
+                "status": "processed",
+            },
+        )
+
+    def create_batch(self, request: Dict[str, Any]) -> None:
+        state = self.server.state
+        if request.get("input_file_id") not in state.files:
+            return self.send_error_json(400, "Unknown input_file_id")
+        batch_id = state.next_id("batch")
+        state.batches[batch_id] = {
+            "request": request,
+            "created_at": int(time.time()),
+            "ready_at": time.monotonic() + state.batch_delay,
+        }
+        self.send_json(200, self.batch_status(batch_id))
+
+    def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        state = self.server.state
+        batch = state.batches[batch_id]
+        request = batch["request"]
+        lines = [
+            json.loads(line)
+            for line in state.files[request["input_file_id"]]
+            .decode("utf-8")
+            .splitlines()
+            if line.strip()
+        ]
+        status = "in_progress" if time.monotonic() < batch["ready_at"] else "completed"
+        if status == "completed":
+            with state.batch_lock:
+                if "counts" not in batch:
+                    self.finish_batch(batch, lines)
+        counts = batch.get("counts", {"total": len(lines), "completed": 0, "failed": 0})
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "status": status,
+            "created_at": batch["created_at"],
+            "in_progress_at": batch["created_at"],
+            "completed_at": batch.get("completed_at"),
+            "output_file_id": batch.get("output_file_id"),
+            "error_file_id": batch.get("error_file_id"),
+            "request_counts": counts,
+        }
+
+    def finish_batch(self, batch: Dict[str, Any], lines: List[Dict[str, Any]]) -> None:
+        state = self.server.state
+        output, errors = [], []
+        for line in lines:
+            request = line.get("body") or {}
+            stage = state.stage_of(request.get("messages", []))
+            state.count(stage, requests=1, batched=1)
+            fault, _ = state.draw()
+            if fault:
+                state.count(stage, faults=1)
+                errors.append(
+                    {
+                        "id": state.next_id("batch_req"),
+                        "custom_id": line.get("custom_id"),
+                        "response": None,
+                        "error": {
+                            "code": "server_error",
+                            "message": f"Injected fault {fault}",
+                        },
+                    }
+                )
+                continue
+            content, source = state.completion(request, stage)
+            body = completion_body(request, content, state.next_id("chatcmpl"))
+            state.count(
+                stage,
+                **{source: 1},
+                prompt_tokens=body["usage"]["prompt_tokens"],
+                completion_tokens=body["usage"]["completion_tokens"],
+            )
+            output.append(
+                {
+                    "id": state.next_id("batch_req"),
+                    "custom_id": line.get("custom_id"),
+                    "response": {
+                        "status_code": 200,
+                        "request_id": body["id"],
+                        "body": body,
+                    },
+                    "error": None,
+                }
+            )
+        for key, records in (("output_file_id", output), ("error_file_id", errors)):
+            if records:
+                file_id = state.next_id("file")
+                state.files[file_id] = "".join(
+                    json.dumps(r) + "\n" for r in records
+                ).encode()
+                batch[key] = file_id
+        batch["completed_at"] = int(time.time())
+        batch["counts"] = {
+            "total": len(lines),
+            "completed": len(output),
+            "failed": len(errors),
+        }
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], state: MockState) -> None:
+        super().__init__(address, MockHandler)
+        self.state = state
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(
+    args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0
+) -> MockServer:
+    """Serve on a background thread (port 0: any free port); shut down with .shutdown()."""
+    server = MockServer((host, port), MockState(args))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
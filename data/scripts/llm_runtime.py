@@ -0,0 +1,545 @@
+"""
+llm_runtime.py
+
+Shared runtime for the model-calling scripts:
+
+- read_text() / clean_output() helpers every script used to carry a copy of
+- add_model_arguments(): the common --model/--seed/--dry-run/--verbose
+  flags plus client (--base-url, --timeout, --max-retries) and response
+  cache flags
+- ModelRuntime: one pooled, keep-alive OpenAI client per process, created
+  on first use, with retries around every call:
+
+    * retried: 429, 408, 409, 5xx, connection errors and timeouts
+    * exponential backoff with full jitter (base 1 s, capped at 60 s)
+    * a Retry-After / retry-after-ms header, when sent, is the minimum wait
+    * other errors (400, 401, 404, ...) fail immediately
+
+  Responses go through the response cache (llm_cache.py) when enabled.
+  acomplete() is the asyncio counterpart (its own pooled AsyncOpenAI
+  client) for scripts that issue many calls concurrently. stream() and
+  astream() stream the response through an early-abort guard
+  (llm_stream.py).
+
+  Every call is also recorded (stage, tokens, latency, retries, outcome)
+  to the telemetry file when one is set (llm_telemetry.py). Pass the
+  call's input files as `inputs` so records carry their hashes.
+
+--base-url (or OPENAI_BASE_URL) points the client at any OpenAI-compatible
+endpoint, such as a local stand-in server.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import email.utils
+import logging
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import (Any, Awaitable, Callable, Dict, Iterator, Optional,
+                    Sequence, Tuple, TypeVar)
+
+import openai
+from llm_cache import ResponseCache, add_cache_arguments, request_key
+from llm_stream import (DEFAULT_STREAM_RETRIES, GuardFactory, StreamAbort,
+                        StreamAssembler, stream_request)
+from llm_telemetry import Telemetry, add_telemetry_arguments, call_retries
+from openai.types.chat import ChatCompletion
+
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+T = TypeVar("T")
+
+
+def read_text(path: Path) -> str:
+    try:
+        return path.read_text(encoding="utf-8")
+    except Exception:
+        logging.exception(f"Failed to read {path}")
+        sys.exit(1)
+
+
+def clean_output(text: str, language: str = "yaml") -> str:
+    """
+    Remove markdown code fences if the model emits them.
+    Only the first fenced block is extracted.
+    """
+    pattern = rf"```(?:{language})?\s*\n(.*?)\n\s*```"
+    match = re.search(pattern, text, re.DOTALL)
+    if match:
+        logging.debug("Removed markdown code block markers from output")
+        return match.group(1).strip()
+    return text.strip()
+
+
+def fenced(title: str, body: str, language: str) -> str:
+    """A '## title' section with body in a code fence (no indentation added)."""
+    return f"## {title}\n\n```{language}\n{body.rstrip()}\n```\n"
+
+
+def add_model_arguments(
+    parser: argparse.ArgumentParser, default_model: Optional[str] = None
+) -> None:
+    if default_model:
+        parser.add_argument(
+            "--model",
+            default=default_model,
+            help=f"Model name (default: {default_model})",
+        )
+    else:
+        parser.add_argument("--model", required=True, help="Model name (e.g. gpt-5.2)")
+    parser.add_argument(
+        "--seed", type=int, help="Seed for deterministic inference (optional)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the request that would be sent and exit without calling the API",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    parser.add_argument(
+        "--base-url",
+        help="OpenAI-compatible API base URL (default: $OPENAI_BASE_URL or OpenAI)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Per-request timeout in seconds (default: {DEFAULT_TIMEOUT:g})",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help=f"Retries on rate limits and transient errors (default: {DEFAULT_MAX_RETRIES})",
+    )
+    add_cache_arguments(parser)
+    add_telemetry_arguments(parser)
+
+
+def setup_logging(verbose: bool) -> None:
+    logging.basicConfig(
+        level=logging.DEBUG if verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, openai.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms or Retry-After."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            date = email.utils.parsedate_to_datetime(value)
+            return max(0.0, date.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, exc: Exception) -> float:
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+    requested = retry_after(exc)
+    if requested is not None:
+        delay = max(delay, min(requested, BACKOFF_CAP))
+    return delay
+
+
+class Usage:
+    """
+    Token usage summed over API responses (cache hits cost nothing). The
+    cached prompt tokens are those the provider served from its prefix
+    cache, so cached / prompt is the prefix reuse rate of a run.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, response: ChatCompletion) -> ChatCompletion:
+        usage = response.usage
+        if usage is None:
+            return response
+        details = usage.prompt_tokens_details
+        cached = (details.cached_tokens or 0) if details else 0
+        self.requests += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.cached_tokens += cached
+        self.completion_tokens += usage.completion_tokens
+        logging.debug(
+            f"Usage: {usage.prompt_tokens} prompt tokens ({cached} cached, "
+            f"{usage.prompt_tokens - cached} uncached), "
+            f"{usage.completion_tokens} completion tokens"
+        )
+        return response
+
+    def log(self) -> None:
+        share = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        logging.info(
+            f"Usage over {self.requests} responses: {self.prompt_tokens} prompt "
+            f"tokens ({self.cached_tokens} cached, {share:.0%}; "
+            f"{self.prompt_tokens - self.cached_tokens} uncached), "
+            f"{self.completion_tokens} completion tokens"
+        )
+
+
+class ModelRuntime:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.base_url = args.base_url
+        self.timeout = args.timeout
+        self.max_retries = args.max_retries
+        self.cache = None if args.dry_run else ResponseCache.from_args(args)
+        self._client: Optional[openai.OpenAI] = None
+        self._async_client: Optional[openai.AsyncOpenAI] = None
+        self.calls = 0
+        self.retries = 0
+        self.aborted = 0
+        self.usage = Usage()
+        self.telemetry = Telemetry.from_args(args)
+
+    @property
+    def client(self) -> openai.OpenAI:
+        # Created on first use so --dry-run and fully cached runs need no key
+        if self._client is None:
+            self._client = openai.OpenAI(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                # Retries are handled here, with jitter and Retry-After
+                max_retries=0,
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+            )
+        return self._async_client
+
+    def _retry_delay(self, attempt: int, exc: Exception) -> Optional[float]:
+        """Seconds to wait before retrying a failed call, or None to give up."""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        delay = backoff_delay(attempt, exc)
+        self.retries += 1
+        counter = call_retries.get()
+        if counter is not None:
+            counter[0] += 1
+        logging.warning(
+            f"Model call failed ({exc.__class__.__name__}); "
+            f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+        )
+        return delay
+
+    def call(self, method: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Call any client method with backoff on retryable errors."""
+        attempt = 0
+        while True:
+            self.calls += 1
+            try:
+                return method(*args, **kwargs)
+            except Exception as exc:
+                delay = self._retry_delay(attempt, exc)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    def create(self, **request: Any) -> ChatCompletion:
+        """chat.completions.create with backoff on retryable errors."""
+        return self.usage.record(
+            self.call(self.client.chat.completions.create, **request)
+        )
+
+    async def acall(
+        self, method: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        """Await any async client method with backoff on retryable errors."""
+        attempt = 0
+        while True:
+            self.calls += 1
+            try:
+                return await method(*args, **kwargs)
+            except Exception as exc:
+                delay = self._retry_delay(attempt, exc)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def acreate(self, **request: Any) -> ChatCompletion:
+        """Async chat.completions.create with backoff on retryable errors."""
+        return self.usage.record(
+            await self.acall(self.async_client.chat.completions.create, **request)
+        )
+
+    def record_call(
+        self,
+        request: Dict[str, Any],
+        masked: Sequence[str],
+        key: str,
+        mode: str,
+        outcome: str,
+        latency: Optional[float],
+        inputs: Sequence[Path],
+        response: Optional[ChatCompletion] = None,
+        retries: int = 0,
+        stream_aborts: int = 0,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self.telemetry.call(
+            model=request.get("model"),
+            mode=mode,
+            outcome=outcome,
+            latency=latency,
+            # Hashing a large request only pays off when it is recorded
+            request_hash=(
+                (key or request_key(request, masked)) if self.telemetry.enabled else ""
+            ),
+            inputs=inputs,
+            response=response,
+            retries=retries,
+            stream_aborts=stream_aborts,
+            error=error,
+        )
+
+    def lookup(
+        self,
+        request: Dict[str, Any],
+        masked: Sequence[str],
+        mode: str,
+        inputs: Sequence[Path],
+    ) -> Tuple[str, Optional[ChatCompletion]]:
+        """Response cache lookup; a hit is recorded as a cached call."""
+        if not self.cache:
+            return "", None
+        started = time.perf_counter()
+        key, cached = self.cache.lookup(request, masked)
+        if cached is not None:
+            self.record_call(
+                request,
+                masked,
+                key,
+                mode,
+                "cached",
+                time.perf_counter() - started,
+                inputs,
+                cached,
+            )
+        return key, cached
+
+    @contextlib.contextmanager
+    def _tracked(
+        self,
+        request: Dict[str, Any],
+        masked: Sequence[str],
+        key: str,
+        mode: str,
+        inputs: Sequence[Path],
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Time one model call (retries included) and record it. The caller
+        puts the final "response" and any "stream_aborts" in the dict.
+        """
+        started = time.perf_counter()
+        counter = [0]
+        token = call_retries.set(counter)
+        call: Dict[str, Any] = {"response": None, "stream_aborts": 0}
+        outcome, error = "ok", None
+        try:
+            yield call
+        except StreamAbort as exc:
+            outcome, error = "aborted", exc
+            raise
+        except BaseException as exc:
+            outcome, error = "error", exc
+            raise
+        finally:
+            call_retries.reset(token)
+            self.record_call(
+                request,
+                masked,
+                key,
+                mode,
+                outcome,
+                time.perf_counter() - started,
+                inputs,
+                call["response"],
+                counter[0],
+                call["stream_aborts"],
+                error,
+            )
+
+    def complete(
+        self,
+        request: Dict[str, Any],
+        masked: Sequence[str] = (),
+        inputs: Sequence[Path] = (),
+    ) -> ChatCompletion:
+        """One chat completion, served from the response cache when possible."""
+        key, cached = self.lookup(request, masked, "sync", inputs)
+        if cached is not None:
+            return cached
+        with self._tracked(request, masked, key, "sync", inputs) as call:
+            response = call["response"] = self.create(**request)
+        if self.cache:
+            self.cache.store(key, request, response)
+        return response
+
+    async def acomplete(
+        self,
+        request: Dict[str, Any],
+        masked: Sequence[str] = (),
+        inputs: Sequence[Path] = (),
+    ) -> ChatCompletion:
+        """Async complete(): cache lookups stay synchronous (local files)."""
+        key, cached = self.lookup(request, masked, "async", inputs)
+        if cached is not None:
+            return cached
+        with self._tracked(request, masked, key, "async", inputs) as call:
+            response = call["response"] = await self.acreate(**request)
+        if self.cache:
+            self.cache.store(key, request, response)
+        return response
+
+    def stream(
+        self,
+        request: Dict[str, Any],
+        guard: GuardFactory,
+        partial: Optional[Path] = None,
+        masked: Sequence[str] = (),
+        retries: int = DEFAULT_STREAM_RETRIES,
+        inputs: Sequence[Path] = (),
+    ) -> ChatCompletion:
+        """
+        complete(), streamed: the output is checked by a fresh guard() as it
+        arrives and the call is retried immediately if the guard aborts.
+        """
+        key, cached = self.lookup(request, masked, "stream", inputs)
+        if cached is not None:
+            return cached
+        with self._tracked(request, masked, key, "stream", inputs) as call:
+            attempt = 0
+            while True:
+                attempt += 1
+                assembler = StreamAssembler(guard(), partial)
+                chunks = self.call(
+                    self.client.chat.completions.create, **stream_request(request)
+                )
+                try:
+                    for chunk in chunks:
+                        assembler.handle(chunk)
+                    response = self.usage.record(assembler.finish())
+                    break
+                except StreamAbort as exc:
+                    call["stream_aborts"] += 1
+                    self._aborted(exc, assembler, attempt, retries)
+                finally:
+                    chunks.close()
+                    assembler.close()
+            call["response"] = response
+        if self.cache:
+            self.cache.store(key, request, response)
+        return response
+
+    async def astream(
+        self,
+        request: Dict[str, Any],
+        guard: GuardFactory,
+        partial: Optional[Path] = None,
+        masked: Sequence[str] = (),
+        retries: int = DEFAULT_STREAM_RETRIES,
+        inputs: Sequence[Path] = (),
+    ) -> ChatCompletion:
+        """Async stream()."""
+        key, cached = self.lookup(request, masked, "stream", inputs)
+        if cached is not None:
+            return cached
+        with self._tracked(request, masked, key, "stream", inputs) as call:
+            attempt = 0
+            while True:
+                attempt += 1
+                assembler = StreamAssembler(guard(), partial)
+                chunks = await self.acall(
+                    self.async_client.chat.completions.create,
+                    **stream_request(request),
+                )
+                try:
+                    async for chunk in chunks:
+                        assembler.handle(chunk)
+                    response = self.usage.record(assembler.finish())
+                    break
+                except StreamAbort as exc:
+                    call["stream_aborts"] += 1
+                    self._aborted(exc, assembler, attempt, retries)
+                finally:
+                    await chunks.close()
+                    assembler.close()
+            call["response"] = response
+        if self.cache:
+            self.cache.store(key, request, response)
+        return response
+
+    def _aborted(
+        self, exc: StreamAbort, assembler: StreamAssembler, attempt: int, retries: int
+    ) -> None:
+        """Log an aborted stream; re-raise it once the retries are used up."""
+        self.aborted += 1
+        logging.warning(
+            f"Aborted streamed response after {assembler.chars} chars: {exc}"
+            + (f"; retry {attempt}/{retries}" if attempt <= retries else "")
+        )
+        if attempt > retries:
+            raise exc
+
+    def close(self) -> None:
+        if self.cache:
+            self.cache.close()
+        self.telemetry.close()
+        if self.usage.requests:
+            self.usage.log()
+        if self.retries or self.aborted:
+            logging.info(
+                f"{self.calls} API requests, {self.retries} retried, "
+                f"{self.aborted} streams aborted"
+            )
+        if self._client is not None:
+            self._client.close()
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.close()
+        self.close()
@@ -0,0 +1,309 @@
+"""
+llm_stream.py
+
+Streaming chat completions with incremental output checks.
+
+A guard is fed the response text as it arrives and raises StreamAbort as
+soon as the output clearly cannot pass validation, so a bad generation is
+cut off (and retried) without paying for the rest of it:
+
+- TopLevelKeysGuard (YAML documents such as normalized analyses): the
+  root must be a mapping whose top-level keys are known schema sections,
+  in schema order. A list or scalar root, an unknown top-level key, a
+  repeated key or a key out of order aborts. Skipping a section does not
+  (the final validation only warns about missing sections).
+- JsonObjectGuard (JSON documents, usually a single line): a streaming
+  tokenizer follows strings, nesting depth and object keys character by
+  character, partial lines included. The root must be an object; a
+  mismatched bracket, a non-key where a key belongs or a stray character
+  aborts, and given the expected keys, so does an unknown, repeated or
+  out-of-order top-level key, as soon as that key's closing quote arrives.
+
+Both allow a markdown code fence around the document and a short prose
+preamble before it, as clean_output() does. TopLevelKeysGuard only looks
+at complete lines; JsonObjectGuard scans each character once.
+
+StreamAssembler also appends the text to a partial file as it streams, so
+a long generation can be followed on disk and a crash leaves what was
+received. ModelRuntime.stream()/astream() retry an aborted stream at once
+(no backoff: nothing is wrong with the endpoint).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence
+
+from openai.lib.streaming.chat import ChatCompletionStreamState
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+DEFAULT_STREAM_RETRIES = 2
+
+# Prose lines tolerated before the document (or its code fence) starts
+MAX_PREAMBLE_LINES = 3
+
+TOP_LEVEL_KEY = re.compile(r"^([A-Za-z_][\w-]*)\s*:(?:\s|$)")
+
+
+class StreamAbort(Exception):
+    """The streamed output diverged from the expected document shape."""
+
+
+class StreamGuard(Protocol):
+    def feed(self, text: str) -> None: ...
+
+    def finish(self) -> None: ...
+
+
+class KeyOrder:
+    """Top-level keys must be known, unique and in the expected order."""
+
+    def __init__(self, expected_keys: Sequence[str]) -> None:
+        self.order = {key: k for k, key in enumerate(expected_keys)}
+        self.seen: List[str] = []
+
+    def add(self, key: str) -> None:
+        if key not in self.order:
+            raise StreamAbort(f"unknown top-level key {key!r}")
+        if key in self.seen:
+            raise StreamAbort(f"repeated top-level key {key!r}")
+        if self.seen and self.order[key] < self.order[self.seen[-1]]:
+            raise StreamAbort(
+                f"top-level key {key!r} out of order (after {self.seen[-1]!r})"
+            )
+        self.seen.append(key)
+
+
+class LineGuard(ABC):
+    """Base guard: splits the stream into complete lines, skipping fences."""
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.started = False
+        self.fenced = False
+        self.closed = False
+        self.preamble = 0
+
+    def feed(self, text: str) -> None:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self._line(line)
+
+    def finish(self) -> None:
+        if self.buffer:
+            self._line(self.buffer)
+            self.buffer = ""
+
+    def _line(self, line: str) -> None:
+        if self.closed:
+            return
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if self.fenced:
+                self.closed = True  # only the first fenced block is used
+            elif not self.started:
+                self.fenced = True
+                self.started = True
+            return
+        if not stripped:
+            return
+        if not self.started:
+            if self.starts_document(line):
+                self.started = True
+            else:
+                self.preamble += 1
+                if self.preamble > MAX_PREAMBLE_LINES:
+                    raise StreamAbort("no document after the preamble")
+                return
+        self.check(line)
+
+    @abstractmethod
+    def starts_document(self, line: str) -> bool:
+        """Whether a line outside a code fence is the document's first line."""
+
+    @abstractmethod
+    def check(self, line: str) -> None:
+        """Check one non-blank document line; raise StreamAbort if it fails."""
+
+
+class TopLevelKeysGuard(LineGuard):
+    def __init__(self, expected_keys: Sequence[str]) -> None:
+        super().__init__()
+        self.keys = KeyOrder(expected_keys)
+
+    def starts_document(self, line: str) -> bool:
+        return bool(TOP_LEVEL_KEY.match(line)) or line.startswith(("- ", "---"))
+
+    def check(self, line: str) -> None:
+        if line[0] in " \t#" or line.startswith("---"):
+            return
+        match = TOP_LEVEL_KEY.match(line)
+        if not match:
+            if line.startswith("-"):
+                raise StreamAbort("root is a list, expected a mapping")
+            raise StreamAbort(f"unexpected top-level content: {line[:60]!r}")
+        self.keys.add(match.group(1))
+
+
+# Characters of numbers and of true/false/null outside strings
+JSON_LITERAL = frozenset("0123456789+-.eEtrufalsn")
+JSON_SPACE = frozenset(" \t\r\n")
+JSON_CLOSERS = {"}": "{", "]": "["}
+
+
+class JsonObjectGuard(LineGuard):
+    """
+    Lines are only used to skip the preamble and an opening fence: once
+    the document starts (at a line, or at once on a partial line beginning
+    with `{`), every later character goes through scan(), whether or not
+    its line is complete.
+    """
+
+    def __init__(self, expected_keys: Optional[Sequence[str]] = None) -> None:
+        super().__init__()
+        self.keys = KeyOrder(expected_keys) if expected_keys is not None else None
+        self.scanning = False
+        self.stack: List[str] = []  # open containers, "{" or "["
+        self.expect_key = False
+        self.in_string = False
+        self.is_key = False
+        self.escaped = False
+        self.key: List[str] = []
+
+    def feed(self, text: str) -> None:
+        if self.scanning:
+            self.scan(text)
+            return
+        self.buffer += text
+        while "\n" in self.buffer and not (self.scanning or self.closed):
+            line, self.buffer = self.buffer.split("\n", 1)
+            self._line(line)
+        if self.closed:
+            return
+        if not self.scanning and self.buffer.lstrip().startswith("{"):
+            self.started = True
+            self.scanning = True
+        if self.scanning:
+            text, self.buffer = self.buffer, ""
+            self.scan(text)
+
+    def starts_document(self, line: str) -> bool:
+        return line.lstrip()[:1] in '{["0123456789-tfn'
+
+    def check(self, line: str) -> None:
+        if not self.scanning:
+            self.scanning = True
+            if not line.lstrip().startswith("{"):
+                raise StreamAbort("root is not a JSON object")
+        self.scan(line + "\n")
+
+    def scan(self, text: str) -> None:
+        for char in text:
+            if self.closed:
+                return  # anything after the root object (a fence, prose)
+            if self.in_string:
+                self.string_char(char)
+            elif char in JSON_SPACE:
+                continue
+            elif self.expect_key and char not in '"}':
+                raise StreamAbort(f"expected an object key, got {char!r}")
+            elif char == '"':
+                self.in_string = True
+                self.is_key = self.expect_key
+                self.expect_key = False
+            elif char in "{[":
+                if not self.stack and char == "[":
+                    raise StreamAbort("root is not a JSON object")
+                self.stack.append(char)
+                self.expect_key = char == "{"
+            elif char in JSON_CLOSERS:
+                if not self.stack or self.stack.pop() != JSON_CLOSERS[char]:
+                    raise StreamAbort(f"mismatched {char!r}")
+                self.expect_key = False
+                self.closed = not self.stack
+            elif char == ",":
+                if not self.stack:
+                    raise StreamAbort("unexpected ','")
+                self.expect_key = self.stack[-1] == "{"
+            elif char == ":" or char in JSON_LITERAL:
+                if not self.stack:
+                    raise StreamAbort("root is not a JSON object")
+            else:
+                raise StreamAbort(f"unexpected character {char!r}")
+
+    def string_char(self, char: str) -> None:
+        if self.escaped:
+            self.escaped = False
+        elif char == "\\":
+            self.escaped = True
+        elif char == '"':
+            self.in_string = False
+            if self.is_key and len(self.stack) == 1 and self.keys is not None:
+                self.keys.add(json.loads('"' + "".join(self.key) + '"'))
+            self.key.clear()
+            return
+        if self.is_key and len(self.stack) == 1:
+            self.key.append(char)
+
+
+class StreamAssembler:
+    """
+    Consumes chat.completions stream chunks: content deltas go to the guard
+    (and are appended to `partial`), and finish() returns the assembled
+    completion.
+    """
+
+    def __init__(self, guard: StreamGuard, partial: Optional[Path] = None) -> None:
+        self.guard = guard
+        self.state = ChatCompletionStreamState()
+        self.sink = partial.open("w", encoding="utf-8") if partial else None
+        self.chars = 0
+
+    def handle(self, chunk: ChatCompletionChunk) -> None:
+        self.state.handle_chunk(chunk)
+        for choice in chunk.choices:
+            if choice.index == 0 and choice.delta.content:
+                self.chars += len(choice.delta.content)
+                if self.sink:
+                    self.sink.write(choice.delta.content)
+                    self.sink.flush()
+                self.guard.feed(choice.delta.content)
+
+    def finish(self) -> ChatCompletion:
+        self.guard.finish()
+        final = self.state.get_final_completion().model_dump(mode="json")
+        for choice in final["choices"]:
+            choice["message"].pop("parsed", None)
+        return ChatCompletion.model_validate(final)
+
+    def close(self) -> None:
+        if self.sink:
+            self.sink.close()
+
+
+def add_stream_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the response, aborting and retrying as soon as it diverges "
+        "from the expected shape",
+    )
+    parser.add_argument(
+        "--stream-retries",
+        type=int,
+        default=DEFAULT_STREAM_RETRIES,
+        help=f"Immediate retries after an aborted stream (default: {DEFAULT_STREAM_RETRIES})",
+    )
+
+
+def stream_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """The streaming form of a chat.completions request (usage included)."""
+    return {**request, "stream": True, "stream_options": {"include_usage": True}}
+
+
+GuardFactory = Callable[[], StreamGuard]
@@ -0,0 +1,262 @@
+"""
+llm_structured.py
+
+Schema-constrained ("structured output") responses for the
+record-producing scripts: normalization, governance extraction and the
+primitives registry.
+
+JSON Schemas are derived, not written by hand, so they follow the schema
+and prompts they come from:
+
+- analysis_schema(): from the normalization schema YAML
+  (schema/system-prompt.v0.yaml), compiled by analysis_schema.py, the
+  same compiler validate-analyses.py checks analyses with. Leaves keep
+  their types and comment enums, and each also admits `unknown`, as the
+  normalization prompt allows.
+- template_schema(): from the canonical JSON template in a prompt (the
+  first ```json block). "" is a string, false a boolean, "a | b" one of
+  the listed values, a list of several strings an array of those values
+  and a list of one object an array of such objects. An empty list takes
+  the item shape the template, or a related template, shows for the same
+  key; otherwise it is a list of verbatim clause references
+  {quote, location}.
+
+Both are strict, as structured outputs require: every property is
+required and no other property is allowed. response_format() wraps a
+schema for the request.
+
+repaired() / complete_repaired() (and their async twins) parse a response
+and, when parsing fails (a refusal, truncated or invalid output), make a
+targeted retry: the rejected output and the reason go back to the model
+as one more turn, asking for a corrected reply. The request prefix is
+unchanged, so the retry reuses the provider's prompt cache. This applies
+with or without --structured-output.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Sequence, TypeVar
+
+from analysis_schema import compile_schema, json_schema, json_type
+from llm_runtime import clean_output
+from openai.types.chat import ChatCompletion
+
+DEFAULT_REPAIR_RETRIES = 2
+
+# Item shape of an empty list in a prompt template with no other example
+CLAUSE_REF = [{"quote": "", "location": ""}]
+
+REPAIR_MESSAGE = """Your previous reply was rejected: {error}
+
+Reply again with the complete, corrected output only, in the required format."""
+
+T = TypeVar("T")
+
+
+def add_structured_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--structured-output",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Constrain the response to a JSON Schema derived from the schema or "
+        "prompt template (default: on)",
+    )
+    parser.add_argument(
+        "--repair-retries",
+        type=int,
+        default=DEFAULT_REPAIR_RETRIES,
+        help="Targeted retries after an invalid response "
+        f"(default: {DEFAULT_REPAIR_RETRIES})",
+    )
+
+
+def strict_object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+# -------------------------
+# Schema derivation
+# -------------------------
+
+
+def analysis_schema(schema_yaml: str) -> Dict[str, Any]:
+    """Raises ValueError unless the schema YAML is a mapping of sections."""
+    return json_schema(compile_schema(schema_yaml))
+
+
+def prompt_template(prompt_text: str) -> Any:
+    """The first ```json block of a prompt; raises ValueError if none parses."""
+    match = re.search(r"```json\s*\n(.*?)\n\s*```", prompt_text, re.DOTALL)
+    if not match:
+        raise ValueError("prompt has no ```json template")
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"prompt template is not valid JSON: {exc}") from exc
+
+
+def list_examples(node: Any, examples: Dict[str, list]) -> None:
+    """Collect the first non-empty list under each key."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if isinstance(value, list) and value:
+                examples.setdefault(key, value)
+            list_examples(value, examples)
+    elif isinstance(node, list):
+        for item in node:
+            list_examples(item, examples)
+
+
+def template_node_schema(
+    node: Any, key: str, examples: Dict[str, list]
+) -> Dict[str, Any]:
+    if isinstance(node, dict):
+        return strict_object(
+            {k: template_node_schema(v, k, examples) for k, v in node.items()}
+        )
+    if isinstance(node, list):
+        node = node or examples.get(key) or CLAUSE_REF
+        if all(isinstance(item, str) for item in node) and len(node) > 1:
+            return {"type": "array", "items": {"type": "string", "enum": node}}
+        return {"type": "array", "items": template_node_schema(node[0], key, examples)}
+    if isinstance(node, str) and " | " in node:
+        return {"type": "string", "enum": [v.strip() for v in node.split("|")]}
+    return {"type": json_type(node)}
+
+
+def template_schema(prompt_text: str, related: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    JSON Schema of a prompt's JSON template; `related` prompts supply item
+    shapes for lists the template leaves empty. Raises ValueError if the
+    prompt has no JSON object template.
+    """
+    template = prompt_template(prompt_text)
+    if not isinstance(template, dict):
+        raise ValueError("prompt template is not a JSON object")
+    examples: Dict[str, list] = {}
+    list_examples(template, examples)
+    for text in related:
+        list_examples(prompt_template(text), examples)
+    return template_node_schema(template, "", examples)
+
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema},
+    }
+
+
+# -------------------------
+# Parsing and targeted retries
+# -------------------------
+
+
+def response_text(response: ChatCompletion) -> str:
+    """The reply text; raises ValueError on a refusal, truncation or no text."""
+    choice = response.choices[0]
+    refusal = getattr(choice.message, "refusal", None)
+    if refusal:
+        raise ValueError(f"model refused: {refusal}")
+    if choice.finish_reason == "length":
+        raise ValueError("output was cut off at the token limit")
+    if not choice.message.content:
+        raise ValueError("model returned empty output")
+    return choice.message.content
+
+
+def response_json(response: ChatCompletion) -> Dict[str, Any]:
+    """The reply as a JSON object (code fences tolerated); raises ValueError."""
+    try:
+        data = json.loads(clean_output(response_text(response), "json"))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"output is not valid JSON: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ValueError("output is not a JSON object")
+    return data
+
+
+def repair_request(
+    request: Dict[str, Any], response: ChatCompletion, error: Exception
+) -> Dict[str, Any]:
+    """The request extended with the rejected reply and the reason."""
+    messages = list(request["messages"])
+    content = response.choices[0].message.content
+    if content:
+        messages.append({"role": "assistant", "content": content})
+    messages.append({"role": "user", "content": REPAIR_MESSAGE.format(error=error)})
+    return {**request, "messages": messages}
+
+
+def repaired(
+    call: Callable[[Dict[str, Any]], ChatCompletion],
+    request: Dict[str, Any],
+    response: ChatCompletion,
+    parse: Callable[[ChatCompletion], T],
+    retries: int,
+    label: str = "Model output",
+) -> T:
+    """
+    parse(response), retrying with repair_request() up to `retries` times
+    while it raises ValueError. Raises the last ValueError.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return parse(response)
+        except ValueError as exc:
+            if attempt == retries:
+                raise
+            logging.warning(f"{label} rejected ({exc}); repair {attempt + 1}/{retries}")
+            request = repair_request(request, response, exc)
+            response = call(request)
+    raise AssertionError("unreachable")
+
+
+def complete_repaired(
+    call: Callable[[Dict[str, Any]], ChatCompletion],
+    request: Dict[str, Any],
+    parse: Callable[[ChatCompletion], T],
+    retries: int,
+    label: str = "Model output",
+) -> T:
+    return repaired(call, request, call(request), parse, retries, label)
+
+
+async def arepaired(
+    call: Callable[[Dict[str, Any]], Awaitable[ChatCompletion]],
+    request: Dict[str, Any],
+    response: ChatCompletion,
+    parse: Callable[[ChatCompletion], T],
+    retries: int,
+    label: str = "Model output",
+) -> T:
+    """Async repaired()."""
+    for attempt in range(retries + 1):
+        try:
+            return parse(response)
+        except ValueError as exc:
+            if attempt == retries:
+                raise
+            logging.warning(f"{label} rejected ({exc}); repair {attempt + 1}/{retries}")
+            request = repair_request(request, response, exc)
+            response = await call(request)
+    raise AssertionError("unreachable")
+
+
+async def acomplete_repaired(
+    call: Callable[[Dict[str, Any]], Awaitable[ChatCompletion]],
+    request: Dict[str, Any],
+    parse: Callable[[ChatCompletion], T],
+    retries: int,
+    label: str = "Model output",
+) -> T:
+    return await arepaired(call, request, await call(request), parse, retries, label)
@@ -0,0 +1,158 @@
+"""
+llm_telemetry.py
+
+Structured per-call telemetry for the model-calling scripts.
+
+ModelRuntime appends one JSON line per model call to --telemetry (default
+$LLM_TELEMETRY; disabled when neither is set), and one per process when it
+closes:
+
+  {"kind": "call", "ts", "run", "stage", "model", "mode", "outcome",
+   "latency_s", "retries", "stream_aborts", "prompt_tokens",
+   "cached_tokens", "completion_tokens", "request_hash", "inputs", "error"}
+  {"kind": "process", "ts", "run", "stage", "wall_s", "calls"}
+
+(wall_s runs from the runtime's creation to its close.)
+
+- stage: the script name (system-prompt-analysis, ...)
+- run: $LLM_TELEMETRY_RUN (the Makefile sets one per make invocation), so
+  the records of one `make all` can be told apart from earlier ones
+- mode: sync, async, stream or batch; outcome: ok, cached (response cache
+  hit, no tokens spent), error or aborted (streamed output rejected on
+  every attempt)
+- latency_s: wall time of the call including retries and backoff; for
+  batch results, the batch's own created -> completed time
+- request_hash: the response cache key of the request
+- inputs: {file name: SHA-256} of the input files the script passed for
+  the call
+
+Each record is a single O_APPEND write, so concurrent processes (make -j)
+can share one file. scripts/telemetry-report.py aggregates the file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from openai.types.chat import ChatCompletion
+
+# Retries of the call in progress (per asyncio task / thread of control)
+call_retries: ContextVar[Optional[List[int]]] = ContextVar("call_retries", default=None)
+
+
+def add_telemetry_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--telemetry",
+        type=Path,
+        default=os.environ.get("LLM_TELEMETRY") or None,
+        help="Append a JSONL record per model call to this file "
+        "(default: $LLM_TELEMETRY; disabled if unset)",
+    )
+
+
+def utc_now() -> str:
+    return datetime.now(tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Telemetry:
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self.stage = Path(sys.argv[0]).stem or "python"
+        self.run = os.environ.get("LLM_TELEMETRY_RUN") or None
+        self.started = time.perf_counter()
+        self.calls = 0
+        self._hashes: Dict[Path, str] = {}
+        self._fd: Optional[int] = None
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "Telemetry":
+        return cls(getattr(args, "telemetry", None))
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def input_hashes(self, inputs: Sequence[Path]) -> Dict[str, str]:
+        hashes = {}
+        for path in inputs:
+            path = Path(path)
+            if path not in self._hashes:
+                try:
+                    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+                except OSError:
+                    digest = ""
+                self._hashes[path] = digest
+            hashes[path.name] = self._hashes[path]
+        return hashes
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.path is None:
+            return
+        if self._fd is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        line = json.dumps(
+            {"ts": utc_now(), "run": self.run, "stage": self.stage, **record}
+        )
+        os.write(self._fd, (line + "\n").encode("utf-8"))
+
+    def call(
+        self,
+        *,
+        model: Optional[str],
+        mode: str,
+        outcome: str,
+        latency: Optional[float],
+        request_hash: str,
+        inputs: Sequence[Path] = (),
+        response: Optional[ChatCompletion] = None,
+        retries: int = 0,
+        stream_aborts: int = 0,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self.calls += 1
+        if self.path is None:
+            return
+        usage = response.usage if response is not None and outcome != "cached" else None
+        details = usage.prompt_tokens_details if usage else None
+        self._write(
+            {
+                "kind": "call",
+                "model": model,
+                "mode": mode,
+                "outcome": outcome,
+                "latency_s": round(latency, 3) if latency is not None else None,
+                "retries": retries,
+                "stream_aborts": stream_aborts,
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "cached_tokens": (details.cached_tokens or 0) if details else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0,
+                "request_hash": request_hash,
+                "inputs": self.input_hashes(inputs),
+                "error": (
+                    f"{error.__class__.__name__}: {error}"[:300] if error else None
+                ),
+            }
+        )
+
+    def close(self) -> None:
+        if self.path is not None and self.calls:
+            self._write(
+                {
+                    "kind": "process",
+                    "wall_s": round(time.perf_counter() - self.started, 3),
+                    "calls": self.calls,
+                }
+            )
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["openai", "pyyaml"]
+# ///
+"""
+mock-model-server.py
+
+Serve a local OpenAI-compatible stand-in for the model API (llm_mock.py):
+replayed or synthesized per-stage responses, with configurable latency,
+fault rates and concurrency limit, plus the files and batches endpoints.
+Point the scripts at it with OPENAI_BASE_URL (any API key works).
+
+Per-stage counts are served at /mock/stats and logged on exit.
+
+Usage:
+  uv run --locked scripts/mock-model-server.py --port 8765
+  uv run --locked scripts/mock-model-server.py --latency lognormal:1.5:0.6 --token-rate 60 --error-rate 0.05
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock make all DRY_RUN=false
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from llm_mock import MockServer, MockState, add_mock_arguments
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local OpenAI-compatible mock of the model API"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address")
+    parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on (default: 8765)"
+    )
+    add_mock_arguments(parser)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    try:
+        state = MockState(args)
+    except (OSError, ValueError):
+        logging.exception("Invalid mock configuration")
+        sys.exit(1)
+
+    server = MockServer((args.host, args.port), state)
+    logging.info(f"Mock model API on {server.base_url} ({len(state.stages)} stages)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(json.dumps(state.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["openai", "pyyaml"]
+# ///
+"""
+pipeline-benchmark.py
+
+Offline end-to-end benchmark: run the Makefile DAG against the local mock
+model API (llm_mock.py) and report wall time, throughput, concurrency and
+retry behaviour, without API keys or network access.
+
+The data directory (payloads, prompts, schema, scripts, Makefile) is copied
+to a scratch directory, so the checked-in artifacts and caches are never
+touched. Each run starts from `make clean` with an empty response cache
+(--warm-cache keeps the cache after the first run, to time a fully cached
+rerun), and runs `make -j JOBS TARGET DRY_RUN=false` with OPENAI_BASE_URL
+pointing at the mock. Per run the report gives:
+
+- wall time and make's exit status
+- mock requests, requests/s, completion tokens/s, faults injected,
+  throttled requests (--max-inflight) and peak in-flight requests
+- per-stage calls, retries, errors and p50/p95 latency from the model
+  telemetry (llm_telemetry.py), largest stage first
+
+The mock's latency, token rate and fault options (see llm_mock.py) shape
+the simulated provider; --make-var passes Makefile variables, e.g.
+STREAM=true or PRIMITIVES_LEAF_SIZE=4.
+
+Usage:
+  uv run --locked scripts/pipeline-benchmark.py --jobs 4 --latency lognormal:2:0.5 --token-rate 80
+  uv run --locked scripts/pipeline-benchmark.py --runs 3 --error-rate 0.1 --make-var ANALYSIS_CONCURRENCY=16
+  uv run --locked scripts/pipeline-benchmark.py --uv-run python3 --format json --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from llm_mock import add_mock_arguments, start_server
+
+DATA_DIR = Path(__file__).resolve().parent.parent
+
+# Caches and scratch state never copied into the benchmark tree
+SKIPPED = (".llm-cache", ".similarity-cache", ".telemetry", ".batch", "__pycache__")
+
+# Files above the data directory the Makefile depends on
+PARENT_INPUTS = ("goal.md", "methodology.md")
+
+
+def prepare_tree(data_dir: Path, workdir: Path) -> Path:
+    """Copy the data directory (and its parent inputs) into workdir."""
+    tree = workdir / "data"
+    shutil.copytree(
+        data_dir, tree, ignore=shutil.ignore_patterns(*SKIPPED), dirs_exist_ok=True
+    )
+    for name in PARENT_INPUTS:
+        source = data_dir.parent / name
+        if source.exists():
+            shutil.copy2(source, workdir / name)
+    return tree
+
+
+def make_command(args: argparse.Namespace, tree: Path, *targets: str) -> List[str]:
+    command = ["make", "-C", str(tree), f"-j{args.jobs}", *targets, "DRY_RUN=false"]
+    if args.keep_going:
+        command.insert(1, "--keep-going")
+    if args.uv_run:
+        command.append(f"UV_RUN={args.uv_run}")
+    return command + args.make_var
+
+
+def stage_report(tree: Path, run_id: str) -> List[Dict[str, Any]]:
+    """Per-stage rows of telemetry-report.py for one run ([] if none)."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(Path(__file__).with_name("telemetry-report.py")),
+            "--input",
+            str(tree / ".telemetry" / "calls.jsonl"),
+            "--run",
+            run_id,
+            "--format",
+            "json",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        logging.warning(f"No telemetry for {run_id}: {result.stderr.strip()}")
+        return []
+    return json.loads(result.stdout)["stages"]
+
+
+def run_once(
+    args: argparse.Namespace, tree: Path, server: Any, k: int
+) -> Dict[str, Any]:
+    run_id = f"bench-{k}"
+    subprocess.run(make_command(args, tree, "clean"), capture_output=True, check=False)
+    shutil.rmtree(tree / ".batch", ignore_errors=True)
+    if k == 1 or not args.warm_cache:
+        shutil.rmtree(tree / ".llm-cache", ignore_errors=True)
+
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": server.base_url,
+        "OPENAI_API_KEY": "mock",
+        "LLM_TELEMETRY": str(tree / ".telemetry" / "calls.jsonl"),
+        "LLM_TELEMETRY_RUN": run_id,
+    }
+    server.state.reset()
+    log_path = tree / f"{run_id}.log"
+    logging.info(f"Run {k}/{args.runs}: make -j{args.jobs} {args.target} ({log_path})")
+    started = time.perf_counter()
+    with log_path.open("w", encoding="utf-8") as log:
+        try:
+            result = subprocess.run(
+                make_command(args, tree, args.target),
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                timeout=args.timeout,
+            )
+            exit_code: Optional[int] = result.returncode
+        except subprocess.TimeoutExpired:
+            exit_code = None
+    wall = time.perf_counter() - started
+
+    mock = server.state.snapshot()
+    totals: Dict[str, int] = {}
+    for counts in mock["stages"].values():
+        for name, value in counts.items():
+            totals[name] = totals.get(name, 0) + value
+    return {
+        "run": run_id,
+        "exit_code": exit_code,
+        "wall_s": round(wall, 3),
+        "requests": totals.get("requests", 0),
+        "requests_per_s": round(totals.get("requests", 0) / wall, 3),
+        "completion_tokens_per_s": round(totals.get("completion_tokens", 0) / wall, 1),
+        "faults": totals.get("faults", 0),
+        "throttled": totals.get("throttled", 0),
+        "peak_inflight": mock["peak_inflight"],
+        "mock": mock,
+        "stages": stage_report(tree, run_id),
+    }
+
+
+def fmt(value: Any) -> str:
+    if value is None:
+        return "n/a"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def markdown(args: argparse.Namespace, runs: List[Dict[str, Any]]) -> str:
+    lines = [
+        "# Pipeline benchmark (mock model API)",
+        "",
+        f"make -j{args.jobs} {args.target} {' '.join(args.make_var)}".rstrip()
+        + f"; latency {args.latency}, token rate {args.token_rate:g}/s, "
+        f"error rate {args.error_rate:g}, max in-flight {args.max_inflight or 'unlimited'}",
+        "",
+        "| run | exit | wall s | requests | req/s | completion tok/s | faults | throttled | peak in-flight |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in runs:
+        cells = [
+            r["run"],
+            "timeout" if r["exit_code"] is None else str(r["exit_code"]),
+            fmt(r["wall_s"]),
+            fmt(r["requests"]),
+            fmt(r["requests_per_s"]),
+            fmt(r["completion_tokens_per_s"]),
+            fmt(r["faults"]),
+            fmt(r["throttled"]),
+            fmt(r["peak_inflight"]),
+        ]
+        lines.append("| " + " | ".join(cells) + " |")
+
+    for r in runs:
+        if not r["stages"]:
+            continue
+        lines += [
+            "",
+            f"## {r['run']} by stage",
+            "",
+            "| stage | calls | cached | retries | errors | p50 s | p95 s | wall s |",
+            "|---|---|---|---|---|---|---|---|",
+        ]
+        for s in r["stages"]:
+            cells = [
+                s["stage"],
+                fmt(s["calls"]),
+                fmt(s["cached"]),
+                fmt(s["retries"]),
+                fmt(s["errors"] + s["aborted"]),
+                fmt(s["p50_latency_s"]),
+                fmt(s["p95_latency_s"]),
+                fmt(s["wall_s"]),
+            ]
+            lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run the Makefile DAG against a local mock model API and time it"
+    )
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=DATA_DIR,
+        help="Data directory with the Makefile (default: this repository's data/)",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        help="Scratch directory for the copied tree, kept afterwards "
+        "(default: a temporary directory)",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch tree and make logs"
+    )
+    parser.add_argument("--target", default="all", help="Make target (default: all)")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Parallel make jobs (default: 1)"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=1, help="Number of runs (default: 1)"
+    )
+    parser.add_argument(
+        "--keep-going",
+        action="store_true",
+        help="Pass --keep-going to make, to time every stage that can still run",
+    )
+    parser.add_argument(
+        "--warm-cache",
+        action="store_true",
+        help="Keep the response cache after the first run",
+    )
+    parser.add_argument(
+        "--make-var",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Makefile variable for every run (repeatable)",
+    )
+    parser.add_argument(
+        "--uv-run",
+        help="Script runner passed as UV_RUN (default: the Makefile's uv run --locked)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=3600.0,
+        help="Seconds before a run is abandoned (default: 3600)",
+    )
+    add_mock_arguments(parser)
+    parser.add_argument(
+        "--format",
+        choices=["markdown", "json"],
+        default="markdown",
+        help="Report format (default: markdown)",
+    )
+    parser.add_argument(
+        "--output",
+        help="Output file (prints to stdout if omitted)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    if not (args.data / "Makefile").exists():
+        sys.exit(f"No Makefile in {args.data}")
+    try:
+        server = start_server(args)
+    except (OSError, ValueError):
+        logging.exception("Failed to start the mock model API")
+        sys.exit(1)
+    logging.info(f"Mock model API on {server.base_url}")
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="pipeline-benchmark-"))
+    try:
+        tree = prepare_tree(args.data, workdir)
+        runs = [run_once(args, tree, server, k) for k in range(1, args.runs + 1)]
+    finally:
+        server.shutdown()
+        if args.keep or args.workdir:
+            logging.info(f"Benchmark tree kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.format == "json":
+        report = json.dumps({"runs": runs}, indent=2) + "\n"
+    else:
+        report = markdown(args, runs)
+
+    if args.output:
+        try:
+            Path(args.output).write_text(report, encoding="utf-8")
+            logging.info(f"Benchmark report written to {args.output}")
+        except Exception:
+            logging.exception("Failed to write output file")
+            sys.exit(1)
+    else:
+        print(report, end="")
+
+    if any(r["exit_code"] != 0 for r in runs):
+        logging.error("make failed in at least one run; see the logs (--keep)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,24 @@ Expected CSV columns:
   - file_b
   - weighted_score
 
+A binary .simmat companion written by prompt-similarity.py --matrix is also
+accepted and is memory-mapped instead of parsed. Given a dendrogram written
+by dendrogram-from-csv.py, clusters are looked up from the stored merges;
+without --threshold the cut is the one chosen for the edges the dendrogram
+was built from (stored with it), so both inputs give the same clusters.
+
+Connected components at one threshold either chain a large, dense corpus
+into a single cluster or fragment it. --method label-propagation or
+--method louvain instead detect communities on a sparse kNN graph (each
+prompt's --knn strongest edges), in time roughly linear in N·k. The
+cluster CSV format is the same for every method; its threshold column
+holds the minimum edge score kept (--threshold, default 0).
+
 Usage:
   uv run --locked python prompt-clustering-from-csv.py similarities.csv
   uv run --locked python prompt-clustering-from-csv.py similarities.csv --csv clusters.csv
+  uv run --locked python prompt-clustering-from-csv.py dendrogram.json --threshold 0.65
+  uv run --locked python prompt-clustering-from-csv.py similarities.csv --method louvain --knn 15
 """
 
 from __future__ import annotations
@@ -27,68 +42,12 @@ import csv
 import logging
 import sys
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
 
 import numpy as np
-
-# -------------------------
-# Threshold auto-tuning
-# -------------------------
-
-
-def auto_threshold(scores: List[float]) -> float:
-    """
-    Pick threshold via largest-gap (1D knee) heuristic.
-    """
-    if len(scores) < 2:
-        return 1.0
-
-    scores = sorted(scores, reverse=True)
-    diffs = [scores[i] - scores[i + 1] for i in range(len(scores) - 1)]
-    idx = int(np.argmax(diffs))
-    return round(scores[idx + 1], 2)
-
-
-# -------------------------
-# Clustering
-# -------------------------
-
-
-def build_clusters(
-    files: Set[str],
-    edges: Dict[Tuple[str, str], float],
-    threshold: float,
-) -> Dict[int, Set[str]]:
-    graph: Dict[str, Set[str]] = {f: set() for f in files}
-
-    for (a, b), score in edges.items():
-        if score >= threshold:
-            graph[a].add(b)
-            graph[b].add(a)
-
-    visited: Set[str] = set()
-    clusters: Dict[int, Set[str]] = {}
-    cid = 0
-
-    for node in graph:
-        if node in visited:
-            continue
-        stack = [node]
-        cluster = set()
-
-        while stack:
-            cur = stack.pop()
-            if cur in visited:
-                continue
-            visited.add(cur)
-            cluster.add(cur)
-            stack.extend(graph[cur] - visited)
-
-        clusters[cid] = cluster
-        cid += 1
-
-    return clusters
-
+from dendrogram import is_dendrogram_file, load_dendrogram
+from similarity_communities import knn_graph, label_propagation, louvain
+from similarity_graph import SimilarityGraph, auto_threshold
+from similarity_matrix import read_edges
 
 # -------------------------
 # Main
@@ -99,10 +58,36 @@ def main() -> None:
     parser = argparse.ArgumentParser(
         description="Cluster prompts from a similarities CSV with auto-tuned threshold"
     )
-    parser.add_argument("csv", help="similarities.csv input file")
+    parser.add_argument(
+        "csv", help="similarities.csv (or .simmat / dendrogram.json) input file"
+    )
     parser.add_argument(
         "--csv-out", help="Optional CSV output path for cluster assignments"
     )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="Similarity threshold (default: largest gap between edge scores; "
+        "a dendrogram input uses the one stored when it was built)",
+    )
+    parser.add_argument(
+        "--method",
+        choices=["components", "label-propagation", "louvain"],
+        default="components",
+        help="Clustering method (default: components)",
+    )
+    parser.add_argument(
+        "--knn",
+        type=int,
+        default=10,
+        help="Neighbours kept per prompt for community methods (default: 10)",
+    )
+    parser.add_argument(
+        "--resolution",
+        type=float,
+        default=1.0,
+        help="Louvain resolution; higher gives smaller communities (default: 1.0)",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -127,33 +112,58 @@ def main() -> None:
             print(f"Dry run: Would write output to {args.csv_out}")
         return
 
-    edges: Dict[Tuple[str, str], float] = {}
-    files: Set[str] = set()
-    scores: List[float] = []
-
-    with csv_path.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        required = {"file_a", "file_b", "weighted_score"}
-        if not required.issubset(reader.fieldnames or []):
-            sys.exit(f"CSV must contain columns: {', '.join(required)}")
-
-        for row in reader:
-            a = row["file_a"]
-            b = row["file_b"]
-            score = float(row["weighted_score"])
-            files.update([a, b])
-            edges[(a, b)] = score
-            scores.append(score)
-
-    threshold = auto_threshold(scores)
-    logging.info(f"Auto-selected similarity threshold: {threshold}")
-
-    clusters = build_clusters(files, edges, threshold)
-
-    print(f"\nClusters (threshold ≥ {threshold}):\n")
+    if args.method != "components":
+        if is_dendrogram_file(csv_path):
+            sys.exit(f"--method {args.method} needs a similarities CSV or .simmat")
+        threshold = args.threshold if args.threshold is not None else 0.0
+        files, rows, cols, scores = read_edges(csv_path, threshold)
+        graph = knn_graph(
+            SimilarityGraph.from_edges(files, rows, cols, scores),
+            args.knn,
+        )
+        logging.info(
+            f"kNN graph (k={args.knn}): {graph.n} prompts, {graph.edge_count} edges"
+        )
+        logging.debug(f"kNN degree stats: {graph.degree_stats()}")
+        if args.method == "louvain":
+            labels = louvain(graph, resolution=args.resolution)
+        else:
+            labels = label_propagation(graph)
+        clusters = {}
+        for k in np.argsort(labels, kind="stable").tolist():
+            clusters.setdefault(int(labels[k]), []).append(files[k])
+        clusters = {cid: sorted(members) for cid, members in clusters.items()}
+        logging.info(f"{args.method}: {len(clusters)} clusters")
+    elif is_dendrogram_file(csv_path):
+        dendrogram = load_dendrogram(csv_path)
+        threshold = args.threshold
+        if threshold is None:
+            threshold = dendrogram.auto_threshold
+            logging.info(f"Auto-selected similarity threshold: {threshold}")
+        clusters = {
+            cid: sorted(members)
+            for cid, members in dendrogram.clusters_at(threshold).items()
+        }
+    else:
+        threshold = args.threshold
+        files, rows, cols, scores = read_edges(csv_path, threshold)
+        if threshold is None:
+            threshold = auto_threshold(scores.tolist())
+            logging.info(f"Auto-selected similarity threshold: {threshold}")
+        graph = SimilarityGraph.from_edges(files, rows, cols, scores, threshold)
+        logging.debug(f"Graph at threshold {threshold}: {graph.degree_stats()}")
+        clusters = {
+            cid: sorted(files[k] for k in members.tolist())
+            for cid, members in enumerate(graph.components())
+        }
+
+    if args.method == "components":
+        print(f"\nClusters (threshold ≥ {threshold}):\n")
+    else:
+        print(f"\nClusters ({args.method}, k={args.knn}, threshold ≥ {threshold}):\n")
     for cid, members in clusters.items():
         print(f"Cluster {cid} ({len(members)} files):")
-        for m in sorted(members):
+        for m in members:
             print(f"  - {m}")
         print()
 
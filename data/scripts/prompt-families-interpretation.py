@@ -23,15 +23,8 @@ import logging
 import sys
 from pathlib import Path
 
-import openai
-
-
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
+from llm_runtime import (ModelRuntime, add_model_arguments, read_text,
+                         setup_logging)
 
 
 def main() -> None:
@@ -42,35 +35,14 @@ def main() -> None:
         "--prompt", required=True, help="Interpretation prompt (Markdown)"
     )
     parser.add_argument("--families", required=True, help="prompt-families.csv")
-    parser.add_argument(
-        "--model",
-        default="gpt-5.2",
-        help="Model name (default: gpt-5.2)",
-    )
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
-    )
+    add_model_arguments(parser, "gpt-5.2")
     parser.add_argument(
         "--output",
         help="Output report file (prints to stdout if omitted)",
     )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print request payload and exit without calling the API",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
     args = parser.parse_args()
 
-    logging.basicConfig(
-        level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
+    setup_logging(args.verbose)
 
     prompt_path = Path(args.prompt)
     families_path = Path(args.families)
@@ -103,19 +75,24 @@ def main() -> None:
             print(f"\n[{m['role']}]\n{m['content']}")
         return
 
-    client = openai.OpenAI()
+    runtime = ModelRuntime(args)
 
     logging.info(f"Calling model {args.model} for family interpretation...")
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0.1,
-            seed=args.seed,
+        response = runtime.complete(
+            {
+                "model": args.model,
+                "messages": messages,
+                "temperature": 0.1,
+                "seed": args.seed,
+            },
+            inputs=[families_path],
         )
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
 
     output = response.choices[0].message.content
     if not output:
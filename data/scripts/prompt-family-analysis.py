@@ -26,7 +26,8 @@ import re
 import sys
 from pathlib import Path
 
-import openai
+from llm_runtime import (ModelRuntime, add_model_arguments, read_text,
+                         setup_logging)
 
 EXPECTED_HEADER = [
     "family_id",
@@ -40,14 +41,6 @@ EXPECTED_HEADER = [
 ]
 
 
-def read_text(path: Path) -> str:
-    try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
-
-
 def extract_csv_block(text: str) -> str:
     """
     Extract the first CSV-looking block from the model output.
@@ -82,31 +75,14 @@ def main() -> None:
     parser.add_argument("--prompt", required=True, help="Analysis prompt (Markdown)")
     parser.add_argument("--similarities", required=True, help="similarities.csv")
     parser.add_argument("--bands", required=True, help="band-report.csv")
-    parser.add_argument("--model", required=True, help="Model name (e.g. gpt-5.2)")
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
-    )
+    add_model_arguments(parser)
     parser.add_argument(
         "--output",
         help="Output CSV file (prints to stdout if omitted)",
     )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print request payload and exit without calling the API",
-    )
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Enable verbose logging",
-    )
     args = parser.parse_args()
 
-    logging.basicConfig(
-        level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
+    setup_logging(args.verbose)
 
     prompt_path = Path(args.prompt)
     sim_path = Path(args.similarities)
@@ -149,19 +125,24 @@ def main() -> None:
             print(f"\n[{m['role']}]\n{m['content']}")
         return
 
-    client = openai.OpenAI()
+    runtime = ModelRuntime(args)
 
     logging.info(f"Calling model {args.model} for family analysis...")
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            temperature=0,
-            seed=args.seed,
+        response = runtime.complete(
+            {
+                "model": args.model,
+                "messages": messages,
+                "temperature": 0,
+                "seed": args.seed,
+            },
+            inputs=[sim_path, band_path],
         )
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
 
     output = response.choices[0].message.content
     if not output:
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["numpy", "PyYAML", "scikit-learn", "scipy"]
+# ///
+"""
+prompt-family-assign.py
+
+Assign newly normalized analyses to an existing prompt family, or report
+them as "novel", by scoring them against the persisted family
+representatives (built by family-representatives-from-csv.py) instead of
+rerunning the whole similarity → clustering → family pipeline.
+
+A file joins its best-scoring family when the weighted score reaches that
+family's cutoff (or --threshold, if given); otherwise it is novel. The
+cutoff is calibrated on centroid scores: the least central member's score
+less a margin, or threshold_used for a one-member family (see
+family_centroids.py).
+
+Usage:
+  uv run --locked prompt-family-assign.py analysis/new-tool.agent.analysis.yaml
+  uv run --locked prompt-family-assign.py analysis/*.analysis.yaml \
+    --representatives family-representatives.json --csv-out assignments.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from analysis_loader import load_analyses
+from family_centroids import NOVEL, Representatives
+from similarity_core import document_features
+
+CSV_FIELDS = [
+    "file",
+    "family_id",
+    "family_label",
+    "closest_family_id",
+    "weighted_score",
+    "struct_similarity",
+    "token_similarity",
+    "forbidden_similarity",
+    "threshold",
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Assign normalized analyses to prompt families (or 'novel')"
+    )
+    parser.add_argument(
+        "files", nargs="+", type=Path, help="Normalized analysis YAML files"
+    )
+    parser.add_argument(
+        "--representatives",
+        default="family-representatives.json",
+        help="Family representatives file (default: family-representatives.json)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="Minimum weighted score for any family (default: each family's cutoff)",
+    )
+    parser.add_argument(
+        "--csv-out", help="Optional CSV output path for the assignments"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print what would be done and exit",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    reps_path = Path(args.representatives)
+    if not reps_path.exists():
+        sys.exit(f"Representatives file not found: {reps_path}")
+
+    if args.dry_run:
+        print(f"Dry run: Would assign {len(args.files)} files using {reps_path}")
+        if args.csv_out:
+            print(f"Dry run: Would write output to {args.csv_out}")
+        return
+
+    try:
+        representatives = Representatives(
+            json.loads(reps_path.read_text(encoding="utf-8"))
+        )
+    except Exception:
+        logging.exception(f"Failed to load representatives from {reps_path}")
+        sys.exit(1)
+
+    rows: List[Dict[str, Any]] = []
+    for result in load_analyses(args.files):
+        start = time.perf_counter()
+        family_id, best = representatives.assign(
+            document_features(result.data), args.threshold
+        )
+        logging.debug(
+            f"Scored {result.path.name} against {len(representatives.families)} "
+            f"families in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+        row: Dict[str, Any] = {"file": result.path.name, "family_id": family_id}
+        if best is not None:
+            row.update(
+                {
+                    "family_label": best.family_label if family_id != NOVEL else "",
+                    "closest_family_id": best.family_id,
+                    "weighted_score": best.weighted_score,
+                    "struct_similarity": best.struct_similarity,
+                    "token_similarity": best.token_similarity,
+                    "forbidden_similarity": best.forbidden_similarity,
+                    "threshold": (
+                        best.threshold if args.threshold is None else args.threshold
+                    ),
+                }
+            )
+        rows.append(row)
+
+        if best is None:
+            print(f"{row['file']} → {NOVEL} (no families)")
+        elif family_id == NOVEL:
+            print(
+                f"{row['file']} → {NOVEL} (closest {best.family_id} "
+                f"{best.family_label}: {best.weighted_score:.4f} < {row['threshold']})"
+            )
+        else:
+            print(
+                f"{row['file']} → {family_id} {best.family_label} "
+                f"(score={best.weighted_score:.4f})"
+            )
+
+    if args.csv_out:
+        out_path = Path(args.csv_out)
+        with out_path.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        logging.info(f"Assignments written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 #
 # /// script
 # requires-python = ">=3.12"
-# dependencies = ["PyYAML", "scikit-learn"]
+# dependencies = ["numpy", "PyYAML", "scikit-learn", "scipy"]
 # ///
 """
 prompt-similarity.py
@@ -10,136 +10,466 @@ prompt-similarity.py
 Compute pairwise similarity between normalized system-prompt YAML files
 using structural, lexical, and constraint-based metrics.
 
+All pairs are scored in matrix blocks: token cosine is a single sparse
+product over the TF-IDF matrix, structural Jaccard is a popcount over
+packed schema-path bitsets, and forbidden-action Jaccard is a sparse
+incidence-matrix product, so the per-pair interpreter work is limited to
+emitting rows. Rows are streamed to the CSV as they are produced.
+
+--top-k keeps only each document's K best neighbours and --min-score drops
+pairs below a weighted score, producing a sparse similarities.csv that the
+band-report and clustering scripts read unchanged. --quiet suppresses the
+per-pair lines on stdout.
+
+--matrix writes the same rows to a compact binary companion (see
+similarity_matrix.py) that the graph scripts memory-map instead of
+parsing CSV text.
+
+With --approx, MinHash signatures over schema paths, terms and forbidden
+actions are bucketed with locality-sensitive hashing, one banding per
+feature family; only the pairs colliding in any family are scored
+(exactly, with the same weighted formula) and those at or above
+--approx-threshold are emitted. This keeps
+very large corpora near-linear at the cost of some recall, which
+--measure-recall reports against the exact all-pairs mode.
+
+With --cache DIR, per-document features (schema paths, normalized text,
+term counts, forbidden actions) are persisted by file content hash. When
+the previous --csv output is still in place, only pairs touching new or
+changed documents are rescored and merged into it; TF-IDF weights stay
+frozen until --rebuild or until drift exceeds --refit-ratio (see
+similarity_cache.py). Incremental runs print only the rescored pairs.
+
 Human-readable output is always printed to stdout.
 Optionally, a CSV summary can be emitted for downstream analysis.
 
 Usage:
   python prompt-similarity.py normalized/*.yaml
   python prompt-similarity.py normalized/*.yaml --csv similarities.csv
+  python prompt-similarity.py normalized/*.yaml --approx --approx-threshold 0.7 \
+    --measure-recall --csv similarities.csv
+  python prompt-similarity.py normalized/*.yaml --cache .similarity-cache \
+    --csv similarities.csv
+  python prompt-similarity.py normalized/*.yaml --quiet --top-k 20 \
+    --csv similarities.csv --matrix similarities.simmat
 """
 
 from __future__ import annotations
 
 import argparse
 import csv
+import heapq
 import logging
-import re
 import sys
-from itertools import combinations
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Set
-
-import yaml
-from sklearn.feature_extraction.text import TfidfVectorizer
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from analysis_loader import load_analyses
+from scipy import sparse
+from similarity_cache import FeatureStore, csv_fingerprint, file_digest
+from similarity_core import (WEIGHTS, PathVocabulary, bitset_jaccard_pairs,
+                             bitset_jaccard_rows, bitset_sizes,
+                             document_features, fit_idf, hash_items,
+                             incidence_matrix, jaccard_pairs, jaccard_rows,
+                             lsh_family_pairs, lsh_params, pack_bitsets,
+                             tfidf_matrix)
+from similarity_matrix import MatrixWriter
 from sklearn.metrics.pairwise import cosine_similarity
 
-STOPWORDS = {
-    "the",
-    "and",
-    "or",
-    "to",
-    "of",
-    "in",
-    "for",
-    "with",
-    "on",
-    "by",
-    "is",
-    "are",
-    "be",
-    "as",
-    "that",
-    "this",
-    "it",
-    "must",
-    "should",
-    "may",
-    "only",
-    "not",
-    "do",
-}
-
-# Weighting rationale:
-# - structure: governance shape (strongest signal)
-# - forbidden: prohibitions encode risk boundaries
-# - token: wording similarity (weakest, most brittle)
-WEIGHTS = {
-    "structure": 0.5,
-    "forbidden": 0.3,
-    "token": 0.2,
-}
+CSV_FIELDS = [
+    "file_a",
+    "file_b",
+    "struct_similarity",
+    "token_similarity",
+    "forbidden_similarity",
+    "weighted_score",
+]
+
+# (row indices, column indices, struct, token, forbidden, weighted)
+PairBlock = Tuple[
+    np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray
+]
 
 
 # -------------------------
-# YAML loading and traversal
+# Matrix scoring
 # -------------------------
 
 
-def load_yaml(path: Path) -> Dict[str, Any]:
-    try:
-        with path.open("r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
-    except Exception:
-        logging.exception(f"Failed to load YAML file {path}")
-        sys.exit(1)
+class PairScorer:
+    """
+    Precomputed per-document matrices for the three metrics, scored either
+    as row blocks against every document or as explicit pairs.
+    """
+
+    def __init__(
+        self,
+        structures: np.ndarray,
+        vectors: sparse.csr_matrix,
+        forbidden: List[Set[str]],
+    ) -> None:
+        self.n = structures.shape[0]
+        self.structures = structures
+        self.struct_sizes = bitset_sizes(structures)
+        self.vectors = vectors
+        self.forbid_matrix = incidence_matrix(forbidden)
+        self.forbid_sizes = np.asarray(self.forbid_matrix.sum(axis=1)).ravel()
+
+    def rows(self, rows: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """(struct, token, forbidden, weighted) matrices of shape rows × N."""
+        struct_sim = bitset_jaccard_rows(self.structures, self.struct_sizes, rows)
+        token_sim = cosine_similarity(self.vectors[rows], self.vectors)
+        forbid_sim = jaccard_rows(self.forbid_matrix, self.forbid_sizes, rows)
+        return (
+            struct_sim,
+            token_sim,
+            forbid_sim,
+            weighted_score(struct_sim, token_sim, forbid_sim),
+        )
 
+    def pairs(self, i: np.ndarray, j: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """(struct, token, forbidden, weighted) vectors for pairs (i[k], j[k])."""
+        struct_vals = bitset_jaccard_pairs(self.structures, self.struct_sizes, i, j)
+        token_vals = np.asarray(
+            self.vectors[i].multiply(self.vectors[j]).sum(axis=1)
+        ).ravel()
+        forbid_vals = jaccard_pairs(self.forbid_matrix, self.forbid_sizes, i, j)
+        return (
+            struct_vals,
+            token_vals,
+            forbid_vals,
+            weighted_score(struct_vals, token_vals, forbid_vals),
+        )
 
-def extract_paths(obj: Any, prefix: str = "") -> Set[str]:
-    paths: Set[str] = set()
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            new_prefix = f"{prefix}.{key}" if prefix else key
-            paths.add(new_prefix)
-            paths |= extract_paths(value, new_prefix)
-    elif isinstance(obj, list):
-        for item in obj:
-            paths |= extract_paths(item, prefix)
-    return paths
-
-
-def extract_text(obj: Any) -> List[str]:
-    texts: List[str] = []
-    if isinstance(obj, str):
-        texts.append(obj)
-    elif isinstance(obj, list):
-        for item in obj:
-            texts.extend(extract_text(item))
-    elif isinstance(obj, dict):
-        for value in obj.values():
-            texts.extend(extract_text(value))
-    return texts
+
+def weighted_score(
+    struct_sim: np.ndarray, token_sim: np.ndarray, forbid_sim: np.ndarray
+) -> np.ndarray:
+    return (
+        WEIGHTS["structure"] * struct_sim
+        + WEIGHTS["forbidden"] * forbid_sim
+        + WEIGHTS["token"] * token_sim
+    )
+
+
+def iter_pair_blocks(
+    scorer: PairScorer,
+    block_size: int,
+    changed: Optional[np.ndarray] = None,
+    min_score: float = 0.0,
+) -> Iterator[PairBlock]:
+    """
+    Yield scores for every unordered pair (i < j), in the same order as
+    itertools.combinations, one block of rows at a time.
+
+    When `changed` (sorted document indices) is given, only pairs touching
+    at least one changed document are scored: k changed rows against all N
+    columns instead of the full triangle. Those pairs come grouped by
+    changed row, not in combinations order; merge_rows() sorts them.
+    """
+    n = scorer.n
+    is_changed = np.ones(n, dtype=bool)
+    row_ids = np.arange(n - 1)
+    if changed is not None:
+        is_changed[:] = False
+        is_changed[changed] = True
+        row_ids = changed
+
+    for start in range(0, len(row_ids), block_size):
+        rows = row_ids[start : start + block_size]
+        matrices = scorer.rows(rows)
+
+        # A pair between two changed rows is emitted once, from its lower row
+        cols_all = np.arange(n)[None, :]
+        mask = (cols_all > rows[:, None]) | (
+            ~is_changed[None, :] & (cols_all != rows[:, None])
+        )
+        if min_score > 0:
+            mask &= matrices[3] >= min_score
+        local_i, cols = np.nonzero(mask)
+        row_i = rows[local_i]
+        yield (
+            np.minimum(row_i, cols),
+            np.maximum(row_i, cols),
+            *(m[local_i, cols] for m in matrices),
+        )
+
+
+def iter_topk_blocks(
+    scorer: PairScorer,
+    block_size: int,
+    top_k: int,
+    min_score: float = 0.0,
+) -> Iterator[PairBlock]:
+    """
+    Yield each document's `top_k` highest-scoring neighbours (ties broken by
+    document order), as unordered pairs (i < j). A pair that is in both
+    documents' lists is emitted once. Pairs are grouped by the row that
+    selected them rather than in itertools.combinations order.
+    """
+    n = scorer.n
+    k = min(top_k, n - 1)
+    neighbours = np.full((n, k), -1, dtype=np.int64)
+
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        matrices = scorer.rows(rows)
+        weighted = matrices[3].copy()
+        weighted[np.arange(len(rows)), rows] = -np.inf
+        weighted[weighted < min_score] = -np.inf
+
+        # Stable sort on the negated score keeps lower column indices first
+        top = np.argsort(-weighted, axis=1, kind="stable")[:, :k]
+        top_scores = np.take_along_axis(weighted, top, axis=1)
+        top[~np.isfinite(top_scores)] = -1
+        neighbours[rows] = top
+
+        local_i, slot = np.nonzero(top >= 0)
+        row_i = rows[local_i]
+        cols = top[local_i, slot]
+        # Skip pairs already emitted from the lower-indexed partner's list
+        seen = (cols < row_i) & (neighbours[cols] == row_i[:, None]).any(axis=1)
+        local_i, row_i, cols = local_i[~seen], row_i[~seen], cols[~seen]
+        yield (
+            np.minimum(row_i, cols),
+            np.maximum(row_i, cols),
+            *(m[local_i, cols] for m in matrices),
+        )
+
+
+def approx_pair_block(
+    scorer: PairScorer,
+    path_ids: List[np.ndarray],
+    terms: List[Dict[str, int]],
+    forbidden: List[Set[str]],
+    threshold: float,
+    lsh_threshold: Optional[float],
+    num_perm: int,
+) -> PairBlock:
+    """
+    Score only LSH candidate pairs and keep those with weighted score at or
+    above the threshold. Pairs are returned in itertools.combinations order.
+
+    Schema paths, terms and forbidden actions are banded as separate
+    families (lsh_family_pairs), each targeting the weighted threshold
+    unless lsh_threshold is given. Terms, not word shingles, stand in for
+    the TF-IDF cosine: their Jaccard tracks it far more closely.
+    """
+    families = [
+        [hash_items(str(pid) for pid in ids.tolist()) for ids in path_ids],
+        [hash_items(doc_terms) for doc_terms in terms],
+        [hash_items(forbid) for forbid in forbidden],
+    ]
+    target = threshold if lsh_threshold is None else lsh_threshold
+    bands, rows = lsh_params(num_perm, target)
+    logging.debug(f"LSH banding per feature family: {bands} bands × {rows} rows")
+
+    i, j = lsh_family_pairs(families, num_perm, target)
+    logging.info(f"LSH produced {len(i)} candidate pairs")
+
+    scores = scorer.pairs(i, j)
+    keep = scores[3] >= threshold
+    return (i[keep], j[keep], *(v[keep] for v in scores))
+
+
+def measure_recall(
+    found: PairBlock,
+    exact_blocks: Iterator[PairBlock],
+    n: int,
+    threshold: float,
+) -> None:
+    """Log the fraction of exact pairs at or above threshold that --approx found."""
+    found_keys = found[0] * n + found[1]
+    total = hits = 0
+    for rows_i, rows_j, _, _, _, weighted in exact_blocks:
+        keep = weighted >= threshold
+        keys = rows_i[keep] * n + rows_j[keep]
+        total += len(keys)
+        hits += int(np.isin(keys, found_keys).sum())
+    recall = hits / total if total else 1.0
+    logging.info(
+        f"Approximate recall at score ≥ {threshold}: {hits}/{total} ({recall:.1%})"
+    )
 
 
 # -------------------------
-# Normalization + metrics
+# Feature cache + incremental runs
 # -------------------------
 
 
-def normalize_text(texts: Iterable[str]) -> str:
-    tokens: List[str] = []
-    for text in texts:
-        words = re.findall(r"[a-zA-Z0-9]+", text.lower())
-        tokens.extend(w for w in words if w not in STOPWORDS)
-    return " ".join(tokens)
+def load_features(
+    paths: List[Path], store: Optional[FeatureStore], workers: Optional[int]
+) -> List[Dict[str, Any]]:
+    """
+    Return per-document features, reading them from the store by content
+    hash when possible. Cache misses are parsed in one parallel batch.
+    """
+    digests = [file_digest(p) for p in paths]
+    features: List[Optional[Dict[str, Any]]] = [
+        store.get(d) if store else None for d in digests
+    ]
+    missing = [k for k, f in enumerate(features) if f is None]
+    if missing:
+        logging.debug(f"Parsing {len(missing)} YAML files")
+        loaded = load_analyses([paths[k] for k in missing], workers=workers)
+        for k, result in zip(missing, loaded):
+            features[k] = document_features(result.data)
+            if store:
+                store.put(digests[k], features[k])
+    return [{**f, "digest": d} for f, d in zip(features, digests)]
+
+
+def plan_incremental(
+    state: Dict[str, Any],
+    names: List[str],
+    digests: List[str],
+    csv_path: Optional[Path],
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    """
+    Decide between a full run and an incremental k×N update.
+
+    Returns a plan with:
+      refit   — whether TF-IDF must be refit (full rescoring)
+      changed — sorted indices of new/changed documents, or None for a full run
+      stale   — names whose previous rows must be dropped when merging
+      drift   — documents added/changed/removed since the last IDF fit
+    """
+    previous: Dict[str, str] = state.get("files", {})
+    changed = [
+        i for i, (n, d) in enumerate(zip(names, digests)) if previous.get(n) != d
+    ]
+    removed = set(previous) - set(names)
+    drift = state.get("drift", 0) + len(changed) + len(removed)
+
+    full = {"refit": True, "changed": None, "stale": set(), "drift": 0}
+    if not state or args.rebuild or "idf" not in state:
+        return full
+    if drift > args.refit_ratio * len(names):
+        logging.info(f"IDF drift {drift}/{len(names)} exceeds --refit-ratio; refitting")
+        return full
+    if args.approx or args.top_k or not csv_path:
+        return {**full, "refit": False, "drift": drift}
+    if state.get("mode") != output_mode(args):
+        logging.info("Output mode changed since the cached run; rescoring all pairs")
+        return {**full, "refit": False, "drift": drift}
+    if state.get("csv") != str(csv_path.resolve()) or state.get(
+        "csv_fingerprint"
+    ) != csv_fingerprint(csv_path):
+        logging.info(f"{csv_path} does not match the cached run; rescoring all pairs")
+        return {**full, "refit": False, "drift": drift}
+
+    return {
+        "refit": False,
+        "changed": np.asarray(changed, dtype=np.int64),
+        "stale": {names[i] for i in changed} | removed,
+        "drift": drift,
+    }
+
+
+def output_mode(args: argparse.Namespace) -> Dict[str, Any]:
+    """Options that determine which rows the CSV holds."""
+    return {"approx": args.approx, "top_k": args.top_k, "min_score": args.min_score}
+
+
+def merge_rows(
+    csv_path: Path,
+    new_rows: List[Dict[str, Any]],
+    names: List[str],
+    stale: Set[str],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Merge freshly scored rows into the previous CSV, dropping rows that
+    involve stale documents. The previous file is already in
+    itertools.combinations order and is streamed; the new rows (grouped by
+    changed document) are sorted into that order first, so the output is
+    the same as a full run's.
+    """
+    position = {name: k for k, name in enumerate(names)}
+
+    def order(row: Dict[str, Any]) -> Tuple[int, int]:
+        return position[row["file_a"]], position[row["file_b"]]
+
+    def previous_rows() -> Iterator[Dict[str, Any]]:
+        with csv_path.open("r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                a, b = row["file_a"], row["file_b"]
+                if a in stale or b in stale or a not in position or b not in position:
+                    continue
+                if position[a] > position[b]:
+                    row["file_a"], row["file_b"] = b, a
+                yield row
+
+    new_rows.sort(key=order)
+    yield from heapq.merge(new_rows, previous_rows(), key=order)
+
+
+def iter_rows(
+    blocks: Iterable[PairBlock], paths: List[Path], quiet: bool
+) -> Iterator[Dict[str, Any]]:
+    """Turn scored blocks into CSV rows, printing each pair unless quiet."""
+    for rows_i, rows_j, struct_vals, token_vals, forbid_vals, weighted in blocks:
+        for i, j, struct_sim, token_sim, forbid_sim, weighted_score in zip(
+            rows_i.tolist(),
+            rows_j.tolist(),
+            struct_vals.tolist(),
+            token_vals.tolist(),
+            forbid_vals.tolist(),
+            weighted.tolist(),
+        ):
+            path_a, path_b = paths[i], paths[j]
+
+            # Human-readable output (unchanged, plus score)
+            if not quiet:
+                print(
+                    f"{path_a.name} ↔ {path_b.name} | "
+                    f"struct={struct_sim:.2f} "
+                    f"token={token_sim:.2f} "
+                    f"forbidden={forbid_sim:.2f} "
+                    f"score={weighted_score:.2f}"
+                )
+
+            yield {
+                "file_a": path_a.name,
+                "file_b": path_b.name,
+                "struct_similarity": round(struct_sim, 4),
+                "token_similarity": round(token_sim, 4),
+                "forbidden_similarity": round(forbid_sim, 4),
+                "weighted_score": round(weighted_score, 4),
+            }
 
 
-def jaccard(a: Set[str], b: Set[str]) -> float:
-    if not a and not b:
-        return 1.0
-    if not a or not b:
-        return 0.0
-    return len(a & b) / len(a | b)
+def tee_rows(
+    rows: Iterable[Dict[str, Any]], writer: MatrixWriter
+) -> Iterator[Dict[str, Any]]:
+    for row in rows:
+        writer.add(row)
+        yield row
 
 
-def get_nested_set(obj: Dict[str, Any], path: List[str]) -> Set[str]:
+def write_csv(csv_path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Stream rows to a temporary file next to csv_path and move it into place,
+    so an incremental merge can still read the previous output.
+    """
+    tmp_path = csv_path.with_name(f".{csv_path.name}.tmp")
+    count = 0
     try:
-        for p in path:
-            obj = obj[p]
-        if isinstance(obj, list):
-            return {str(x) for x in obj}
+        with tmp_path.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(
+                f,
+                fieldnames=CSV_FIELDS,
+            )
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        tmp_path.replace(csv_path)
     except Exception:
-        pass
-    return set()
+        logging.exception("Failed to write CSV output")
+        sys.exit(1)
+    return count
 
 
 # -------------------------
@@ -160,6 +490,80 @@ def main() -> None:
         "--csv",
         help="Optional CSV output path for similarity matrix",
     )
+    parser.add_argument(
+        "--matrix",
+        help="Optional binary (.simmat) companion of the CSV for fast memory-mapped reads",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        help="Only emit each document's K best-scoring neighbours",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=0.0,
+        help="Only emit pairs with weighted score at or above this value",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print the per-pair human-readable lines",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=512,
+        help="Documents scored per matrix block (default: 512)",
+    )
+    parser.add_argument(
+        "--approx",
+        action="store_true",
+        help="Score only MinHash/LSH candidate pairs instead of all pairs",
+    )
+    parser.add_argument(
+        "--approx-threshold",
+        type=float,
+        default=0.7,
+        help="Weighted score a pair must reach to be emitted in --approx mode (default: 0.7)",
+    )
+    parser.add_argument(
+        "--lsh-threshold",
+        type=float,
+        help="Per-family Jaccard targeted by the LSH banding "
+        "(default: the weighted --approx-threshold)",
+    )
+    parser.add_argument(
+        "--num-perm",
+        type=int,
+        default=128,
+        help="MinHash permutations per signature (default: 128)",
+    )
+    parser.add_argument(
+        "--measure-recall",
+        action="store_true",
+        help="In --approx mode, also run the exact scorer and report recall",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes used to parse YAML (default: CPU count)",
+    )
+    parser.add_argument(
+        "--cache",
+        help="Feature cache directory; enables incremental k×N updates of --csv",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Refit TF-IDF and rescore every pair even if the cache is current",
+    )
+    parser.add_argument(
+        "--refit-ratio",
+        type=float,
+        default=0.2,
+        help="Refit TF-IDF once this fraction of documents changed since the last fit (default: 0.2)",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -189,70 +593,108 @@ def main() -> None:
             print(f"Dry run: Would write output to {args.csv}")
         return
 
-    docs = [load_yaml(p) for p in paths]
+    store = FeatureStore(Path(args.cache)) if args.cache else None
+    features = load_features(paths, store, args.workers)
 
-    logging.debug("Extracting structural paths")
-    structures = [extract_paths(d) for d in docs]
+    logging.debug("Encoding structural paths as bitsets")
+    vocab = PathVocabulary()
+    path_ids = [vocab.add(f["paths"]) for f in features]
+    structures = pack_bitsets(path_ids, len(vocab))
+    logging.debug(f"Path vocabulary: {len(vocab)} paths")
 
-    logging.debug("Extracting and normalizing text")
-    texts = [normalize_text(extract_text(d)) for d in docs]
+    forbidden = [set(f["forbidden"]) for f in features]
+    terms = [f["terms"] for f in features]
 
-    tfidf = TfidfVectorizer()
-    vectors = tfidf.fit_transform(texts)
+    csv_path = Path(args.csv) if args.csv else None
+    names = [p.name for p in paths]
+    digests = [f["digest"] for f in features]
+    state = store.load_state() if store else {}
+    plan = plan_incremental(state, names, digests, csv_path, args)
 
-    csv_rows: list[dict[str, str | float]] = []
+    if plan["refit"]:
+        logging.debug("Fitting TF-IDF vocabulary")
+        vocabulary, idf = fit_idf(terms)
+    else:
+        logging.debug("Reusing frozen TF-IDF vocabulary")
+        vocabulary = {t: col for col, t in enumerate(state["vocabulary"])}
+        idf = np.asarray(state["idf"], dtype=np.float64)
+    vectors = tfidf_matrix(terms, vocabulary, idf)
 
-    logging.info("Computing pairwise similarities")
-
-    for (i, path_a), (j, path_b) in combinations(enumerate(paths), 2):
-        struct_sim = jaccard(structures[i], structures[j])
-        token_sim = cosine_similarity(vectors[i], vectors[j])[0][0]
+    if args.approx and args.top_k:
+        sys.exit("--top-k cannot be combined with --approx")
 
-        forbid_a = get_nested_set(docs[i], ["layers", "authority", "forbidden_actions"])
-        forbid_b = get_nested_set(docs[j], ["layers", "authority", "forbidden_actions"])
-        forbid_sim = jaccard(forbid_a, forbid_b)
+    logging.info("Computing pairwise similarities")
 
-        weighted_score = (
-            WEIGHTS["structure"] * struct_sim
-            + WEIGHTS["forbidden"] * forbid_sim
-            + WEIGHTS["token"] * token_sim
+    scorer = PairScorer(structures, vectors, forbidden)
+    block_size = max(1, args.block_size)
+    changed = plan["changed"]
+    if args.approx:
+        cutoff = max(args.approx_threshold, args.min_score)
+        found = approx_pair_block(
+            scorer,
+            path_ids,
+            terms,
+            forbidden,
+            cutoff,
+            args.lsh_threshold,
+            args.num_perm,
         )
-
-        # Human-readable output (unchanged, plus score)
-        print(
-            f"{path_a.name} ↔ {path_b.name} | "
-            f"struct={struct_sim:.2f} "
-            f"token={token_sim:.2f} "
-            f"forbidden={forbid_sim:.2f} "
-            f"score={weighted_score:.2f}"
+        if args.measure_recall:
+            measure_recall(
+                found, iter_pair_blocks(scorer, block_size), len(paths), cutoff
+            )
+        blocks: Iterable[PairBlock] = [found]
+    elif args.top_k:
+        blocks = iter_topk_blocks(scorer, block_size, args.top_k, args.min_score)
+    elif changed is not None:
+        logging.info(
+            f"Incremental update: {len(changed)} new or changed of {len(paths)} files"
         )
+        blocks = iter_pair_blocks(scorer, block_size, changed, args.min_score)
+    else:
+        blocks = iter_pair_blocks(scorer, block_size, min_score=args.min_score)
 
-        csv_rows.append(
-            {
-                "file_a": path_a.name,
-                "file_b": path_b.name,
-                "struct_similarity": round(struct_sim, 4),
-                "token_similarity": round(token_sim, 4),
-                "forbidden_similarity": round(forbid_sim, 4),
-                "weighted_score": round(weighted_score, 4),
-            }
-        )
+    rows = iter_rows(blocks, paths, args.quiet)
+    if changed is not None and csv_path:
+        rows = merge_rows(csv_path, list(rows), names, plan["stale"])
 
-    if args.csv:
-        csv_path = Path(args.csv)
+    if args.matrix:
+        matrix_writer = MatrixWriter(names)
+        rows = tee_rows(rows, matrix_writer)
+
+    if csv_path:
         logging.info(f"Writing CSV output to {csv_path}")
+        count = write_csv(csv_path, rows)
+        logging.debug(f"Wrote {count} rows")
+    else:
+        for _ in rows:
+            pass
+
+    if args.matrix:
+        matrix_path = Path(args.matrix)
+        logging.info(f"Writing binary similarity matrix to {matrix_path}")
         try:
-            with csv_path.open("w", encoding="utf-8", newline="") as f:
-                writer = csv.DictWriter(
-                    f,
-                    fieldnames=csv_rows[0].keys(),
-                )
-                writer.writeheader()
-                writer.writerows(csv_rows)
+            matrix_writer.write(matrix_path)
         except Exception:
-            logging.exception("Failed to write CSV output")
+            logging.exception("Failed to write similarity matrix")
             sys.exit(1)
 
+    if store:
+        store.save_state(
+            {
+                "files": dict(zip(names, digests)),
+                "vocabulary": sorted(vocabulary, key=vocabulary.__getitem__),
+                "idf": idf.tolist(),
+                "drift": plan["drift"],
+                "mode": output_mode(args),
+                "csv": str(csv_path.resolve()) if csv_path else None,
+                "csv_fingerprint": csv_fingerprint(csv_path) if csv_path else None,
+            }
+        )
+        logging.debug(
+            f"Feature cache: {store.hits} hits, {store.misses} misses ({store.root})"
+        )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,96 @@
+"""
+similarity_cache.py
+
+Persistent feature store for prompt-similarity.py.
+
+Layout of a cache directory:
+
+  features/<sha256>.json   per-document features keyed by file content hash
+                           (schema paths, normalized text, term counts,
+                           forbidden actions)
+  state.json               file → hash map of the last run, the frozen
+                           TF-IDF vocabulary and IDF weights, IDF drift
+                           counter, and a fingerprint of the CSV written
+
+IDF drift strategy: the vocabulary and IDF weights are frozen at the last
+full fit. Incremental runs score new and changed documents against the
+frozen weights (unknown terms are ignored) and accumulate a drift counter;
+once the number of documents added, changed or removed since the last fit
+exceeds a fraction of the corpus, or when a rebuild is requested, IDF is
+refit and every pair is rescored.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+STATE_VERSION = 1
+
+
+def file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+
+
+def csv_fingerprint(path: Path) -> Optional[Dict[str, int]]:
+    """Cheap identity check for a previously written CSV (size + mtime)."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class FeatureStore:
+    """
+    Content-addressed store of per-document similarity features plus the
+    state of the last similarity run.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.features_dir = root / "features"
+        self.state_path = root / "state.json"
+        self.features_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        path = self.features_dir / f"{digest}.json"
+        try:
+            features = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except json.JSONDecodeError:
+            logging.warning(f"Ignoring corrupt feature cache entry {path}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return features
+
+    def put(self, digest: str, features: Dict[str, Any]) -> None:
+        write_json_atomic(self.features_dir / f"{digest}.json", features)
+
+    def load_state(self) -> Dict[str, Any]:
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if state.get("version") != STATE_VERSION:
+            logging.info("Similarity cache state is from another version; ignoring")
+            return {}
+        return state
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        write_json_atomic(self.state_path, {"version": STATE_VERSION, **state})
@@ -0,0 +1,177 @@
+"""
+similarity_communities.py
+
+Community detection on a sparse k-nearest-neighbour similarity graph, as
+an alternative to thresholded connected components (which chain a dense
+corpus into one cluster or shatter it, depending on the threshold).
+
+- knn_graph()          keeps each prompt's k strongest edges (union of both
+                       directions), so the graph has at most N·k edges
+- label_propagation()  weighted label propagation, vectorized per sweep
+- louvain()            Louvain modularity optimization: local moving plus
+                       community aggregation, repeated until no gain
+
+Both run in time roughly linear in the number of kNN edges. Labels are
+numbered by first member in node order, like connected_components().
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+from similarity_graph import SimilarityGraph
+
+# Gains smaller than this are treated as ties (float noise)
+EPSILON = 1e-12
+
+
+def first_appearance_labels(labels: np.ndarray) -> np.ndarray:
+    """Renumber labels 0..C−1 by the first node carrying each label."""
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int32)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first), dtype=np.int32)
+    return rank[inverse]
+
+
+def knn_graph(graph: SimilarityGraph, k: int) -> SimilarityGraph:
+    """Keep each node's k highest-weight edges; an edge survives if either end keeps it."""
+    rows = graph.row_ids()
+    order = np.lexsort((-graph.weights, rows))
+    rank = np.arange(len(order)) - graph.indptr[rows[order]]
+    keep = order[rank < k]
+
+    a, b = rows[keep], graph.indices[keep]
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    pairs, first = np.unique(lo.astype(np.int64) * graph.n + hi, return_index=True)
+    return SimilarityGraph.from_edges(
+        graph.docs,
+        (pairs // graph.n).astype(np.int32),
+        (pairs % graph.n).astype(np.int32),
+        graph.weights[keep][first].astype(np.float64),
+    )
+
+
+def label_propagation(graph: SimilarityGraph, max_iter: int = 100) -> np.ndarray:
+    """
+    Synchronous weighted label propagation. Each sweep moves every node to
+    the label with the largest total edge weight among its neighbours;
+    a node's own label gets a vote equal to its mean edge weight, which
+    damps the oscillation synchronous updates are prone to. Ties go to the
+    smallest label.
+    """
+    n = graph.n
+    labels = np.arange(n, dtype=np.int64)
+    if not len(graph.indices):
+        return labels.astype(np.int32)
+
+    rows = graph.row_ids().astype(np.int64)
+    weights = graph.weights.astype(np.float64)
+    degrees = graph.degrees()
+    has_edges = degrees > 0
+    self_vote = np.zeros(n)
+    np.add.at(self_vote, rows, weights)
+    self_vote[has_edges] /= degrees[has_edges]
+
+    voters = np.concatenate([rows, np.arange(n)])
+    vote_weights = np.concatenate([weights, self_vote])
+    for iteration in range(max_iter):
+        candidates = np.concatenate([labels[graph.indices], labels])
+        keys, inverse = np.unique(voters * n + candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=vote_weights)
+        node, label = keys // n, keys % n
+        # Best label per node: highest total, then smallest label
+        order = np.lexsort((label, -totals, node))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = node[order][1:] != node[order][:-1]
+        updated = labels.copy()
+        updated[node[order][first]] = label[order][first]
+        changed = int((updated != labels).sum())
+        labels = updated
+        logging.debug(f"Label propagation sweep {iteration + 1}: {changed} changed")
+        if not changed:
+            break
+    else:
+        logging.warning(f"Label propagation did not converge in {max_iter} sweeps")
+
+    return first_appearance_labels(labels)
+
+
+def _local_moving(
+    indptr: List[int],
+    indices: List[int],
+    weights: List[float],
+    resolution: float,
+) -> Tuple[List[int], bool]:
+    """One Louvain level: move nodes between communities while modularity improves."""
+    n = len(indptr) - 1
+    strength = [sum(weights[indptr[i] : indptr[i + 1]]) for i in range(n)]
+    total_weight = sum(strength)
+    if not total_weight:
+        return list(range(n)), False
+
+    comm = list(range(n))
+    tot = strength[:]
+    improved = False
+    moved = True
+    while moved:
+        moved = False
+        for i in range(n):
+            ci = comm[i]
+            links: Dict[int, float] = {}
+            for p in range(indptr[i], indptr[i + 1]):
+                j = indices[p]
+                if j != i:
+                    links[comm[j]] = links.get(comm[j], 0.0) + weights[p]
+
+            ki = strength[i]
+            tot[ci] -= ki
+            scale = resolution * ki / total_weight
+            best = ci
+            best_gain = links.get(ci, 0.0) - tot[ci] * scale
+            for c, w in links.items():
+                gain = w - tot[c] * scale
+                if gain > best_gain + EPSILON:
+                    best, best_gain = c, gain
+            tot[best] += ki
+            if best != ci:
+                comm[i] = best
+                moved = improved = True
+    return comm, improved
+
+
+def louvain(
+    graph: SimilarityGraph, resolution: float = 1.0, max_levels: int = 20
+) -> np.ndarray:
+    """
+    Louvain modularity optimization. Nodes are visited in ID order, so the
+    result is deterministic for a given graph.
+    """
+    membership = np.arange(graph.n, dtype=np.int64)
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+
+    for level in range(max_levels):
+        comm, improved = _local_moving(
+            indptr.tolist(), indices.tolist(), weights.tolist(), resolution
+        )
+        if not improved:
+            break
+        _, comm_ids = np.unique(np.array(comm), return_inverse=True)
+        membership = comm_ids[membership]
+        count = int(comm_ids.max()) + 1
+        logging.debug(f"Louvain level {level + 1}: {count} communities")
+
+        # Aggregate: one node per community, edge weights summed (internal
+        # weight becomes a self-loop so node strengths are preserved)
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        keys, inverse = np.unique(
+            comm_ids[rows] * count + comm_ids[indices], return_inverse=True
+        )
+        summed = np.bincount(inverse, weights=weights)
+        indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // count, minlength=count), out=indptr[1:])
+        indices = keys % count
+        weights = summed
+
+    return first_appearance_labels(membership)
@@ -0,0 +1,452 @@
+"""
+similarity_core.py
+
+Shared feature extraction and similarity primitives for normalized
+system-prompt analyses.
+
+Structural similarity is computed over a shared path vocabulary: every
+dotted schema path (e.g. ``layers.authority.forbidden_actions``) gets an
+integer ID, and each document's structure is stored as a packed uint64
+bitset. Jaccard similarity then reduces to popcounts over AND.
+
+MinHash signatures and LSH banding, one set per feature family, provide
+candidate pairs for the approximate (sub-quadratic) similarity mode.
+
+Imported by the similarity scripts in this directory; not intended to be
+run directly.
+"""
+
+from __future__ import annotations
+
+import re
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+STOPWORDS = {
+    "the",
+    "and",
+    "or",
+    "to",
+    "of",
+    "in",
+    "for",
+    "with",
+    "on",
+    "by",
+    "is",
+    "are",
+    "be",
+    "as",
+    "that",
+    "this",
+    "it",
+    "must",
+    "should",
+    "may",
+    "only",
+    "not",
+    "do",
+}
+
+# Weighting rationale:
+# - structure: governance shape (strongest signal)
+# - forbidden: prohibitions encode risk boundaries
+# - token: wording similarity (weakest, most brittle)
+WEIGHTS = {
+    "structure": 0.5,
+    "forbidden": 0.3,
+    "token": 0.2,
+}
+
+FORBIDDEN_PATH = ["layers", "authority", "forbidden_actions"]
+
+WORD_BITS = 64
+
+# Same tokenization TfidfVectorizer() applies, so cached term counts
+# reproduce a fresh fit exactly.
+ANALYZER = TfidfVectorizer().build_analyzer()
+
+
+# -------------------------
+# Traversal
+# -------------------------
+
+
+def extract_paths(obj: Any, prefix: str = "") -> Set[str]:
+    paths: Set[str] = set()
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            new_prefix = f"{prefix}.{key}" if prefix else key
+            paths.add(new_prefix)
+            paths |= extract_paths(value, new_prefix)
+    elif isinstance(obj, list):
+        for item in obj:
+            paths |= extract_paths(item, prefix)
+    return paths
+
+
+def extract_text(obj: Any) -> List[str]:
+    texts: List[str] = []
+    if isinstance(obj, str):
+        texts.append(obj)
+    elif isinstance(obj, list):
+        for item in obj:
+            texts.extend(extract_text(item))
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            texts.extend(extract_text(value))
+    return texts
+
+
+# -------------------------
+# Normalization + metrics
+# -------------------------
+
+
+def normalize_text(texts: Iterable[str]) -> str:
+    tokens: List[str] = []
+    for text in texts:
+        words = re.findall(r"[a-zA-Z0-9]+", text.lower())
+        tokens.extend(w for w in words if w not in STOPWORDS)
+    return " ".join(tokens)
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def get_nested_set(obj: Dict[str, Any], path: List[str]) -> Set[str]:
+    try:
+        for p in path:
+            obj = obj[p]
+        if isinstance(obj, list):
+            return {str(x) for x in obj}
+    except Exception:
+        pass
+    return set()
+
+
+def document_features(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract every per-document input the similarity metrics need, in a
+    JSON-serializable form suitable for caching by content hash.
+    """
+    text = normalize_text(extract_text(doc))
+    return {
+        "paths": sorted(extract_paths(doc)),
+        "text": text,
+        "terms": dict(Counter(ANALYZER(text))),
+        "forbidden": sorted(get_nested_set(doc, FORBIDDEN_PATH)),
+    }
+
+
+# -------------------------
+# TF-IDF from term counts
+# -------------------------
+
+
+def fit_idf(terms_list: Sequence[Dict[str, int]]) -> Tuple[Dict[str, int], np.ndarray]:
+    """
+    Fit a sorted vocabulary and smoothed IDF weights from per-document term
+    counts, matching TfidfVectorizer's defaults.
+    """
+    df_counter: Counter[str] = Counter()
+    for terms in terms_list:
+        df_counter.update(terms.keys())
+    vocabulary = {term: col for col, term in enumerate(sorted(df_counter))}
+    df = np.array([df_counter[t] for t in vocabulary], dtype=np.int64) + 1
+    idf = np.log((len(terms_list) + 1) / df) + 1
+    return vocabulary, idf
+
+
+def tfidf_matrix(
+    terms_list: Sequence[Dict[str, int]],
+    vocabulary: Dict[str, int],
+    idf: np.ndarray,
+) -> sparse.csr_matrix:
+    """
+    Build L2-normalized TF-IDF rows from term counts against a (possibly
+    frozen) vocabulary. Terms outside the vocabulary are ignored.
+    """
+    indptr = [0]
+    indices: List[int] = []
+    data: List[int] = []
+    for terms in terms_list:
+        for term, count in terms.items():
+            col = vocabulary.get(term)
+            if col is not None:
+                indices.append(col)
+                data.append(count)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (
+            np.asarray(data, dtype=np.float64),
+            np.asarray(indices, dtype=np.int64),
+            np.asarray(indptr),
+        ),
+        shape=(len(terms_list), len(vocabulary)),
+    )
+    matrix.sort_indices()
+    matrix.data *= idf[matrix.indices]
+    return normalize(matrix, norm="l2", copy=False)
+
+
+# -------------------------
+# Path vocabulary + bitsets
+# -------------------------
+
+
+class PathVocabulary:
+    """
+    Shared mapping from dotted schema paths to dense integer IDs.
+
+    IDs are assigned in first-seen order and never change, so bitsets
+    packed against a vocabulary stay valid as it grows.
+    """
+
+    def __init__(self, paths: Iterable[str] = ()) -> None:
+        self.ids: Dict[str, int] = {}
+        self.paths: List[str] = []
+        self.add(paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def add(self, paths: Iterable[str]) -> np.ndarray:
+        """Register paths (if new) and return their IDs."""
+        out: List[int] = []
+        for path in paths:
+            pid = self.ids.get(path)
+            if pid is None:
+                pid = len(self.paths)
+                self.ids[path] = pid
+                self.paths.append(path)
+            out.append(pid)
+        return np.asarray(out, dtype=np.int64)
+
+    def lookup(self, paths: Iterable[str]) -> np.ndarray:
+        """Return IDs for known paths only, without growing the vocabulary."""
+        return np.asarray([self.ids[p] for p in paths if p in self.ids], dtype=np.int64)
+
+
+def pack_bitsets(id_lists: Sequence[np.ndarray], n_bits: int) -> np.ndarray:
+    """
+    Pack per-document path IDs into an (N, words) uint64 bitset matrix.
+    """
+    words = max(1, -(-n_bits // WORD_BITS))
+    bits = np.zeros((len(id_lists), words), dtype=np.uint64)
+    for row, ids in enumerate(id_lists):
+        if len(ids) == 0:
+            continue
+        masks = np.left_shift(np.uint64(1), (ids % WORD_BITS).astype(np.uint64))
+        np.bitwise_or.at(bits[row], ids // WORD_BITS, masks)
+    return bits
+
+
+if hasattr(np, "bitwise_count"):
+
+    def popcount(values: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(values)
+
+else:
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values: np.ndarray) -> np.ndarray:
+        as_bytes = np.ascontiguousarray(values).view(np.uint8)
+        counts = _BYTE_POPCOUNT[as_bytes].reshape(*values.shape, values.itemsize)
+        return counts.sum(axis=-1, dtype=np.uint8)
+
+
+def bitset_sizes(bits: np.ndarray) -> np.ndarray:
+    return popcount(bits).sum(axis=1, dtype=np.int64)
+
+
+def bitset_jaccard_rows(
+    bits: np.ndarray, sizes: np.ndarray, rows: slice | np.ndarray
+) -> np.ndarray:
+    """
+    Jaccard similarity of a block of bitset rows against every row, matching
+    jaccard() exactly (two empty sets score 1.0, one empty set 0.0).
+
+    The intersection is accumulated one 64-bit word at a time so the
+    temporary never exceeds block × N.
+    """
+    block = bits[rows]
+    inter = np.zeros((block.shape[0], bits.shape[0]), dtype=np.int64)
+    for w in range(bits.shape[1]):
+        inter += popcount(block[:, w, None] & bits[None, :, w])
+    union = sizes[rows, None] + sizes[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 1.0)
+
+
+def bitset_jaccard_pairs(
+    bits: np.ndarray, sizes: np.ndarray, i: np.ndarray, j: np.ndarray
+) -> np.ndarray:
+    """Jaccard similarity for explicit pairs (i[k], j[k])."""
+    inter = popcount(bits[i] & bits[j]).sum(axis=1, dtype=np.int64)
+    union = sizes[i] + sizes[j] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 1.0)
+
+
+# -------------------------
+# Sparse set incidence
+# -------------------------
+
+
+def incidence_matrix(sets: List[Set[str]]) -> sparse.csr_matrix:
+    """
+    Encode a list of string sets as a binary document × item CSR matrix.
+    """
+    vocab: Dict[str, int] = {}
+    indptr = [0]
+    indices: List[int] = []
+    for items in sets:
+        indices.extend(vocab.setdefault(item, len(vocab)) for item in items)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int64)
+    return sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+        shape=(len(sets), len(vocab)),
+    )
+
+
+def jaccard_rows(
+    matrix: sparse.csr_matrix, sizes: np.ndarray, rows: slice | np.ndarray
+) -> np.ndarray:
+    """
+    Jaccard similarity of a block of rows against every row, matching
+    jaccard() exactly (two empty sets score 1.0, one empty set 0.0).
+    """
+    inter = (matrix[rows] @ matrix.T).toarray()
+    union = sizes[rows, None] + sizes[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 1.0)
+
+
+def jaccard_pairs(
+    matrix: sparse.csr_matrix, sizes: np.ndarray, i: np.ndarray, j: np.ndarray
+) -> np.ndarray:
+    """Jaccard similarity for explicit pairs (i[k], j[k]) of incidence rows."""
+    inter = np.asarray(matrix[i].multiply(matrix[j]).sum(axis=1)).ravel()
+    union = sizes[i] + sizes[j] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 1.0)
+
+
+# -------------------------
+# MinHash + LSH
+# -------------------------
+
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+def hash_items(items: Iterable[str]) -> np.ndarray:
+    """Stable 31-bit hashes of string items (independent of PYTHONHASHSEED)."""
+    return (
+        np.fromiter(
+            (zlib.crc32(item.encode("utf-8")) for item in items), dtype=np.uint64
+        )
+        % MERSENNE_PRIME
+    )
+
+
+def minhash_signatures(
+    item_hashes: Sequence[np.ndarray], num_perm: int, seed: int = 1
+) -> np.ndarray:
+    """
+    Compute an (N, num_perm) MinHash signature matrix using universal
+    hashing h(x) = (a·x + b) mod p with p = 2^31 − 1.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(item_hashes), num_perm), MERSENNE_PRIME, dtype=np.uint64)
+    for row, x in enumerate(item_hashes):
+        if len(x) == 0:
+            continue
+        hashed = (a[:, None] * x[None, :] + b[:, None]) % MERSENNE_PRIME
+        signatures[row] = hashed.min(axis=1)
+    return signatures
+
+
+def lsh_params(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    Pick (bands, rows) with bands × rows = num_perm whose S-curve threshold
+    (1/bands)^(1/rows) is the highest one not above the requested Jaccard
+    threshold, favouring recall over precision.
+    """
+    options = [
+        (b, num_perm // b, (1 / b) ** (1 / (num_perm // b)))
+        for b in range(1, num_perm + 1)
+        if num_perm % b == 0
+    ]
+    below = [o for o in options if o[2] <= threshold]
+    bands, rows, _ = (
+        max(below, key=lambda o: o[2]) if below else min(options, key=lambda o: o[2])
+    )
+    return bands, rows
+
+
+def lsh_candidate_pairs(
+    signatures: np.ndarray, bands: int, rows: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return candidate pairs (i < j) that share at least one LSH bucket,
+    sorted in itertools.combinations order.
+    """
+    n = signatures.shape[0]
+    rng = np.random.default_rng(0)
+    mix = rng.integers(1, 1 << 62, size=rows, dtype=np.uint64) | np.uint64(1)
+    encoded: List[np.ndarray] = []
+    for band in range(bands):
+        chunk = signatures[:, band * rows : (band + 1) * rows]
+        # uint64 arithmetic wraps, giving a cheap multiplicative band hash
+        keys = (chunk * mix[None, :]).sum(axis=1, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], n]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end - start < 2:
+                continue
+            members = np.sort(order[start:end])
+            left, right = np.triu_indices(len(members), k=1)
+            encoded.append(members[left] * n + members[right])
+    if not encoded:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    pairs = np.unique(np.concatenate(encoded))
+    return pairs // n, pairs % n
+
+
+def lsh_family_pairs(
+    families: Sequence[Sequence[np.ndarray]], num_perm: int, threshold: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Candidate pairs (i < j) that share an LSH bucket in at least one
+    feature family, sorted in itertools.combinations order. Each family
+    (item hashes per document) gets its own signatures and banding, so a
+    small family is not drowned out by a large one. A weighted average of
+    family similarities can only reach `threshold` if one of them does,
+    which makes `threshold` the banding target of every family.
+    """
+    bands, rows = lsh_params(num_perm, threshold)
+    n = len(families[0])
+    keys: List[np.ndarray] = []
+    for item_hashes in families:
+        i, j = lsh_candidate_pairs(minhash_signatures(item_hashes, num_perm), bands, rows)
+        keys.append(i * n + j)
+    pairs = np.unique(np.concatenate(keys))
+    return pairs // n, pairs % n
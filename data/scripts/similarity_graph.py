@@ -0,0 +1,204 @@
+"""
+similarity_graph.py
+
+Compact similarity graph shared by the clustering and band-report scripts.
+
+Nodes are integer IDs into a document table; adjacency is symmetric CSR in
+NumPy arrays (int64 indptr, int32 indices, float32 weights), so a graph
+with E edges costs about 16·E bytes instead of a dict of Python sets keyed
+by filename strings.
+
+- SimilarityGraph.load() reads a similarities CSV or .simmat file,
+  optionally keeping only edges with score ≥ threshold
+- connected_components() labels components with vectorized min-label
+  propagation and pointer jumping (no per-node Python loop)
+- DisjointSet is the incremental union-find used by threshold sweeps
+- degree_stats() summarizes the degree distribution
+- auto_threshold() picks a component cut from the edge scores
+
+scripts/graph-benchmark.py compares this against dict-of-set DFS.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from similarity_matrix import read_edges
+
+
+class DisjointSet:
+    """Union-find with path halving and union by rank; tracks component sizes."""
+
+    def __init__(self, n: int) -> None:
+        self.parent = list(range(n))
+        self.rank = [0] * n
+        self.size = [1] * n
+        self.components = n
+        self.size_counts: Counter[int] = Counter({1: n}) if n else Counter()
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> int:
+        """Merge the sets of a and b; return the surviving root (-1 if already joined)."""
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return -1
+        if self.rank[ra] < self.rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if self.rank[ra] == self.rank[rb]:
+            self.rank[ra] += 1
+
+        counts = self.size_counts
+        for old in (self.size[ra], self.size[rb]):
+            counts[old] -= 1
+            if not counts[old]:
+                del counts[old]
+        self.size[ra] += self.size[rb]
+        counts[self.size[ra]] += 1
+        self.components -= 1
+        return ra
+
+    def sizes(self) -> List[int]:
+        """All component sizes, largest first."""
+        out: List[int] = []
+        for size in sorted(self.size_counts, reverse=True):
+            out.extend([size] * self.size_counts[size])
+        return out
+
+    def labels(self) -> List[int]:
+        """Component label per node, numbered by first appearance in node order."""
+        ids: Dict[int, int] = {}
+        return [ids.setdefault(self.find(x), len(ids)) for x in range(len(self.parent))]
+
+
+class SimilarityGraph:
+    """Undirected weighted graph in symmetric CSR form."""
+
+    def __init__(
+        self,
+        docs: List[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        weights: np.ndarray,
+    ) -> None:
+        self.docs = docs
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @property
+    def n(self) -> int:
+        return len(self.docs)
+
+    @property
+    def edge_count(self) -> int:
+        """Undirected edges (each is stored twice)."""
+        return len(self.indices) // 2
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    @classmethod
+    def from_edges(
+        cls,
+        docs: List[str],
+        rows: np.ndarray,
+        cols: np.ndarray,
+        scores: np.ndarray,
+        threshold: Optional[float] = None,
+    ) -> "SimilarityGraph":
+        if threshold is not None:
+            keep = scores >= threshold
+            rows, cols, scores = rows[keep], cols[keep], scores[keep]
+        n = len(docs)
+        src = np.concatenate([rows, cols]).astype(np.int32, copy=False)
+        dst = np.concatenate([cols, rows]).astype(np.int32, copy=False)
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        weights = np.concatenate([scores, scores]).astype(np.float32)
+        return cls(docs, indptr, dst[order], weights[order])
+
+    @classmethod
+    def load(cls, path: Path, threshold: Optional[float] = None) -> "SimilarityGraph":
+        """Build from a similarities CSV or .simmat file."""
+        docs, rows, cols, scores = read_edges(path, threshold)
+        return cls.from_edges(docs, rows, cols, scores)
+
+    def row_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(self.n, dtype=np.int32), np.diff(self.indptr))
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.indices[self.indptr[node] : self.indptr[node + 1]]
+
+    def connected_components(self) -> np.ndarray:
+        """
+        Component label per node, numbered by first member in node order
+        (the same numbering a DFS over nodes 0..N−1 produces).
+        """
+        labels = np.arange(self.n, dtype=np.int32)
+        if not len(self.indices):
+            return labels
+        has_edges = self.degrees() > 0
+        starts = self.indptr[:-1][has_edges]
+        while True:
+            # Hook every node onto its smallest neighbouring label, then
+            # shortcut label chains until each points at a root
+            nbr_min = np.minimum.reduceat(labels[self.indices], starts)
+            hooked = labels.copy()
+            hooked[has_edges] = np.minimum(labels[has_edges], nbr_min)
+            while True:
+                jumped = hooked[hooked]
+                if np.array_equal(jumped, hooked):
+                    break
+                hooked = jumped
+            if np.array_equal(hooked, labels):
+                break
+            labels = hooked
+        _, labels = np.unique(labels, return_inverse=True)
+        return labels.astype(np.int32)
+
+    def components(self) -> List[np.ndarray]:
+        """Node IDs of each component, ordered by component label."""
+        labels = self.connected_components()
+        order = np.argsort(labels, kind="stable")
+        bounds = np.cumsum(np.bincount(labels))[:-1]
+        return np.split(order, bounds)
+
+    def degree_stats(self) -> Dict[str, float]:
+        degrees = self.degrees()
+        if not len(degrees):
+            return {"min": 0, "max": 0, "mean": 0.0, "median": 0.0, "isolated": 0}
+        return {
+            "min": int(degrees.min()),
+            "max": int(degrees.max()),
+            "mean": float(degrees.mean()),
+            "median": float(np.median(degrees)),
+            "isolated": int((degrees == 0).sum()),
+        }
+
+
+def auto_threshold(scores: List[float]) -> float:
+    """
+    Pick threshold via largest-gap (1D knee) heuristic.
+    """
+    if len(scores) < 2:
+        return 1.0
+
+    scores = sorted(scores, reverse=True)
+    diffs = [scores[i] - scores[i + 1] for i in range(len(scores) - 1)]
+    idx = int(np.argmax(diffs))
+    return round(scores[idx + 1], 2)
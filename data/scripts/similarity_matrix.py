@@ -0,0 +1,262 @@
+"""
+similarity_matrix.py
+
+Compact binary companion format for similarities.csv (".simmat").
+
+Layout (little-endian, every array aligned to 64 bytes):
+
+  b"SIMMAT01"                 magic
+  uint64                      header length in bytes
+  header (JSON, UTF-8)        document table, entry count, array offsets
+  indptr   int64[n + 1]       CSR row pointers (upper triangle: row i holds j > i)
+  indices  int32[nnz]         CSR column indices
+  one float32[nnz] array per metric, in METRICS order
+
+Sparse outputs (--top-k, --min-score, --approx) store only the pairs that
+were emitted; a complete run stores every i < j pair. Values are the same
+4-decimal scores written to the CSV.
+
+SimilarityMatrix opens a file with numpy.memmap, so loading costs no
+copies; blocks() converts the stored entries to row IDs and CSV-equal
+float64 scores one block at a time. read_edges() returns (docs, i, j,
+weighted) arrays from either a .simmat file or a similarities CSV,
+letting consumers accept both; given a threshold, only the edges at or
+above it are materialized.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"SIMMAT01"
+ALIGN = 64
+DECIMALS = 4
+
+# Stored entries converted at a time when reading
+BLOCK_ENTRIES = 1 << 20
+
+METRICS = [
+    "struct_similarity",
+    "token_similarity",
+    "forbidden_similarity",
+    "weighted_score",
+]
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+def is_matrix_file(path: Path) -> bool:
+    with path.open("rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class MatrixWriter:
+    """
+    Collect similarity rows (as written to the CSV) and write them as a
+    CSR .simmat file. Rows may arrive in any order.
+    """
+
+    def __init__(self, docs: List[str]) -> None:
+        self.docs = docs
+        self.position = {name: k for k, name in enumerate(docs)}
+        self.rows = array("i")
+        self.cols = array("i")
+        self.values = {m: array("f") for m in METRICS}
+
+    def add(self, row: Dict[str, Any]) -> None:
+        a = self.position[row["file_a"]]
+        b = self.position[row["file_b"]]
+        self.rows.append(min(a, b))
+        self.cols.append(max(a, b))
+        for m in METRICS:
+            self.values[m].append(float(row[m]))
+
+    def write(self, path: Path) -> None:
+        n = len(self.docs)
+        rows = np.frombuffer(self.rows, dtype=np.int32)
+        cols = np.frombuffer(self.cols, dtype=np.int32)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n + 1, dtype="<i8")
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+        arrays: List[Tuple[str, np.ndarray]] = [
+            ("indptr", indptr),
+            ("indices", cols[order].astype("<i4")),
+        ]
+        for m in METRICS:
+            values = np.frombuffer(self.values[m], dtype=np.float32)
+            arrays.append((m, values[order].astype("<f4")))
+
+        # Offsets depend on the header length, which depends on the offsets;
+        # reserve room by sizing the header with placeholder offsets first.
+        header: Dict[str, Any] = {
+            "version": 1,
+            "layout": "csr-upper",
+            "decimals": DECIMALS,
+            "n": n,
+            "nnz": int(len(order)),
+            "docs": self.docs,
+            "arrays": {
+                name: {"dtype": arr.dtype.str, "count": int(arr.size), "offset": 0}
+                for name, arr in arrays
+            },
+        }
+        reserve = len(json.dumps(header).encode("utf-8")) + 32 * len(arrays)
+        offset = _aligned(len(MAGIC) + 8 + reserve)
+        for name, arr in arrays:
+            header["arrays"][name]["offset"] = offset
+            offset = _aligned(offset + arr.nbytes)
+        encoded = json.dumps(header).encode("utf-8").ljust(reserve)
+
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with tmp_path.open("wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(encoded)))
+            f.write(encoded)
+            for name, arr in arrays:
+                f.seek(header["arrays"][name]["offset"])
+                f.write(arr.tobytes())
+        tmp_path.replace(path)
+
+
+class SimilarityMatrix:
+    """Read-only, memory-mapped view of a .simmat file."""
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a similarity matrix file")
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length).decode("utf-8"))
+        self.path = path
+        self.docs: List[str] = header["docs"]
+        self.n: int = header["n"]
+        self.nnz: int = header["nnz"]
+        self.decimals: int = header["decimals"]
+        self.arrays: Dict[str, np.memmap] = {
+            name: np.memmap(
+                path,
+                dtype=np.dtype(spec["dtype"]),
+                mode="r",
+                offset=spec["offset"],
+                shape=(spec["count"],),
+            )
+            for name, spec in header["arrays"].items()
+            if spec["count"]
+        }
+
+    @property
+    def indptr(self) -> np.ndarray:
+        return self.arrays["indptr"]
+
+    @property
+    def indices(self) -> np.ndarray:
+        return self.arrays.get("indices", np.zeros(0, dtype=np.int32))
+
+    def row_ids(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Row index of the stored entries [start, stop), from the row pointers."""
+        stop = self.nnz if stop is None else stop
+        positions = np.arange(start, stop, dtype=np.int64)
+        return (np.searchsorted(self.indptr, positions, side="right") - 1).astype(
+            np.int32
+        )
+
+    def raw(self, metric: str = "weighted_score") -> np.ndarray:
+        """The stored float32 values, memory-mapped."""
+        return self.arrays.get(metric, np.zeros(0, dtype=np.float32))
+
+    def scores(
+        self, metric: str = "weighted_score", start: int = 0, stop: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Float64 values of the entries [start, stop) equal to parsing the CSV
+        text, so threshold comparisons match CSV consumers exactly.
+        """
+        return np.round(
+            self.raw(metric)[start:stop].astype(np.float64), self.decimals
+        )
+
+    def blocks(
+        self, metric: str = "weighted_score", size: int = BLOCK_ENTRIES
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        (rows, cols, scores) for successive runs of `size` stored entries;
+        cols is a memory-mapped view, and only the current block is
+        converted.
+        """
+        for start in range(0, self.nnz, size):
+            stop = min(start + size, self.nnz)
+            yield (
+                self.row_ids(start, stop),
+                self.indices[start:stop],
+                self.scores(metric, start, stop),
+            )
+
+
+def read_edges(
+    path: Path, threshold: Optional[float] = None
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Load (docs, i, j, weighted_score) from a .simmat file or a similarities
+    CSV, keeping only edges scoring at least `threshold` if given.
+    Documents are numbered in table order (binary) or first-appearance
+    order (CSV). Without a threshold, j of a .simmat file is its
+    memory-mapped column array.
+    """
+    if is_matrix_file(path):
+        matrix = SimilarityMatrix(path)
+        rows: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        cols: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        kept: List[np.ndarray] = [np.zeros(0, dtype=np.float64)]
+        for block_rows, block_cols, block_scores in matrix.blocks():
+            if threshold is None:
+                rows.append(block_rows)
+                kept.append(block_scores)
+                continue
+            keep = block_scores >= threshold
+            rows.append(block_rows[keep])
+            cols.append(block_cols[keep])
+            kept.append(block_scores[keep])
+        return (
+            matrix.docs,
+            np.concatenate(rows),
+            matrix.indices if threshold is None else np.concatenate(cols),
+            np.concatenate(kept),
+        )
+
+    ids: Dict[str, int] = {}
+    csv_rows = array("i")
+    csv_cols = array("i")
+    csv_scores = array("d")
+    with path.open("r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        required = {"file_a", "file_b", "weighted_score"}
+        if not required.issubset(reader.fieldnames or []):
+            sys.exit(f"CSV must contain columns: {', '.join(required)}")
+
+        for row in reader:
+            a = ids.setdefault(row["file_a"], len(ids))
+            b = ids.setdefault(row["file_b"], len(ids))
+            score = float(row["weighted_score"])
+            if threshold is not None and score < threshold:
+                continue
+            csv_rows.append(a)
+            csv_cols.append(b)
+            csv_scores.append(score)
+
+    return (
+        list(ids),
+        np.frombuffer(csv_rows, dtype=np.int32),
+        np.frombuffer(csv_cols, dtype=np.int32),
+        np.frombuffer(csv_scores, dtype=np.float64),
+    )
@@ -13,78 +13,502 @@ Generate a normalized system-prompt analysis from:
 - a schema YAML
 - an invocation payload JSON
 
+Batch mode (--invocations) normalizes many payloads in one process: model
+calls are issued concurrently with asyncio (at most --concurrency in
+flight) and each <output-dir>/<payload>.analysis.yaml is written as soon
+as its call completes. Outputs newer than their payload are skipped, as
+make would.
+
+By default the response is constrained to a JSON Schema derived from the
+schema YAML (--structured-output, llm_structured.py) and written out as
+YAML; --no-structured-output asks for YAML text instead. A response that
+cannot be parsed gets up to --repair-retries targeted retries: the
+rejected output and the reason are sent back for a corrected reply.
+
+--stream streams each response through an incremental check of its
+top-level sections (llm_stream.py): a response that turns out not to be
+a mapping of schema sections in schema order (a JSON object, with
+structured output) is aborted mid-generation and retried at once. The
+text is written to .<output>.partial as it arrives.
+
 Usage:
   uv run --locked system-prompt-analysis.py \
     --prompt prompt.md \
     --schema schema/system-prompt.v0.yaml \
     --invocation request.json \
     --model gpt-5.2
+
+  uv run --locked system-prompt-analysis.py \
+    --prompt prompt.md \
+    --schema schema/system-prompt.v0.yaml \
+    --invocations 'payload/*.json' \
+    --output-dir analysis \
+    --model gpt-5.2
 """
 
 import argparse
+import asyncio
+import functools
 import hashlib
 import json
 import logging
 import platform
-import re
 import sys
+import time
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-import openai
 import yaml
-from openai.types.chat import ChatCompletionMessageParam
+from analysis_schema import ERROR, compile_schema, validate
+from llm_batch import (BatchRequest, add_batch_arguments, expand_inputs,
+                       is_up_to_date, run_batch_job)
+from llm_runtime import (ModelRuntime, add_model_arguments, clean_output,
+                         fenced, read_text, setup_logging)
+from llm_stream import (GuardFactory, JsonObjectGuard, StreamAbort,
+                        TopLevelKeysGuard, add_stream_arguments)
+from llm_structured import (acomplete_repaired, add_structured_arguments,
+                            analysis_schema, complete_repaired, repaired,
+                            response_format, response_json, response_text)
+from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
+
+DEFAULT_CONCURRENCY = 8
+
+# Schema issues quoted in a log line or repair request
+MAX_REPORTED = 5
+
+
+def validate_yaml(text: str, schema_yaml: str, name: str = "Output") -> None:
+    """
+    Validate that the text is valid YAML and matches the schema structure.
+    Raises ValueError if the output is not a YAML mapping or has schema
+    errors (see validate_analysis).
+    """
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as exc:
+        raise ValueError(f"{name} is not valid YAML: {exc}") from exc
+
+    if not isinstance(data, dict):
+        raise ValueError(f"{name} YAML must be a dictionary at the top level")
+
+    validate_analysis(data, schema_yaml, name)
 
 
-def read_text(path: Path) -> str:
+def validate_analysis(data: Dict[str, Any], schema_yaml: str, name: str) -> None:
+    """
+    Check an analysis against the compiled schema (analysis_schema.py).
+    Raises ValueError on structural errors, so the response is repaired;
+    leaf drift (enum values, types) is only logged.
+    """
     try:
-        return path.read_text(encoding="utf-8")
-    except Exception:
-        logging.exception(f"Failed to read {path}")
-        sys.exit(1)
+        root = compile_schema(schema_yaml)
+    except ValueError:
+        logging.exception("Failed to parse schema for validation")
+        return
+
+    issues = validate(root, data)
+    errors = [i for i in issues if i.severity == ERROR]
+    if errors:
+        raise ValueError(
+            f"{name} does not match the schema: "
+            + "; ".join(f"{i.path}: {i.message}" for i in errors[:MAX_REPORTED])
+        )
+    if issues:
+        logging.warning(
+            f"{name} has {len(issues)} schema warnings: "
+            + "; ".join(f"{i.path}: {i.message}" for i in issues[:MAX_REPORTED])
+        )
+    else:
+        logging.debug("Output passed schema validation")
+
+
+def capture_metadata(
+    invocation_path: Path, invocation_json: str
+) -> Tuple[str, Dict[str, Any]]:
+    """Return (timestamp, capture metadata) for a payload file."""
+    file_stat = invocation_path.stat()
+    timestamp = datetime.fromtimestamp(file_stat.st_mtime, tz=timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+    artifact_hash = hashlib.sha256(invocation_json.encode("utf-8")).hexdigest()
+
+    metadata: Dict[str, Any] = {
+        "method": "mitmproxy",
+        "timestamp": timestamp,
+        "environment": {
+            "os": platform.system(),
+            "arch": platform.machine(),
+            "runtime": f"Python {platform.python_version()}",
+        },
+        "artifact_hash": artifact_hash,
+    }
+    return timestamp, metadata
+
+
+def build_messages(
+    normalization_prompt: str,
+    schema_path: Path,
+    schema_yaml: str,
+    invocation_path: Path,
+    invocation_json: str,
+    metadata: Dict[str, Any],
+) -> List[ChatCompletionMessageParam]:
+    """
+    Invariant content first (prompt, schema), so every request of a run
+    shares a byte-identical prefix the provider can cache; per-capture
+    content last, the payload (often sharing a long prefix with other
+    captures of the same tool) before its metadata (hash and timestamp).
+    """
+    return [
+        {
+            "role": "system",
+            "content": normalization_prompt,
+        },
+        {
+            "role": "user",
+            "content": fenced(
+                f"Normalization Schema ({schema_path.name})", schema_yaml, "yaml"
+            ),
+        },
+        {
+            "role": "user",
+            "content": fenced(
+                f"Invocation Payload ({invocation_path.name})", invocation_json, "json"
+            )
+            + "\n"
+            + fenced("Capture Metadata", json.dumps(metadata, indent=2), "json"),
+        },
+    ]
+
+
+@functools.lru_cache
+def analysis_format(schema_yaml: str) -> Dict[str, Any]:
+    """The structured-output response format for the schema (derived once)."""
+    return response_format("system_prompt_analysis", analysis_schema(schema_yaml))
+
+
+def completion_request(
+    args: argparse.Namespace,
+    messages: List[ChatCompletionMessageParam],
+    schema_yaml: str,
+) -> Dict[str, Any]:
+    request: Dict[str, Any] = {
+        "model": args.model,
+        "messages": messages,
+        # Temperature 0 is supported by all GPT-4 and GPT-5 models (except mini variants)
+        "temperature": 0,
+        "seed": args.seed,
+    }
+    if args.structured_output:
+        request["response_format"] = analysis_format(schema_yaml)
+    return request
+
+
+@functools.lru_cache
+def section_guard(schema_yaml: str, structured: bool) -> GuardFactory:
+    """Streaming guard for the schema's top-level sections, in order."""
+    sections = list(yaml.safe_load(schema_yaml))
+    guard = JsonObjectGuard if structured else TopLevelKeysGuard
+    return lambda: guard(sections)
+
+
+def stream_guard(args: argparse.Namespace, schema_yaml: str) -> GuardFactory:
+    return section_guard(schema_yaml, args.structured_output)
+
+
+def analysis_text(
+    args: argparse.Namespace,
+    response: ChatCompletion,
+    schema_yaml: str,
+    name: str = "Output",
+) -> str:
+    """
+    The analysis YAML of a response: the structured JSON object dumped as
+    YAML (schema order kept), or the YAML text with code fences removed.
+    Raises ValueError if it cannot be parsed or has schema errors.
+    """
+    if args.structured_output:
+        try:
+            analysis = response_json(response)
+        except ValueError as exc:
+            raise ValueError(f"{name}: {exc}") from exc
+        validate_analysis(analysis, schema_yaml, name)
+        return yaml.safe_dump(analysis, sort_keys=False, allow_unicode=True)
+    output = clean_output(response_text(response))
+    validate_yaml(output, schema_yaml, name)
+    return output
 
 
-def clean_output(text: str) -> str:
-    """Remove markdown code blocks if present."""
-    # Match ```yaml ... ``` or ``` ... ```
-    # We use a non-greedy match for the content and handle multiple blocks by taking the first one
-    pattern = r"```(?:yaml)?\s*\n(.*?)\n\s*```"
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        cleaned = match.group(1).strip()
-        logging.debug("Removed markdown code block markers from output")
-        return cleaned
-    return text.strip()
+def partial_path(output_path: Path) -> Path:
+    """Where a streamed response is written while it arrives."""
+    return output_path.with_name(f".{output_path.name}.partial")
 
 
-def validate_yaml(text: str, schema_yaml: str) -> None:
-    """Validate that the text is valid YAML and matches the basic schema structure."""
+def write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+
+# -------------------------
+# Batch mode
+# -------------------------
+
+
+def output_path_for(invocation_path: Path, output_dir: Path) -> Path:
+    # payload/<name>.json -> <output-dir>/<name>.analysis.yaml (as in the Makefile)
+    return output_dir / f"{invocation_path.stem}.analysis.yaml"
+
+
+def prepare_request(
+    args: argparse.Namespace,
+    normalization_prompt: str,
+    schema_path: Path,
+    schema_yaml: str,
+    invocation_path: Path,
+) -> Optional[Tuple[Dict[str, Any], str]]:
+    """Return (request, masked timestamp) for a payload, or None if unreadable."""
     try:
-        data = yaml.safe_load(text)
-    except yaml.YAMLError:
-        logging.exception("Output is not valid YAML")
-        sys.exit(1)
+        invocation_json = invocation_path.read_text(encoding="utf-8")
+        json.loads(invocation_json)
+    except (OSError, ValueError):
+        logging.exception(f"{invocation_path}: unreadable or invalid JSON payload")
+        return None
+
+    timestamp, metadata = capture_metadata(invocation_path, invocation_json)
+    messages = build_messages(
+        normalization_prompt,
+        schema_path,
+        schema_yaml,
+        invocation_path,
+        invocation_json,
+        metadata,
+    )
+    return completion_request(args, messages, schema_yaml), timestamp
 
-    if not isinstance(data, dict):
-        sys.exit("Output YAML must be a dictionary at the top level")
 
+def write_analysis(output_path: Path, output: str) -> bool:
+    """Write one analysis; log and return False on failure."""
     try:
-        schema = yaml.safe_load(schema_yaml)
-    except yaml.YAMLError:
-        logging.exception("Failed to parse schema for validation")
+        write_atomic(output_path, output)
+    except Exception:
+        logging.exception(f"Failed to write output to {output_path}")
+        return False
+    partial_path(output_path).unlink(missing_ok=True)
+    logging.info(f"Analysis saved to {output_path}")
+    return True
+
+
+async def normalize_one(
+    runtime: ModelRuntime,
+    semaphore: asyncio.Semaphore,
+    args: argparse.Namespace,
+    normalization_prompt: str,
+    schema_path: Path,
+    schema_yaml: str,
+    invocation_path: Path,
+    output_path: Path,
+) -> bool:
+    """Normalize one payload; log and return False on failure."""
+    prepared = prepare_request(
+        args, normalization_prompt, schema_path, schema_yaml, invocation_path
+    )
+    if prepared is None:
+        return False
+    request, timestamp = prepared
+
+    async def call(request: Dict[str, Any]) -> ChatCompletion:
+        if args.stream:
+            return await runtime.astream(
+                request,
+                stream_guard(args, schema_yaml),
+                partial_path(output_path),
+                masked=[timestamp],
+                retries=args.stream_retries,
+                inputs=[invocation_path],
+            )
+        return await runtime.acomplete(
+            request, masked=[timestamp], inputs=[invocation_path]
+        )
+
+    name = f"Output for {invocation_path}"
+    async with semaphore:
+        logging.debug(f"Calling model {args.model} for {invocation_path}")
+        try:
+            output = await acomplete_repaired(
+                call,
+                request,
+                lambda response: analysis_text(args, response, schema_yaml, name),
+                args.repair_retries,
+                name,
+            )
+        except ValueError as exc:
+            logging.error(str(exc))
+            return False
+        except Exception:
+            logging.exception(f"{invocation_path}: API call failed")
+            return False
+
+    return write_analysis(output_path, output)
+
+
+async def normalize_concurrently(
+    args: argparse.Namespace,
+    normalization_prompt: str,
+    schema_path: Path,
+    schema_yaml: str,
+    jobs: List[Tuple[Path, Path]],
+) -> int:
+    """Run all jobs with bounded concurrency; return the number of failures."""
+    runtime = ModelRuntime(args)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        results = await asyncio.gather(
+            *(
+                normalize_one(
+                    runtime,
+                    semaphore,
+                    args,
+                    normalization_prompt,
+                    schema_path,
+                    schema_yaml,
+                    invocation_path,
+                    output_path,
+                )
+                for invocation_path, output_path in jobs
+            )
+        )
+    finally:
+        await runtime.aclose()
+    return results.count(False)
+
+
+def normalize_offline(
+    args: argparse.Namespace,
+    normalization_prompt: str,
+    schema_path: Path,
+    schema_yaml: str,
+    jobs: List[Tuple[Path, Path]],
+) -> int:
+    """Run all jobs as one resumable batch job; return the number outstanding."""
+    requests: List[BatchRequest] = []
+    outputs: Dict[str, Tuple[Path, Path, Dict[str, Any], str]] = {}
+    failed = 0
+    for invocation_path, output_path in jobs:
+        prepared = prepare_request(
+            args, normalization_prompt, schema_path, schema_yaml, invocation_path
+        )
+        if prepared is None:
+            failed += 1
+            continue
+        request, timestamp = prepared
+        requests.append(
+            BatchRequest(invocation_path.name, request, [timestamp], [invocation_path])
+        )
+        outputs[invocation_path.name] = (
+            invocation_path,
+            output_path,
+            request,
+            timestamp,
+        )
+
+    def finish(custom_id: str, response: ChatCompletion) -> bool:
+        invocation_path, output_path, request, timestamp = outputs[custom_id]
+        name = f"Output for {invocation_path}"
+        try:
+            # A rejected batch result is repaired with direct calls
+            output = repaired(
+                lambda r: runtime.complete(
+                    r, masked=[timestamp], inputs=[invocation_path]
+                ),
+                request,
+                response,
+                lambda r: analysis_text(args, r, schema_yaml, name),
+                args.repair_retries,
+                name,
+            )
+        except ValueError as exc:
+            logging.error(str(exc))
+            return False
+        except Exception:
+            logging.exception(f"{invocation_path}: API call failed")
+            return False
+        return write_analysis(output_path, output)
+
+    runtime = ModelRuntime(args)
+    try:
+        failed += run_batch_job(args, runtime, requests, finish)
+    finally:
+        runtime.close()
+    return failed
+
+
+def normalize_invocations(
+    args: argparse.Namespace,
+    normalization_prompt: str,
+    schema_path: Path,
+    schema_yaml: str,
+) -> None:
+    if args.output:
+        sys.exit("--output is for a single --invocation; use --output-dir")
+    if args.concurrency < 1:
+        sys.exit("--concurrency must be at least 1")
+
+    output_dir = Path(args.output_dir)
+    invocations = expand_inputs(args.invocations)
+    jobs = [(p, output_path_for(p, output_dir)) for p in invocations]
+    if not args.force:
+        jobs = [(p, out) for p, out in jobs if not is_up_to_date(p, out)]
+    skipped = len(invocations) - len(jobs)
+
+    if args.dry_run and not args.batch:
+        print(
+            f"Dry run: Would normalize {len(jobs)} payloads "
+            f"({skipped} up to date) with concurrency {args.concurrency}"
+        )
+        for invocation_path, output_path in jobs:
+            print(f"  {invocation_path} -> {output_path}")
         return
 
-    # Basic structural check: ensure major sections from schema exist in data
-    # We skip 'schema' as it's metadata about the schema itself
-    expected_sections = [k for k in schema.keys() if k != "schema"]
-    missing_sections = [s for s in expected_sections if s not in data]
+    if not jobs:
+        logging.info(f"All {len(invocations)} analyses are up to date")
+        return
 
-    if missing_sections:
-        logging.warning(
-            f"Output is missing expected schema sections: {', '.join(missing_sections)}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if args.batch:
+        logging.info(
+            f"Normalizing {len(jobs)} payloads with model {args.model} "
+            f"as a batch job ({skipped} up to date)"
         )
-    else:
-        logging.debug("Output passed basic structural validation against schema")
+        failed = normalize_offline(
+            args, normalization_prompt, schema_path, schema_yaml, jobs
+        )
+        if failed:
+            sys.exit(f"{failed} payloads not normalized")
+        return
+
+    logging.info(
+        f"Normalizing {len(jobs)} payloads with model {args.model} "
+        f"(concurrency {args.concurrency}, {skipped} up to date)"
+    )
+    started = time.perf_counter()
+    failed = asyncio.run(
+        normalize_concurrently(
+            args, normalization_prompt, schema_path, schema_yaml, jobs
+        )
+    )
+    logging.info(
+        f"Normalized {len(jobs) - failed}/{len(jobs)} payloads "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    if failed:
+        sys.exit(f"{failed} payloads failed")
+
+
+# -------------------------
+# Main
+# -------------------------
 
 
 def main() -> None:
@@ -93,44 +517,57 @@ def main() -> None:
         "--prompt", required=True, help="Normalization prompt (Markdown)"
     )
     parser.add_argument("--schema", required=True, help="Normalization schema (YAML)")
-    parser.add_argument("--invocation", required=True, help="Invocation payload (JSON)")
-    parser.add_argument("--model", required=True, help="Model name (e.g. gpt-5.2)")
-    parser.add_argument(
-        "--seed", type=int, help="Seed for deterministic inference (optional)"
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--invocation", help="Invocation payload (JSON)")
+    inputs.add_argument(
+        "--invocations",
+        nargs="+",
+        help="Batch mode: invocation payloads or glob patterns (JSON)",
     )
+    add_model_arguments(parser)
     parser.add_argument(
         "--output", help="Output file path (optional, prints to stdout if omitted)"
     )
     parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Print the request that would be sent and exit without calling the API",
+        "--output-dir",
+        default="analysis",
+        help="Batch mode: directory for <payload>.analysis.yaml (default: analysis)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Batch mode: maximum concurrent model calls (default: {DEFAULT_CONCURRENCY})",
     )
     parser.add_argument(
-        "--verbose",
+        "--force",
         action="store_true",
-        help="Enable verbose logging for debugging",
+        help="Batch mode: also re-normalize payloads whose analysis is up to date",
     )
+    add_batch_arguments(parser)
+    add_stream_arguments(parser)
+    add_structured_arguments(parser)
     args = parser.parse_args()
+    if args.stream and args.batch:
+        parser.error("--stream cannot be combined with --batch")
 
-    # Configure logging
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logging.basicConfig(
-        level=log_level,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
+    setup_logging(args.verbose)
 
     prompt_path = Path(args.prompt)
     schema_path = Path(args.schema)
-    invocation_path = Path(args.invocation)
 
     normalization_prompt = read_text(prompt_path)
     schema_yaml = read_text(schema_path)
-    invocation_json = read_text(invocation_path)
 
     logging.debug(f"Read prompt from {prompt_path} ({len(normalization_prompt)} chars)")
     logging.debug(f"Read schema from {schema_path} ({len(schema_yaml)} chars)")
+
+    if args.invocations:
+        normalize_invocations(args, normalization_prompt, schema_path, schema_yaml)
+        return
+
+    invocation_path = Path(args.invocation)
+    invocation_json = read_text(invocation_path)
     logging.debug(
         f"Read invocation from {invocation_path} ({len(invocation_json)} chars)"
     )
@@ -143,56 +580,15 @@ def main() -> None:
         sys.exit(1)
 
     # Calculate capture metadata
-    file_stat = invocation_path.stat()
-    timestamp = datetime.fromtimestamp(file_stat.st_mtime, tz=timezone.utc).strftime(
-        "%Y-%m-%dT%H:%M:%SZ"
+    timestamp, metadata = capture_metadata(invocation_path, invocation_json)
+    messages = build_messages(
+        normalization_prompt,
+        schema_path,
+        schema_yaml,
+        invocation_path,
+        invocation_json,
+        metadata,
     )
-    artifact_hash = hashlib.sha256(invocation_json.encode("utf-8")).hexdigest()
-
-    capture_metadata: dict[str, str | dict[str, str]] = {
-        "method": "mitmproxy",
-        "timestamp": timestamp,
-        "environment": {
-            "os": platform.system(),
-            "arch": platform.machine(),
-            "runtime": f"Python {platform.python_version()}",
-        },
-        "artifact_hash": artifact_hash,
-    }
-
-    messages: list[ChatCompletionMessageParam] = [
-        {
-            "role": "system",
-            "content": normalization_prompt,
-        },
-        {
-            "role": "user",
-            "content": f"""## Normalization Schema ({schema_path.name})
-
-    ```yaml
-    {schema_yaml}
-    ```
-    """,
-        },
-        {
-            "role": "user",
-            "content": f"""## Capture Metadata
-
-    ```json
-    {json.dumps(capture_metadata, indent=2)}
-    ```
-    """,
-        },
-        {
-            "role": "user",
-            "content": f"""## Invocation Payload ({invocation_path.name})
-
-    ```json
-    {invocation_json}
-    ```
-    """,
-        },
-    ]
 
     # If dry-run, print the prepared request and exit without calling the API.
     if args.dry_run:
@@ -208,43 +604,57 @@ def main() -> None:
         print("\n--- Schema YAML ---")
         print(schema_yaml)
         print("\n--- Capture Metadata ---")
-        print(json.dumps(capture_metadata, indent=2))
+        print(json.dumps(metadata, indent=2))
         print("\n--- Invocation JSON ---")
         print(invocation_json)
         return
 
-    # Instantiate client only when making a real API call (avoids requiring OPENAI_API_KEY in --dry-run)
-    client = openai.OpenAI()
+    runtime = ModelRuntime(args)
+
+    def call(request: Dict[str, Any]) -> ChatCompletion:
+        if args.stream:
+            return runtime.stream(
+                request,
+                stream_guard(args, schema_yaml),
+                partial_path(Path(args.output)) if args.output else None,
+                masked=[timestamp],
+                retries=args.stream_retries,
+                inputs=[invocation_path],
+            )
+        return runtime.complete(
+            request,
+            # The payload mtime changes on touch without changing the capture
+            masked=[timestamp],
+            inputs=[invocation_path],
+        )
 
     logging.info(f"Calling model {args.model}...")
     try:
-        response = client.chat.completions.create(
-            model=args.model,
-            messages=messages,
-            # Temperature 0 is supported by all GPT-4 and GPT-5 models (except mini variants)
-            temperature=0,
-            seed=args.seed,
+        output = complete_repaired(
+            call,
+            completion_request(args, messages, schema_yaml),
+            lambda response: analysis_text(args, response, schema_yaml),
+            args.repair_retries,
         )
+    except StreamAbort:
+        sys.exit(f"Streamed output rejected on all {args.stream_retries + 1} attempts")
+    except ValueError:
+        logging.exception("Invalid model output")
+        sys.exit(1)
     except Exception:
         logging.exception("API call failed")
         sys.exit(1)
+    finally:
+        runtime.close()
 
-    # Print ONLY the model output
-    output = response.choices[0].message.content
-    if not output:
-        sys.exit("Model returned empty output")
-
-    logging.debug(f"Received response ({len(output)} chars)")
-
-    # Clean and validate output
-    output = clean_output(output)
-    validate_yaml(output, schema_yaml)
+    logging.debug(f"Received analysis ({len(output)} chars)")
 
     if args.output:
         output_path = Path(args.output)
         try:
             logging.debug(f"Writing output to {output_path}")
             output_path.write_text(output, encoding="utf-8")
+            partial_path(output_path).unlink(missing_ok=True)
             print(f"Analysis saved to {output_path}")
         except Exception:
             logging.exception(f"Failed to write output to {output_path}")
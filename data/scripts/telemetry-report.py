@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = []
+# ///
+"""
+telemetry-report.py
+
+Aggregate the per-call model telemetry (llm_telemetry.py) into a per-stage
+report, to see which pipeline stage dominates runtime and spend.
+
+For each stage (script) of one run (one `make all`, by default the latest
+run in the file): calls, response cache hits, errors and retries; p50/p95
+latency of the API calls (cache hits excluded); process wall time; prompt,
+cached and completion tokens; and cost when --prices is given. Stages are
+listed by wall time, largest first.
+
+--prices is a JSON file of USD per million tokens per model:
+
+  {"gpt-5.2": {"input": 1.25, "cached_input": 0.125, "output": 10.0}}
+
+Usage:
+  uv run --locked scripts/telemetry-report.py --input .telemetry/calls.jsonl
+  uv run --locked scripts/telemetry-report.py --run all --prices prices.json --format json
+"""
+
+import argparse
+import json
+import logging
+import math
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+API_OUTCOMES = {"ok", "error", "aborted"}
+
+
+def load_records(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        sys.exit(f"Telemetry file not found: {path}")
+    records = []
+    with path.open(encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                logging.warning(f"{path}:{n}: skipping malformed record")
+    return records
+
+
+def select_run(records: List[Dict[str, Any]], run: str) -> List[Dict[str, Any]]:
+    if run == "all":
+        return records
+    if run == "latest":
+        runs = [r.get("run") for r in records]
+        if not runs:
+            return []
+        # Records are appended in time order
+        run = runs[-1]
+    return [r for r in records if r.get("run") == run]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile (q in 0..100); None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lo, hi = math.floor(rank), math.ceil(rank)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
+
+
+def call_cost(
+    record: Dict[str, Any], prices: Dict[str, Dict[str, float]]
+) -> Optional[float]:
+    price = prices.get(record.get("model") or "")
+    if price is None:
+        return None
+    cached = record.get("cached_tokens") or 0
+    uncached = (record.get("prompt_tokens") or 0) - cached
+    return (
+        uncached * price.get("input", 0.0)
+        + cached * price.get("cached_input", price.get("input", 0.0))
+        + (record.get("completion_tokens") or 0) * price.get("output", 0.0)
+    ) / 1_000_000
+
+
+def summarize(
+    records: List[Dict[str, Any]], prices: Dict[str, Dict[str, float]]
+) -> List[Dict[str, Any]]:
+    stages: Dict[str, Dict[str, Any]] = defaultdict(
+        lambda: {
+            "calls": 0,
+            "api_calls": 0,
+            "cached": 0,
+            "errors": 0,
+            "aborted": 0,
+            "retries": 0,
+            "latencies": [],
+            "wall_s": 0.0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "cost": 0.0,
+            "unpriced": 0,
+        }
+    )
+    for record in records:
+        stage = stages[record.get("stage") or "unknown"]
+        if record.get("kind") == "process":
+            stage["wall_s"] += record.get("wall_s") or 0.0
+            continue
+        outcome = record.get("outcome")
+        stage["calls"] += 1
+        stage["cached"] += outcome == "cached"
+        stage["errors"] += outcome == "error"
+        stage["aborted"] += outcome == "aborted"
+        stage["retries"] += record.get("retries") or 0
+        for field in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            stage[field] += record.get(field) or 0
+        if outcome in API_OUTCOMES:
+            stage["api_calls"] += 1
+            if record.get("latency_s") is not None:
+                stage["latencies"].append(record["latency_s"])
+            cost = call_cost(record, prices)
+            if cost is None:
+                stage["unpriced"] += 1
+            else:
+                stage["cost"] += cost
+
+    rows = []
+    for name, stage in stages.items():
+        latencies = stage.pop("latencies")
+        rows.append(
+            {
+                "stage": name,
+                **stage,
+                "p50_latency_s": percentile(latencies, 50),
+                "p95_latency_s": percentile(latencies, 95),
+                "total_latency_s": sum(latencies),
+                "cost": stage["cost"] if not stage["unpriced"] else None,
+            }
+        )
+    rows.sort(key=lambda r: (r["wall_s"], r["total_latency_s"]), reverse=True)
+    return rows
+
+
+def fmt(value: Any, digits: int = 1) -> str:
+    if value is None:
+        return "n/a"
+    if isinstance(value, float):
+        return f"{value:.{digits}f}"
+    return str(value)
+
+
+def markdown(rows: List[Dict[str, Any]], run: str) -> str:
+    header = [
+        "stage",
+        "calls",
+        "api",
+        "cached",
+        "errors",
+        "retries",
+        "p50 s",
+        "p95 s",
+        "wall s",
+        "prompt tok",
+        "cached tok",
+        "completion tok",
+        "cost $",
+    ]
+    lines = [
+        f"# Model telemetry ({run})",
+        "",
+        "| " + " | ".join(header) + " |",
+        "|" + "---|" * len(header),
+    ]
+    total_wall = sum(r["wall_s"] for r in rows) or 1.0
+    for r in rows:
+        cells = [
+            r["stage"],
+            fmt(r["calls"]),
+            fmt(r["api_calls"]),
+            fmt(r["cached"]),
+            fmt(r["errors"] + r["aborted"]),
+            fmt(r["retries"]),
+            fmt(r["p50_latency_s"]),
+            fmt(r["p95_latency_s"]),
+            f"{r['wall_s']:.1f} ({r['wall_s'] / total_wall:.0%})",
+            fmt(r["prompt_tokens"]),
+            fmt(r["cached_tokens"]),
+            fmt(r["completion_tokens"]),
+            fmt(r["cost"], 2),
+        ]
+        lines.append("| " + " | ".join(cells) + " |")
+
+    costs = [r["cost"] for r in rows]
+    total_cost = sum(costs) if rows and None not in costs else None
+    lines += [
+        "",
+        f"Total: {sum(r['calls'] for r in rows)} calls "
+        f"({sum(r['api_calls'] for r in rows)} to the API), "
+        f"{sum(r['prompt_tokens'] for r in rows)} prompt tokens "
+        f"({sum(r['cached_tokens'] for r in rows)} cached), "
+        f"{sum(r['completion_tokens'] for r in rows)} completion tokens, "
+        f"{sum(r['wall_s'] for r in rows):.1f} s of stage wall time, "
+        f"cost ${fmt(total_cost, 2)}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Per-stage latency, token and cost report from model telemetry"
+    )
+    parser.add_argument(
+        "--input",
+        default=".telemetry/calls.jsonl",
+        help="Telemetry JSONL file (default: .telemetry/calls.jsonl)",
+    )
+    parser.add_argument(
+        "--run",
+        default="latest",
+        help="Run ID to report, 'latest' (default) or 'all'",
+    )
+    parser.add_argument(
+        "--prices",
+        help="JSON file of USD per million tokens per model (cost is n/a without it)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["markdown", "json"],
+        default="markdown",
+        help="Report format (default: markdown)",
+    )
+    parser.add_argument(
+        "--output",
+        help="Output file (prints to stdout if omitted)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    prices: Dict[str, Dict[str, float]] = {}
+    if args.prices:
+        try:
+            prices = json.loads(Path(args.prices).read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            logging.exception(f"Failed to read prices from {args.prices}")
+            sys.exit(1)
+
+    records = select_run(load_records(Path(args.input)), args.run)
+    if not records:
+        sys.exit(f"No telemetry records for run {args.run!r} in {args.input}")
+    run = args.run
+    if run == "latest":
+        run = records[-1].get("run") or "no run id"
+    rows = summarize(records, prices)
+
+    if args.format == "json":
+        report = json.dumps({"run": run, "stages": rows}, indent=2) + "\n"
+    else:
+        report = markdown(rows, run)
+
+    if args.output:
+        try:
+            Path(args.output).write_text(report, encoding="utf-8")
+            logging.info(f"Telemetry report written to {args.output}")
+        except Exception:
+            logging.exception("Failed to write output file")
+            sys.exit(1)
+    else:
+        print(report, end="")
+
+
+if __name__ == "__main__":
+    main()
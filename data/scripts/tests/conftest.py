@@ -0,0 +1,51 @@
+"""
+Shared fixtures for the tests of data/scripts.
+
+The scripts import their shared modules by bare name, so the scripts
+directory goes on sys.path; hyphenated scripts (prompt-similarity.py) are
+loaded by path with load_script().
+
+Run from data/:
+  python -m pytest -q scripts/tests
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+SCRIPTS = Path(__file__).resolve().parent.parent
+DATA = SCRIPTS.parent
+
+if str(SCRIPTS) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS))
+
+
+def load_script(filename: str) -> ModuleType:
+    """Import a script of this directory as a module (once per session)."""
+    name = filename.removesuffix(".py").replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, SCRIPTS / filename)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def analyses(tmp_path: Path) -> list[Path]:
+    """A scratch copy of the corpus's normalized analyses, in sorted order."""
+    target = tmp_path / "analysis"
+    target.mkdir()
+    paths = []
+    for source in sorted((DATA / "analysis").glob("*.analysis.yaml")):
+        path = target / source.name
+        path.write_bytes(source.read_bytes())
+        paths.append(path)
+    return paths
@@ -0,0 +1,87 @@
+"""Schema compilation, validation and JSON Schema (analysis_schema.py)."""
+
+from __future__ import annotations
+
+from analysis_schema import (ERROR, UNKNOWN, WARNING, compile_schema,
+                             json_schema, validate, validate_files)
+from conftest import DATA
+
+SCHEMA = """\
+schema:
+  name: system-prompt
+layers:
+  environment:
+    execution_context: string  # sandboxed | local | remote | none
+    notes: string  # e.g., free text
+    max_turns: integer
+  tools:
+    declared_tools:
+      - name: string
+        type: string  # builtin | mcp
+"""
+
+
+def issues(data):
+    return [(i.path, i.code, i.severity) for i in validate(compile_schema(SCHEMA), data)]
+
+
+def document(**environment):
+    return {
+        "schema": {"name": "system-prompt"},
+        "layers": {
+            "environment": {
+                "execution_context": "local",
+                "notes": "anything",
+                "max_turns": 3,
+                **environment,
+            },
+            "tools": {"declared_tools": [{"name": "shell", "type": "builtin"}]},
+        },
+    }
+
+
+def test_valid_document_and_unknown_leaves_pass():
+    assert issues(document()) == []
+    assert issues(document(execution_context=UNKNOWN, max_turns=UNKNOWN)) == []
+
+
+def test_leaf_drift_warns_and_skeleton_breaks_error():
+    data = document(execution_context="cloud", max_turns="3", extra=1)
+    assert issues(data) == [
+        ("layers.environment.execution_context", "enum", WARNING),
+        ("layers.environment.max_turns", "type", WARNING),
+        ("layers.environment.extra", "unknown", WARNING),
+    ]
+    data = document()
+    data["layers"]["tools"] = {"declared_tools": "shell"}
+    del data["layers"]["environment"]
+    assert issues(data) == [
+        ("layers.environment", "missing", ERROR),
+        ("layers.tools.declared_tools", "type", ERROR),
+    ]
+
+
+def test_json_schema_admits_unknown_in_every_leaf():
+    environment = json_schema(compile_schema(SCHEMA))["properties"]["layers"][
+        "properties"
+    ]["environment"]
+    assert environment["required"] == ["execution_context", "notes", "max_turns"]
+    assert environment["additionalProperties"] is False
+    fields = environment["properties"]
+    assert fields["execution_context"] == {
+        "type": "string",
+        "enum": ["local", "none", "remote", "sandboxed", UNKNOWN],
+    }
+    assert fields["notes"] == {"type": "string"}
+    assert fields["max_turns"] == {
+        "anyOf": [{"type": "integer"}, {"type": "string", "enum": [UNKNOWN]}]
+    }
+
+
+def test_corpus_has_no_schema_errors():
+    schema = (DATA / "schema" / "system-prompt.v0.yaml").read_text(encoding="utf-8")
+    paths = sorted((DATA / "analysis").glob("*.analysis.yaml"))
+    results = validate_files(paths, schema, workers=1)
+    assert [
+        (r.path.name, i.path) for r in results for i in r.issues if i.severity == ERROR
+    ] == []
@@ -0,0 +1,52 @@
+"""Union-find threshold sweep of the band report (band-report-from-csv.py)."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from conftest import load_script
+
+band_report = load_script("band-report-from-csv.py")
+
+
+def baseline_sizes(n: int, edges: list[tuple[int, int, float]], t: float) -> list[int]:
+    """Component sizes at one threshold by depth-first search."""
+    adjacency: dict[int, set[int]] = {k: set() for k in range(n)}
+    for a, b, score in edges:
+        if score >= t:
+            adjacency[a].add(b)
+            adjacency[b].add(a)
+    seen: set[int] = set()
+    sizes = []
+    for start in range(n):
+        if start in seen:
+            continue
+        stack, size = [start], 0
+        seen.add(start)
+        while stack:
+            node = stack.pop()
+            size += 1
+            for other in adjacency[node] - seen:
+                seen.add(other)
+                stack.append(other)
+        sizes.append(size)
+    return sorted(sizes, reverse=True)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_sweep_matches_per_threshold_search(seed: int):
+    rng = np.random.default_rng(seed)
+    n = 30
+    rows, cols = np.triu_indices(n, k=1)
+    keep = rng.random(len(rows)) < 0.15
+    rows, cols = rows[keep], cols[keep]
+    scores = np.round(rng.random(len(rows)), 2)
+    edges = list(zip(rows.tolist(), cols.tolist(), scores.tolist()))
+
+    thresholds = [round(t, 2) for t in np.arange(1.0, -0.01, -0.05)]
+    sweep = list(band_report.sweep_components(n, rows, cols, scores, thresholds))
+
+    assert [t for t, _, _ in sweep] == thresholds
+    for t, count, sizes in sweep:
+        expected = baseline_sizes(n, edges, t)
+        assert (count, sizes) == (len(expected), expected)
@@ -0,0 +1,38 @@
+"""Single-linkage dendrogram against the edge list it was built from."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from dendrogram import build_dendrogram, load_dendrogram, save_dendrogram
+from similarity_graph import SimilarityGraph, auto_threshold
+
+
+def edges(n: int, seed: int) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    rows, cols = np.triu_indices(n, k=1)
+    keep = rng.random(len(rows)) < 0.4
+    scores = np.round(rng.random(int(keep.sum())), 2)
+    return [f"d{k}" for k in range(n)], rows[keep], cols[keep], scores
+
+
+def components(graph: SimilarityGraph) -> list[list[int]]:
+    return sorted(sorted(c.tolist()) for c in graph.components())
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_clusters_and_auto_threshold_match_edges(seed: int, tmp_path: Path):
+    docs, rows, cols, scores = edges(20, seed)
+    path = tmp_path / "dendrogram.json"
+    save_dendrogram(build_dendrogram(docs, rows, cols, scores), path)
+    dendrogram = load_dendrogram(path)
+
+    assert dendrogram.auto_threshold == auto_threshold(scores.tolist())
+    for threshold in [dendrogram.auto_threshold, *np.unique(scores).tolist()]:
+        graph = SimilarityGraph.from_edges(docs, rows, cols, scores, threshold)
+        clusters = dendrogram.clusters_at(threshold).values()
+        assert sorted(sorted(docs.index(d) for d in c) for c in clusters) == (
+            components(graph)
+        )
@@ -0,0 +1,62 @@
+"""Family centroids and online assignment (family_centroids.py)."""
+
+from __future__ import annotations
+
+import pytest
+from analysis_loader import load_analyses
+from conftest import DATA
+from family_centroids import (CENTROID_MARGIN, NOVEL, Representatives,
+                              build_representatives)
+from similarity_core import document_features
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    paths = sorted((DATA / "analysis").glob("*.analysis.yaml"))
+    names = [p.name for p in paths]
+    features = [document_features(r.data) for r in load_analyses(paths)]
+    families = [
+        # A pairwise threshold no centroid score of a mixed family reaches
+        {
+            "family_id": "F1",
+            "family_label": "mixed",
+            "threshold": 0.99,
+            "members": names[:3],
+        },
+        {
+            "family_id": "F2",
+            "family_label": "single",
+            "threshold": 0.6,
+            "members": names[3:4],
+        },
+    ]
+    data = build_representatives(families, names, features)
+    return names, features, Representatives(data)
+
+
+def test_members_pass_their_multi_member_family_cutoff(corpus):
+    _, features, representatives = corpus
+    for k in range(3):
+        mixed = representatives.score(features[k])[0]
+        assert mixed.threshold < 0.99
+        assert mixed.weighted_score >= mixed.threshold
+
+
+def test_cutoffs_are_on_the_centroid_scale(corpus):
+    _, _, representatives = corpus
+    mixed, single = representatives.families
+    assert mixed["min_member_score"] < 1.0
+    assert representatives.cutoff(mixed) == pytest.approx(
+        mixed["min_member_score"] - CENTROID_MARGIN
+    )
+    # A one-member centroid is the member, so pairwise scores apply
+    assert single["min_member_score"] == 1.0
+    assert representatives.cutoff(single) == 0.6
+
+
+def test_unrelated_document_is_novel(corpus):
+    _, _, representatives = corpus
+    empty = {"paths": ["x"], "terms": {"zzz": 1}, "forbidden": ["y"]}
+    family_id, best = representatives.assign(empty)
+    assert family_id == NOVEL and best is not None
+    assert representatives.assign(empty, threshold=0.0)[0] == best.family_id
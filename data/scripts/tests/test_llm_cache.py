@@ -0,0 +1,131 @@
+"""Response cache keys (llm_cache.py)."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from conftest import DATA, SCRIPTS, load_script
+from llm_cache import request_key
+from llm_runtime import ModelRuntime, add_model_arguments
+from llm_stream import add_stream_arguments
+from openai.types.chat import ChatCompletion
+
+REQUEST = {
+    "model": "m",
+    "messages": [{"role": "user", "content": "hi"}],
+    "seed": 1,
+}
+
+
+def completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "c",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "m",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+        }
+    )
+
+
+def test_key_is_pinned():
+    # A change here invalidates every cached response: bump CACHE_VERSION
+    assert request_key(REQUEST) == (
+        "dfd65da559b1e2f948b178e7c811e2e9278d917c6c3c829366cf40a89c1e797f"
+    )
+
+
+def test_key_ignores_key_order_and_masked_values():
+    reordered = {"seed": 1, "messages": REQUEST["messages"], "model": "m"}
+    assert request_key(reordered) == request_key(REQUEST)
+
+    def stamped(mtime: str) -> dict:
+        content = f"captured {mtime}: hi"
+        return {**REQUEST, "messages": [{"role": "user", "content": content}]}
+
+    assert request_key(stamped("2026-01-01"), ["2026-01-01"]) == request_key(
+        stamped("2026-02-02"), ["2026-02-02"]
+    )
+    assert request_key(stamped("2026-01-01")) != request_key(stamped("2026-02-02"))
+
+
+def test_structured_request_key_is_stable_across_processes():
+    # Enum sets in the derived schema must not leak hash-seed order
+    code = (
+        "from pathlib import Path\n"
+        "from llm_cache import request_key\n"
+        "from llm_structured import analysis_schema, response_format\n"
+        "text = Path('schema/system-prompt.v0.yaml').read_text(encoding='utf-8')\n"
+        "schema = response_format('analysis', analysis_schema(text))\n"
+        "print(request_key({'model': 'm', 'response_format': schema}))\n"
+    )
+    keys = {
+        subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=DATA,
+            env={**os.environ, "PYTHONPATH": str(SCRIPTS), "PYTHONHASHSEED": seed},
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        for seed in ("1", "2", "3")
+    }
+    assert len(keys) == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_governance_extraction_hits_cache_after_payload_touch(tmp_path, stream):
+    extract = load_script("governance-primitive-extract.py")
+    parser = argparse.ArgumentParser()
+    add_model_arguments(parser)
+    add_stream_arguments(parser)
+    # Nothing listens on the base URL: a cache miss fails the call
+    args = parser.parse_args(
+        ["--model", "m", "--seed", "1", "--llm-cache", str(tmp_path / "cache")]
+        + ["--base-url", "http://127.0.0.1:9/v1", "--max-retries", "0"]
+        + (["--stream"] if stream else [])
+    )
+    payload = tmp_path / "assistant.mode.json"
+    payload.write_text('{"prompt": "hi"}', encoding="utf-8")
+    output = tmp_path / "out.json"
+
+    def request_for(mtime: int) -> tuple[dict, str]:
+        os.utime(payload, (mtime, mtime))
+        messages, captured_at = extract.build_messages(
+            "Extract.", payload, payload.read_text(encoding="utf-8")
+        )
+        assert captured_at in messages[1]["content"]
+        return extract.completion_request(args, messages, None), captured_at
+
+    runtime = ModelRuntime(args)
+    request, captured_at = request_for(1_700_000_000)
+    runtime.cache.store(
+        request_key(request, [captured_at]), request, completion("{}")
+    )
+    request, captured_at = request_for(1_800_000_000)
+    response = extract.call_model(
+        runtime, args, request, payload, output, captured_at
+    )
+    runtime.close()
+    assert response.choices[0].message.content == "{}"
+    assert runtime.cache.hits == 1
+
+
+def test_governance_reduction_request_has_no_wall_clock_time():
+    reduce = load_script("governance-primitives-reduce.py")
+    artifacts = [{"file": "a.json", "hash": "0" * 64, "primitives": []}]
+    messages = reduce.reduction_messages("Reduce.", artifacts)
+    assert "generated_at" not in json.dumps(messages)
+    assert messages == reduce.reduction_messages("Reduce.", artifacts)
@@ -0,0 +1,79 @@
+"""Incremental stream guards (llm_stream.py)."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+from llm_stream import (JsonObjectGuard, LineGuard, StreamAbort,
+                        TopLevelKeysGuard)
+
+SECTIONS = ["schema", "metadata", "layers"]
+
+
+def feed_chars(guard: LineGuard, text: str) -> int:
+    """Feed one character at a time; the number fed before an abort."""
+    for k, char in enumerate(text):
+        try:
+            guard.feed(char)
+        except StreamAbort:
+            return k + 1
+    guard.finish()
+    return len(text)
+
+
+def test_line_guard_is_abstract():
+    with pytest.raises(TypeError):
+        LineGuard()
+
+
+def test_json_guard_accepts_fenced_object_after_preamble():
+    document = json.dumps({"schema": {"a": [1, {"b": "}]"}]}, "layers": None})
+    text = f"Here is the analysis:\n```json\n{document}\n```\nDone.\n"
+    assert feed_chars(JsonObjectGuard(SECTIONS), text) == len(text)
+
+
+def test_json_guard_aborts_single_line_reply_mid_line():
+    text = json.dumps({"metadata": {"x": "y" * 200}, "schema": {}, "layers": {}})
+    fed = feed_chars(JsonObjectGuard(SECTIONS), text)
+    # At the closing quote of "schema", long before the reply ends
+    assert fed == text.index('"schema"') + len('"schema"')
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        ('{"schema": {}, "notes": 1}', "unknown top-level key 'notes'"),
+        ('{"schema": {}, "schema": {}}', "repeated top-level key 'schema'"),
+        ('{"schema": [}', "mismatched '}'"),
+        ('{"schema": {1: 2}}', "expected an object key"),
+        ("[1, 2]", "root is not a JSON object"),
+    ],
+)
+def test_json_guard_aborts(text: str, reason: str):
+    guard = JsonObjectGuard(SECTIONS)
+    with pytest.raises(StreamAbort, match=reason):
+        guard.feed(text)
+        guard.finish()
+
+
+def test_json_guard_reads_escaped_keys_and_nested_keys():
+    guard = JsonObjectGuard(["a\"b", "c"])
+    guard.feed('{"a\\"b": {"c": 1, "zzz": {"a\\"b": 2}}, "c": "\\"}"}')
+    guard.finish()
+    assert guard.keys is not None and guard.keys.seen == ['a"b', "c"]
+
+
+def test_json_guard_without_keys_checks_structure_only():
+    guard = JsonObjectGuard()
+    guard.feed('{"anything": [true, false, null, -1.5e3]}')
+    guard.finish()
+    with pytest.raises(StreamAbort, match="unexpected character"):
+        JsonObjectGuard().feed('{"a": @')
+
+
+def test_top_level_keys_guard_aborts_out_of_order_section():
+    guard = TopLevelKeysGuard(SECTIONS)
+    guard.feed("schema:\n  name: x\nlayers:\n")
+    with pytest.raises(StreamAbort, match="out of order"):
+        guard.feed("metadata:\n")
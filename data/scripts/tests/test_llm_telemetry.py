@@ -0,0 +1,49 @@
+"""Per-call and per-process telemetry records (llm_telemetry.py)."""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import DATA, SCRIPTS
+
+
+def test_failed_call_still_records_the_process(tmp_path):
+    # The stage's wall time is in its process record, written on close
+    payload = tmp_path / "assistant.mode.json"
+    payload.write_text('{"prompt": "hi"}', encoding="utf-8")
+    telemetry = tmp_path / "telemetry.jsonl"
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(SCRIPTS / "governance-primitive-extract.py"),
+            "--prompt",
+            str(DATA / "prompts" / "governance-primitive-extraction.prompt.md"),
+            "--payload",
+            str(payload),
+            "--output",
+            str(tmp_path / "out.json"),
+            "--model",
+            "m",
+            # Nothing listens here, so the call fails without retrying
+            "--base-url",
+            "http://127.0.0.1:9/v1",
+            "--max-retries",
+            "0",
+            "--telemetry",
+            str(telemetry),
+        ],
+        env={**os.environ, "OPENAI_API_KEY": "test", "LLM_TELEMETRY_RUN": "t"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1, result.stderr
+    records = [json.loads(line) for line in telemetry.read_text().splitlines()]
+    assert [(r["kind"], r.get("outcome")) for r in records] == [
+        ("call", "error"),
+        ("process", None),
+    ]
+    assert records[1]["stage"] == "governance-primitive-extract"
+    assert records[1]["calls"] == 1
@@ -0,0 +1,48 @@
+"""Incremental similarity runs against full runs (prompt-similarity.py)."""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+import yaml
+from conftest import SCRIPTS
+
+
+def similarity(paths: list[Path], *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, str(SCRIPTS / "prompt-similarity.py"), "--quiet"]
+        + [str(p) for p in paths]
+        + list(options),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def edit(path: Path) -> None:
+    data = yaml.safe_load(path.read_text(encoding="utf-8"))
+    data["layers"]["identity"]["role"] = "edited role for the incremental test"
+    path.write_text(yaml.safe_dump(data, sort_keys=False), encoding="utf-8")
+
+
+def test_incremental_run_matches_full_run(analyses: list[Path], tmp_path: Path):
+    cache = str(tmp_path / "cache")
+    incremental = tmp_path / "incremental.csv"
+    full = tmp_path / "full.csv"
+
+    similarity(analyses, "--cache", cache, "--csv", str(incremental))
+    # Rows of later documents would be emitted before rows of earlier ones
+    edit(analyses[3])
+    edit(analyses[7])
+    run = similarity(
+        analyses, "--cache", cache, "--csv", str(incremental), "--refit-ratio", "0.9"
+    )
+    assert "Incremental update: 2 new or changed" in run.stderr
+
+    # A different --csv rescores every pair with the same frozen IDF
+    run = similarity(analyses, "--cache", cache, "--csv", str(full))
+    assert "rescoring all pairs" in run.stderr
+
+    assert incremental.read_bytes() == full.read_bytes()
@@ -0,0 +1,69 @@
+"""Similarity kernels (similarity_core.py)."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from similarity_core import (PathVocabulary, bitset_jaccard_pairs,
+                             bitset_jaccard_rows, bitset_sizes, hash_items,
+                             incidence_matrix, jaccard, jaccard_pairs,
+                             jaccard_rows, lsh_family_pairs, pack_bitsets,
+                             popcount)
+
+
+def test_lsh_family_pairs_finds_pair_similar_in_one_small_family():
+    # Large, unrelated token sets; documents 2 and 5 share their small family
+    tokens = [hash_items(f"t{doc}-{k}" for k in range(300)) for doc in range(8)]
+    small = [hash_items(f"f{doc}-{k}" for k in range(4)) for doc in range(8)]
+    small[5] = small[2]
+
+    merged = [np.concatenate(pair) for pair in zip(tokens, small)]
+    i, j = lsh_family_pairs([merged], 128, 0.5)
+    assert (2, 5) not in set(zip(i.tolist(), j.tolist()))
+
+    i, j = lsh_family_pairs([tokens, small], 128, 0.5)
+    assert (2, 5) in set(zip(i.tolist(), j.tolist()))
+    assert np.all(i < j)
+    assert list(zip(i.tolist(), j.tolist())) == sorted(zip(i.tolist(), j.tolist()))
+
+
+def random_sets(seed: int, n: int = 25, universe: int = 150) -> list[set[str]]:
+    rng = np.random.default_rng(seed)
+    sets = [
+        {f"layers.p{k}" for k in rng.choice(universe, rng.integers(0, 60), False)}
+        for _ in range(n)
+    ]
+    sets[3] = set()  # empty sets score 1.0 with each other, 0.0 otherwise
+    sets[7] = set()
+    return sets
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_bitset_jaccard_matches_set_jaccard(seed: int):
+    sets = random_sets(seed)
+    vocab = PathVocabulary()
+    bits = pack_bitsets([vocab.add(sorted(s)) for s in sets], len(vocab))
+    sizes = bitset_sizes(bits)
+    expected = np.array([[jaccard(a, b) for b in sets] for a in sets])
+
+    rows = np.array([0, 3, 7, 24])
+    assert np.array_equal(bitset_jaccard_rows(bits, sizes, rows), expected[rows])
+    i, j = np.triu_indices(len(sets), k=1)
+    assert np.array_equal(bitset_jaccard_pairs(bits, sizes, i, j), expected[i, j])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incidence_jaccard_matches_set_jaccard(seed: int):
+    sets = random_sets(seed)
+    matrix = incidence_matrix(sets)
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    expected = np.array([[jaccard(a, b) for b in sets] for a in sets])
+
+    assert np.array_equal(jaccard_rows(matrix, sizes, slice(0, 10)), expected[:10])
+    i, j = np.triu_indices(len(sets), k=1)
+    assert np.array_equal(jaccard_pairs(matrix, sizes, i, j), expected[i, j])
+
+
+def test_popcount_matches_bin_count():
+    values = np.array([0, 1, 2**63, 2**64 - 1, 0x0F0F0F0F], dtype=np.uint64)
+    assert popcount(values).tolist() == [bin(int(v)).count("1") for v in values]
@@ -0,0 +1,63 @@
+"""Binary similarity matrix round trips (similarity_matrix.py)."""
+
+from __future__ import annotations
+
+import csv
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pytest
+from similarity_matrix import (METRICS, MatrixWriter, SimilarityMatrix,
+                               read_edges)
+
+
+@pytest.fixture
+def pair_files(tmp_path: Path) -> tuple[Path, Path]:
+    rng = np.random.default_rng(3)
+    docs = [f"doc{k}.analysis.yaml" for k in range(9)]
+    writer = MatrixWriter(docs)
+    csv_path = tmp_path / "similarities.csv"
+    with csv_path.open("w", encoding="utf-8", newline="") as f:
+        out = csv.DictWriter(f, fieldnames=["file_a", "file_b", *METRICS])
+        out.writeheader()
+        # Sparse, as with --min-score: some pairs are missing
+        for a, b in combinations(docs, 2):
+            if rng.random() < 0.3:
+                continue
+            row = {"file_a": a, "file_b": b}
+            row.update({m: round(float(rng.random()), 4) for m in METRICS})
+            out.writerow(row)
+            writer.add(row)
+    matrix_path = tmp_path / "similarities.simmat"
+    writer.write(matrix_path)
+    return csv_path, matrix_path
+
+
+def test_blocks_match_a_whole_read(pair_files):
+    _, matrix_path = pair_files
+    matrix = SimilarityMatrix(matrix_path)
+    rows, cols, scores = (np.concatenate(a) for a in zip(*matrix.blocks(size=5)))
+    assert np.array_equal(
+        rows, np.repeat(np.arange(matrix.n), np.diff(matrix.indptr))
+    )
+    assert np.array_equal(cols, matrix.indices)
+    assert np.array_equal(scores, matrix.scores())
+
+
+@pytest.mark.parametrize("threshold", [None, 0.0, 0.5, 0.9, 1.1])
+def test_matrix_edges_equal_csv_edges(pair_files, threshold):
+    csv_path, matrix_path = pair_files
+    csv_docs, *csv_edges = read_edges(csv_path, threshold)
+    docs, *edges = read_edges(matrix_path, threshold)
+
+    def keyed(docs, rows, cols, scores):
+        return sorted(
+            (docs[a], docs[b], s)
+            for a, b, s in zip(rows.tolist(), cols.tolist(), scores.tolist())
+        )
+
+    # Scores compare exactly: both are the CSV's 4-decimal values
+    assert keyed(docs, *edges) == keyed(csv_docs, *csv_edges)
+    if threshold is not None:
+        assert np.all(edges[2] >= threshold)
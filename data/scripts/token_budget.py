@@ -0,0 +1,67 @@
+"""
+token_budget.py
+
+Local prompt-size estimates, so a script can plan its requests to stay
+under a token budget without calling a tokenizer service or shipping a
+tokenizer's vocabulary.
+
+The estimate is deliberately conservative for planning: the larger of
+
+- word and punctuation pieces (each \\w+ run or symbol is at least one
+  BPE token), and
+- UTF-8 bytes / 4 (the usual bytes-per-token average for English prose,
+  YAML and CSV),
+
+plus a small per-message overhead for chat framing. It errs high rather
+than low, which is the safe side for a ceiling; --token-budget should
+still leave the model's context room for the response.
+
+Imported by the scripts in this directory; not intended to be run directly.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from typing import Callable, List, Mapping, Sequence, TypeVar
+
+BYTES_PER_TOKEN = 4
+
+# Role markers and separators the chat format adds around each message
+MESSAGE_OVERHEAD = 4
+
+PIECE = re.compile(r"\w+|[^\w\s]")
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+    pieces = sum(1 for _ in PIECE.finditer(text))
+    return max(pieces, math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN))
+
+
+def estimate_messages(messages: Sequence[Mapping[str, str]]) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def pack(items: Sequence[T], cost: Callable[[T], int], budget: int) -> List[List[T]]:
+    """
+    Split items, in order, into as few consecutive runs as possible whose
+    summed cost stays within budget. Raises ValueError if one item alone
+    exceeds it.
+    """
+    runs: List[List[T]] = []
+    current: List[T] = []
+    used = 0
+    for item in items:
+        size = cost(item)
+        if size > budget:
+            raise ValueError(f"item of ~{size} tokens exceeds the budget of {budget}")
+        if current and used + size > budget:
+            runs.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += size
+    if current:
+        runs.append(current)
+    return runs
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = ["PyYAML"]
+# ///
+"""
+validate-analyses.py
+
+Check normalized analyses against the full nested structure of the
+normalization schema (see analysis_schema.py): every section and field,
+leaf types, list shapes and the enums given in the schema's comments.
+
+Issues are reported per file with a machine-readable path
+(`layers.environment.execution_context`), a code (yaml, type, missing,
+null, enum, constant, unknown) and a severity. Errors break the mapping
+skeleton that similarity scoring reads; warnings are leaf drift. The exit
+status is 1 if any file has errors, or with --strict any warnings, so the
+script doubles as the Makefile's gate before prompt-similarity.py.
+
+The schema is compiled once; large file lists are checked in a process
+pool (--workers).
+
+Usage:
+  uv run --locked validate-analyses.py analysis/*.analysis.yaml --schema schema/system-prompt.v0.yaml
+  uv run --locked validate-analyses.py analysis/*.analysis.yaml --schema schema/system-prompt.v0.yaml --format json --output validation.json
+  uv run --locked validate-analyses.py analysis/*.analysis.yaml --schema schema/system-prompt.v0.yaml --strict --quiet
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+from analysis_schema import ERROR, WARNING, FileResult, validate_files
+
+
+def text_report(results: List[FileResult], quiet: bool) -> str:
+    """One `file: path: message [code]` line per issue (errors only if quiet)."""
+    lines = []
+    for result in results:
+        for issue in result.issues:
+            if quiet and issue.severity != ERROR:
+                continue
+            lines.append(
+                f"{result.path}: {issue.severity}: {issue.path or '(document)'}: "
+                f"{issue.message} [{issue.code}]"
+            )
+    return "".join(line + "\n" for line in lines)
+
+
+def json_report(results: List[FileResult]) -> str:
+    severities = Counter(i.severity for r in results for i in r.issues)
+    report = {
+        "files": len(results),
+        "invalid_files": sum(
+            any(i.severity == ERROR for i in r.issues) for r in results
+        ),
+        "errors": severities[ERROR],
+        "warnings": severities[WARNING],
+        "issues": [
+            {"file": str(r.path), **issue._asdict()}
+            for r in results
+            for issue in r.issues
+        ],
+    }
+    return json.dumps(report, indent=2, ensure_ascii=False) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Validate normalized analyses against the full schema"
+    )
+    parser.add_argument("files", nargs="+", help="Analysis YAML files")
+    parser.add_argument(
+        "--schema",
+        required=True,
+        help="Normalization schema YAML (e.g. schema/system-prompt.v0.yaml)",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Fail on warnings (enum drift, mistyped or missing leaves) as well",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="Report format (default: text)",
+    )
+    parser.add_argument(
+        "--output",
+        help="Output file (prints to stdout if omitted)",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Text format: list errors only; warnings are still counted",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Parallel worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print what would be done and exit",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+
+    paths = [Path(p) for p in args.files]
+    if args.dry_run:
+        print(f"Dry run: Would validate {len(paths)} files against {args.schema}")
+        if args.output:
+            print(f"Dry run: Would write output to {args.output}")
+        return
+
+    try:
+        schema_text = Path(args.schema).read_text(encoding="utf-8")
+    except OSError:
+        logging.exception(f"Failed to read schema {args.schema}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    try:
+        results = validate_files(paths, schema_text, args.workers)
+    except ValueError:
+        logging.exception(f"Invalid schema {args.schema}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    if args.format == "json":
+        report = json_report(results)
+    else:
+        report = text_report(results, args.quiet)
+
+    if args.output:
+        try:
+            Path(args.output).write_text(report, encoding="utf-8")
+            logging.info(f"Validation report written to {args.output}")
+        except Exception:
+            logging.exception("Failed to write output file")
+            sys.exit(1)
+    else:
+        print(report, end="")
+
+    severities = Counter(i.severity for r in results for i in r.issues)
+    invalid = sum(any(i.severity == ERROR for i in r.issues) for r in results)
+    logging.info(
+        f"Validated {len(results)} analyses in {elapsed:.2f}s: "
+        f"{severities[ERROR]} errors in {invalid} files, "
+        f"{severities[WARNING]} warnings"
+    )
+    if severities[ERROR] or (args.strict and severities[WARNING]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()